@@ -0,0 +1,75 @@
+"""
+Per-segment latency of the eager, TorchScript and ONNX Runtime inference backends.
+
+    python -m benchmarks.bench_backends --batch-sizes 1 16 --threads 1
+
+Exports a randomly initialised model with a random folded MinMax scaler (or
+--checkpoint) to a temporary directory with export_model.py's exporters, then
+times each backend on the same batches. Exits non-zero if a backend modifies
+the batch it is given.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+import torch
+from benchmarks.common import time_call
+from config_ai import MODEL
+from export_model import export_torchscript, export_onnx
+from services.model_architecture import CNN_LSTM_Architecture, InputScaler
+from services.prediction_pipeline import load_model_from_checkpoint
+from services.inference_backends import EagerBackend, TorchScriptBackend, OnnxRuntimeBackend
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    device = torch.device('cpu')
+    if args.checkpoint:
+        model = load_model_from_checkpoint(args.checkpoint, dict(MODEL, quantization='none'), device)
+    else:
+        torch.manual_seed(0)
+        model = CNN_LSTM_Architecture(num_classes=MODEL["num_classes"]).eval()
+        rng = np.random.RandomState(0)
+        model.input_scaler = InputScaler(rng.uniform(0.005, 0.02, MODEL["input_shape"]), rng.uniform(0.5, 1.5, MODEL["input_shape"]))
+
+    out_dir = tempfile.mkdtemp(prefix='bench_backends_')
+    example = torch.rand((2,) + tuple(MODEL["input_shape"]))
+    export_torchscript(model, example, os.path.join(out_dir, 'model.ts.pt'))
+    export_onnx(model, example, os.path.join(out_dir, 'model.onnx'), opset=17)
+    scales_input = model.input_scaler is not None
+    backends = {
+        'eager': EagerBackend(model, device),
+        'torchscript': TorchScriptBackend(os.path.join(out_dir, 'model.ts.pt'), device, scales_input),
+        'onnxruntime': OnnxRuntimeBackend(os.path.join(out_dir, 'model.onnx'), scales_input, intra_op_threads=args.threads),
+    }
+
+    print(f"{'backend':>12} {'batch':>6} {'ms/segment':>11} {'speedup':>8} {'max|dp|':>9}")
+    modified = []
+    for batch_size in args.batch_sizes:
+        batch = np.random.RandomState(batch_size).rand(batch_size, *MODEL["input_shape"]).astype(np.float32) * -80.0
+        original = batch.copy()
+        baseline, reference = None, None
+        for name, backend in backends.items():
+            backend.predict_proba(batch)  # Warm-up (TorchScript profiles its first runs)
+            seconds, probabilities = time_call(backend.predict_proba, batch, repeats=args.repeats)
+            if not np.array_equal(batch, original):
+                modified.append(name)
+                batch[:] = original
+            baseline = baseline or seconds
+            reference = probabilities if reference is None else reference
+            print(f"{name:>12} {batch_size:>6} {seconds / batch_size * 1000:>11.2f} {baseline / seconds:>7.2f}x "
+                  f"{np.max(np.abs(probabilities - reference)):>9.2e}")
+    if modified:
+        print(f"Input check FAILED: {', '.join(sorted(set(modified)))} modified the batch passed to predict_proba")
+        sys.exit(1)
+    print("Input check passed.")
+
+if __name__ == '__main__':
+    main()
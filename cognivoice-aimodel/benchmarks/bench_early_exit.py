@@ -0,0 +1,103 @@
+"""
+Accuracy versus compute saved for early-exit sequential voting (SequentialVote)
+over a reference set of recordings, at several confidence/indifference settings.
+
+By default the reference set is synthetic: per-recording dementia-vote rates
+around each class (some close to 0.5) and time-correlated segment
+probabilities. With --reference, every audio file under
+<DIR>/<class name>/ (already preprocessed, e.g. the *_final.wav of a DEBUG run)
+is scored with the configured model instead.
+
+    python -m benchmarks.bench_early_exit --recordings 500
+    python -m benchmarks.bench_early_exit --reference data/reference
+"""
+import os
+import argparse
+import numpy as np
+from config_ai import MODEL, FEATURES, DEVICE
+from services.early_exit import SequentialVote
+
+def synthetic_reference_set(n_recordings, seed=0, min_segments=20, max_segments=500, correlation=0.8):
+    """[(segment probabilities, label)]: label-dependent vote rate, AR(1) noise along the recording."""
+    rng = np.random.RandomState(seed)
+    recordings = []
+    for _ in range(n_recordings):
+        label = rng.randint(2)
+        rate = rng.beta(7, 3) if label == 1 else rng.beta(3, 7)
+        n = rng.randint(min_segments, max_segments + 1)
+        noise = np.empty(n)
+        noise[0] = rng.randn()
+        for t in range(1, n):
+            noise[t] = correlation * noise[t - 1] + np.sqrt(1 - correlation ** 2) * rng.randn()
+        logit = np.log(rate / (1 - rate)) + 1.5 * noise
+        recordings.append(((1 / (1 + np.exp(-logit))).astype(np.float32), label))
+    return recordings
+
+def scored_reference_set(reference_dir):
+    import joblib
+    from services.prediction_pipeline import load_predictor, process_audio_to_logmel_segments, predict_segment_probabilities
+    scaler = joblib.load(MODEL["scaler_path"]) if os.path.exists(MODEL["scaler_path"]) else None
+    predictor = load_predictor(MODEL, DEVICE, scaler=scaler)
+    recordings = []
+    for label, class_name in enumerate(MODEL["class_names"]):
+        class_dir = os.path.join(reference_dir, class_name)
+        for name in sorted(os.listdir(class_dir)) if os.path.isdir(class_dir) else []:
+            segments = process_audio_to_logmel_segments(os.path.join(class_dir, name), FEATURES)
+            if segments is not None:
+                recordings.append((predict_segment_probabilities(segments, predictor, scaler, MODEL, DEVICE), label))
+    return recordings
+
+def majority(probabilities):
+    """The pipeline's vote: Counter.most_common breaks ties by first occurrence."""
+    votes = probabilities > 0.5
+    dementia = 2 * np.count_nonzero(votes)
+    return int(votes[0]) if dementia == len(votes) else int(dementia > len(votes))
+
+def early_vote(probabilities, rule, batch_size, order=None):
+    """
+    (vote, segments scored) when scoring in `order` (the rule's scoring_order by
+    default) and checking `rule` after every batch, as predict_until_settled does.
+    """
+    n_total = len(probabilities)
+    order = rule.scoring_order(n_total) if order is None else order
+    n = n_total
+    for end in range(batch_size, n_total + batch_size, batch_size):
+        if rule.should_stop(probabilities[order[:min(end, n_total)]], n_total):
+            n = min(end, n_total)
+            break
+    # The pipeline votes over the scored segments in time order
+    return majority(probabilities[np.sort(order[:n])]), n
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reference', default=None, help='Directory with one sub-directory of recordings per class name')
+    parser.add_argument('--recordings', type=int, default=500, help='Size of the synthetic reference set')
+    parser.add_argument('--confidence', type=float, nargs='+', default=[0.9, 0.95, 0.99])
+    parser.add_argument('--indifference', type=float, nargs='+', default=[0.1, 0.15, 0.2])
+    parser.add_argument('--min-segments', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=MODEL.get("inference_batch_size", 16))
+    parser.add_argument('--time-order', action='store_true', help='Also show scoring in time order, for comparison')
+    args = parser.parse_args()
+
+    recordings = scored_reference_set(args.reference) if args.reference else synthetic_reference_set(args.recordings)
+    total_segments = sum(len(p) for p, _ in recordings)
+    full_votes = [majority(p) for p, _ in recordings]
+    full_accuracy = np.mean([vote == label for vote, (_, label) in zip(full_votes, recordings)])
+    print(f"{len(recordings)} recordings, {total_segments} segments; full-vote accuracy {full_accuracy:.3f}")
+    print(f"{'order':>8} {'confidence':>10} {'indiff':>7} {'lead':>5} {'agreement':>10} {'accuracy':>9} {'scored':>7} {'saved':>7}")
+    for order_name in ('shuffled', 'time') if args.time_order else ('shuffled',):
+        for confidence in args.confidence:
+            for indifference in args.indifference:
+                rule = SequentialVote(confidence, indifference, args.min_segments)
+                scored, agree, correct = 0, 0, 0
+                for (probabilities, label), full_vote in zip(recordings, full_votes):
+                    order = np.arange(len(probabilities)) if order_name == 'time' else None
+                    vote, n = early_vote(probabilities, rule, args.batch_size, order)
+                    scored += n
+                    agree += vote == full_vote
+                    correct += vote == label
+                print(f"{order_name:>8} {confidence:>10.2f} {indifference:>7.2f} {rule.lead_to_stop:>5} {agree / len(recordings):>10.3f} "
+                      f"{correct / len(recordings):>9.3f} {scored / total_segments:>7.1%} {1 - scored / total_segments:>7.1%}")
+
+if __name__ == '__main__':
+    main()
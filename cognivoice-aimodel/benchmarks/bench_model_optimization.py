@@ -0,0 +1,52 @@
+"""
+Latency and equivalence of the inference-optimized model (BN folding, single-step
+LSTM, channels-last) against the original CNN_LSTM_Architecture.
+
+    python -m benchmarks.bench_model_optimization --batch-size 16 --threads 1
+"""
+import argparse
+import torch
+from benchmarks.common import time_call
+from config_ai import MODEL
+from services.model_architecture import CNN_LSTM_Architecture
+from services.prediction_pipeline import load_model_from_checkpoint
+from services.model_optimization import optimize_for_inference, max_output_difference
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint to load (default: random weights, random BN statistics)')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    if args.checkpoint:
+        model = load_model_from_checkpoint(args.checkpoint, dict(MODEL, optimize_graph=False, quantization='none'), torch.device('cpu'))
+    else:
+        torch.manual_seed(0)
+        model = CNN_LSTM_Architecture(num_classes=MODEL["num_classes"]).eval()
+        # Non-trivial statistics so folding is actually exercised
+        for module in model.modules():
+            if isinstance(module, (torch.nn.BatchNorm1d, torch.nn.BatchNorm2d)):
+                module.running_mean.uniform_(-1, 1)
+                module.running_var.uniform_(0.5, 2)
+
+    variants = {
+        'original': model,
+        'folded': optimize_for_inference(model, channels_last=False),
+        'folded+nhwc': optimize_for_inference(model, channels_last=True),
+    }
+    x = torch.rand((args.batch_size,) + tuple(MODEL["input_shape"])) * -80.0
+    print(f"{'variant':>12} {'ms/segment':>11} {'speedup':>8} {'max|dp|':>9}")
+    baseline = None
+    for name, variant in variants.items():
+        with torch.no_grad():
+            variant(x.clone())
+            seconds, _ = time_call(lambda: variant(x.clone()), repeats=args.repeats)
+        baseline = baseline or seconds
+        difference = max_output_difference(model, variant, MODEL["input_shape"])
+        print(f"{name:>12} {seconds / args.batch_size * 1000:>11.2f} {baseline / seconds:>7.2f}x {difference:>9.2e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Reproducible per-function benchmarks of the AI pipeline on deterministic
+synthetic recordings (44.1 kHz WAV fixtures, written once into --fixtures and
+reused), with JSON baselines and a regression check.
+
+    python -m benchmarks.bench_pipeline --skip-demucs --save baseline.json
+    python -m benchmarks.bench_pipeline --skip-demucs --compare baseline.json --threshold 0.15
+
+Benchmarked per fixture duration (default 30 s, 5 min and 60 min):
+  denoise             Preprocessor.denoise_waveform (Demucs; needs the model weights, skip with --skip-demucs)
+  remove_silence      Preprocessor.remove_silence_waveform
+  normalize           Preprocessor.normalize_waveform
+  logmel_segments     process_audio_to_logmel_segments (from the WAV file; the whole-recording path, ~5 GB at 60 min)
+  speech_features     calculate_speech_features_from_audio (from the WAV file)
+  predict_from_audio  the whole prediction path with a randomly initialized (seeded) CNN_LSTM_Architecture;
+                      fixtures of FEATURES["streaming_min_duration_s"] and longer take the streaming path
+  save_visualization  the PNG render of an already computed spectrogram
+
+The preprocessing steps run on the decoded waveform, as the in-memory pipeline
+does; their file variants only add a decode and a WAV write. Each number is the
+best of --repeats runs. Baselines are only comparable on the same machine and
+thread count; --compare warns when the recorded environment differs, and exits
+non-zero when any benchmark is slower than the baseline by more than
+--threshold (and by more than --min-seconds).
+
+    python -m benchmarks.bench_pipeline --memory --durations 60 600 3600
+
+--memory instead runs one whole job per fixture duration and --modes entry,
+each in a fresh process, and reports its peak RSS above the loaded models and
+the peak RSS of each stage. `thread` is the in-memory job path; `process` is
+what a FeatureExtractionPool worker runs, plus inference on the segments it
+returns. With --skip-demucs the mix passes through the denoise stage, so
+Demucs' own memory is not included.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import torch
+from benchmarks.common import write_long_wav, time_call
+from config_ai import MODEL, FEATURES, PREPROCESSING, DEVICE, HF_AUTH_TOKEN
+from services.model_architecture import CNN_LSTM_Architecture
+from services.model_optimization import build_inference_model
+from services.inference_backends import EagerBackend
+from services.preprocessing_pipeline import Preprocessor
+from services.prediction_pipeline import process_audio_to_logmel_segments, predict_from_audio, save_visualization
+from services.analysis_service_ai import calculate_speech_features_from_audio
+from services.spectral_features import SpectralFeatures
+from services.process_pool import extract_features
+from services.prediction_pipeline import predict_from_segments
+from services.instrumentation import StageTrace, tracing
+from services.resource_usage import peak_rss_mb
+
+FIXTURE_SR = 44100
+BENCHMARKS = ('denoise', 'remove_silence', 'normalize', 'logmel_segments', 'speech_features', 'predict_from_audio',
+              'save_visualization')
+
+class SkippedDenoiser:
+    """Stands in for DemucsDenoiser with --skip-demucs, so the Preprocessor is built without loading (or downloading) Demucs."""
+    samplerate = FIXTURE_SR
+
+    def separate_vocals(self, y, sr):
+        raise RuntimeError("Demucs is skipped in this run")
+
+class PassThroughDenoiser:
+    """Stands in for DemucsDenoiser in --memory runs with --skip-demucs: the mix is returned as the vocals."""
+    samplerate = FIXTURE_SR
+
+    def separate_vocals(self, y, sr):
+        return np.atleast_2d(y)
+
+def fixture_path(fixtures_dir, duration_s):
+    """The synthetic recording of `duration_s`, written on first use."""
+    path = os.path.join(fixtures_dir, f'speech_{duration_s:g}s_{FIXTURE_SR}.wav')
+    if not os.path.exists(path):
+        print(f"Writing fixture {path}")
+        partial = path[:-len('.wav')] + '.partial.wav'
+        write_long_wav(partial, duration_s, sr=FIXTURE_SR)
+        os.replace(partial, path)
+    return path
+
+def random_predictor():
+    """The service's eager predictor with seeded random weights instead of the checkpoint."""
+    torch.manual_seed(0)
+    model = CNN_LSTM_Architecture(num_classes=MODEL["num_classes"]).to(DEVICE).eval()
+    if MODEL.get("optimize_graph", False):
+        model = build_inference_model(model, MODEL["input_shape"], channels_last=MODEL.get("channels_last", True))
+    return EagerBackend(model, DEVICE)
+
+def fixture_benchmarks(path, preprocessor, predictor, out_dir, skip_demucs):
+    """`(name, zero-argument callable)` for each benchmark on one fixture."""
+    y, sr = preprocessor.load_audio(path)
+    # Computed here, so save_visualization times only the render; the STFT behind it is not kept
+    spectral = SpectralFeatures.from_audio(path, FEATURES)
+    spectral = SpectralFeatures.for_visualization(spectral.spectrogram_db, spectral.sr, spectral.hop_length)
+    predictions = (np.arange(max(1, spectral.spectrogram_db.shape[1] // FEATURES['segment_length'])) % 3 == 0).astype(int).tolist()
+    file_name = os.path.basename(path)
+    benchmarks = {
+        'denoise': lambda: preprocessor.denoise_waveform(y, sr),
+        'remove_silence': lambda: preprocessor.remove_silence_waveform(y, sr),
+        'normalize': lambda: preprocessor.normalize_waveform(y, sr),
+        'logmel_segments': lambda: process_audio_to_logmel_segments(path, FEATURES),
+        'speech_features': lambda: calculate_speech_features_from_audio(path),
+        'predict_from_audio': lambda: predict_from_audio(path, predictor, None, MODEL, FEATURES, out_dir, DEVICE,
+                                                         file_name=file_name),
+        'save_visualization': lambda: save_visualization(spectral, predictions, 0, out_dir, FEATURES, file_name=file_name),
+    }
+    return [(name, benchmarks[name]) for name in BENCHMARKS if not (skip_demucs and name == 'denoise')]
+
+def environment(threads):
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'device': str(DEVICE),
+        'torch_threads': threads,
+    }
+
+def run(args):
+    torch.set_num_threads(args.threads)
+    os.makedirs(args.fixtures, exist_ok=True)
+    out_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    denoiser = SkippedDenoiser() if args.skip_demucs else None
+    preprocessor = Preprocessor(HF_AUTH_TOKEN, DEVICE, dict(PREPROCESSING, diarization_enabled=False), denoiser=denoiser)
+    predictor = random_predictor()
+
+    results = {}
+    print(f"{'benchmark':>28} {'seconds':>9}")
+    for duration in args.durations:
+        path = fixture_path(args.fixtures, duration)
+        for name, fn in fixture_benchmarks(path, preprocessor, predictor, out_dir, args.skip_demucs):
+            if args.only and name not in args.only:
+                continue
+            key = f'{name}/{duration:g}s'
+            seconds, _ = time_call(fn, repeats=args.repeats)
+            results[key] = {'seconds': seconds}
+            print(f"{key:>28} {seconds:>9.4f}")
+    return {
+        'environment': environment(args.threads),
+        'settings': {'durations': args.durations, 'repeats': args.repeats, 'skip_demucs': args.skip_demucs,
+                     'fixture_sr': FIXTURE_SR},
+        'results': results,
+    }
+
+def measure_memory(mode, path, skip_demucs):
+    """Peak RSS of one job on `path` in this (fresh) process; `mode` is 'thread' or 'process'."""
+    denoiser = PassThroughDenoiser() if skip_demucs else None
+    preprocessor = Preprocessor(HF_AUTH_TOKEN, DEVICE, dict(PREPROCESSING, diarization_enabled=False), denoiser=denoiser)
+    predictor = random_predictor()
+    out_dir = tempfile.mkdtemp(prefix='bench_pipeline_memory_')
+    file_name = os.path.basename(path)
+    baseline = peak_rss_mb()
+    trace = StageTrace()
+    segments_mb = None
+    with tracing(trace):
+        if mode == 'process':
+            extracted = extract_features(preprocessor, path, FEATURES)
+            segments_mb = extracted['segments'].nbytes / (1024 * 1024)
+            predict_from_segments(extracted['segments'], extracted['visualization'], predictor, None, MODEL, FEATURES, out_dir,
+                                  DEVICE, file_name)
+        else:
+            raw_audio = preprocessor.load_audio(path)
+            clean_audio = preprocessor.run_full_pipeline_in_memory(*raw_audio)
+            calculate_speech_features_from_audio(raw_audio)
+            predict_from_audio(clean_audio, predictor, None, MODEL, FEATURES, out_dir, DEVICE, file_name=file_name)
+    return {
+        'baseline_rss_mb': baseline,
+        'peak_rss_delta_mb': peak_rss_mb() - baseline,
+        'segments_mb': segments_mb,
+        'stages': {record['stage']: record['peak_rss_mb'] - baseline for record in trace.records()},
+    }
+
+def run_memory(args):
+    """Runs measure_memory in a fresh process per duration and mode, so peak RSS is not shared between them."""
+    os.makedirs(args.fixtures, exist_ok=True)
+    stages = ('denoise', 'silence_removal', 'normalize', 'speech_features', 'logmel', 'inference')
+    print(f"{'duration_s':>10} {'mode':>7} {'peak_mb':>8} {'segments_mb':>12} " + ' '.join(f'{name:>15}' for name in stages))
+    results = {}
+    for duration in args.durations:
+        path = fixture_path(args.fixtures, duration)
+        for mode in args.modes:
+            command = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--memory-child', mode, path]
+            if args.skip_demucs:
+                command.append('--skip-demucs')
+            out = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = results[f'{mode}/{duration:g}s'] = json.loads(out.strip().splitlines()[-1])
+            segments_mb = '-' if result['segments_mb'] is None else f"{result['segments_mb']:.0f}"
+            per_stage = ' '.join(f"{result['stages'].get(name, float('nan')):>15.0f}" for name in stages)
+            print(f"{duration:>10g} {mode:>7} {result['peak_rss_delta_mb']:>8.0f} {segments_mb:>12} {per_stage}")
+    print("MiB above the RSS with the models loaded; per-stage columns are the highest RSS sampled while the stage ran.")
+    return {'environment': environment(args.threads), 'settings': {'durations': args.durations, 'skip_demucs': args.skip_demucs},
+            'memory': results}
+
+def compare(current, baseline, threshold, min_seconds):
+    """Prints current vs baseline per benchmark and returns the names of the regressions."""
+    for key, value in baseline['environment'].items():
+        if current['environment'].get(key) != value:
+            print(f"Warning: {key} differs from the baseline ({current['environment'].get(key)} vs {value})")
+    regressions = []
+    print(f"\n{'benchmark':>28} {'baseline_s':>11} {'current_s':>10} {'change':>8}")
+    for key, result in current['results'].items():
+        if key not in baseline['results']:
+            print(f"{key:>28} {'-':>11} {result['seconds']:>10.4f} {'new':>8}")
+            continue
+        before, after = baseline['results'][key]['seconds'], result['seconds']
+        change = after / before - 1 if before > 0 else 0.0
+        regressed = change > threshold and after - before > min_seconds
+        if regressed:
+            regressions.append(key)
+        print(f"{key:>28} {before:>11.4f} {after:>10.4f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    for key in [key for key in baseline['results'] if key not in current['results']]:
+        print(f"{key:>28} not run (in the baseline only)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--durations', type=float, nargs='+', default=[30, 300, 3600], help='Fixture lengths in seconds')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='Run only these benchmarks')
+    parser.add_argument('--skip-demucs', action='store_true', help='Do not load Demucs or benchmark denoising (runs offline)')
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'cognivoice_bench_fixtures'),
+                        help='Directory the synthetic WAV fixtures are written to and reused from')
+    parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='JSON baseline to check the results against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Allowed slowdown as a fraction of the baseline')
+    parser.add_argument('--min-seconds', type=float, default=0.005, help='Slowdowns below this are treated as noise')
+    parser.add_argument('--memory', action='store_true', help='Measure peak RSS of whole jobs instead of timing functions')
+    parser.add_argument('--modes', nargs='+', choices=('thread', 'process'), default=['thread', 'process'],
+                        help='Execution modes measured by --memory')
+    parser.add_argument('--memory-child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    # Only the benchmark table goes to stdout
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.memory_child:
+        torch.set_num_threads(args.threads)
+        print(json.dumps(measure_memory(*args.memory_child, args.skip_demucs)))
+        return
+    if args.memory:
+        current = run_memory(args)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"Results written to {args.save}")
+        return
+
+    current = run(args)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline written to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
+
+if __name__ == '__main__':
+    main()
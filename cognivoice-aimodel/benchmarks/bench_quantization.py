@@ -0,0 +1,120 @@
+"""
+Accuracy parity, latency and memory of the fp32 model vs the int8 quantization modes.
+
+    python -m benchmarks.bench_quantization --modes none dynamic static
+
+Parity is measured on a reference set of log-mel segments: `--reference` (an .npy
+of unscaled segments, as in MODEL["calibration_path"]) or, by default, segments
+of synthetic recordings. Each mode runs in its own process so peak RSS growth
+(model load, calibration and inference) is comparable.
+"""
+import io
+import argparse
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from benchmarks.common import synthetic_speech, time_call
+
+def reference_set(reference_path, n_recordings, duration_s, seed_offset=0):
+    """Returns (segments, recording index of each segment)."""
+    from config_ai import FEATURES
+    from services.spectral_features import SpectralFeatures
+    from services.prediction_pipeline import process_audio_to_logmel_segments
+
+    if reference_path:
+        segments = np.load(reference_path).astype(np.float32)
+        # No recording boundaries in a flat segment file: treat it as one recording
+        return segments, np.zeros(len(segments), dtype=np.int64)
+    all_segments, owners = [], []
+    for i in range(n_recordings):
+        y = synthetic_speech(duration_s, FEATURES['sample_rate'], seed=seed_offset + i)
+        segments = process_audio_to_logmel_segments(SpectralFeatures(y, FEATURES['sample_rate']), FEATURES)
+        all_segments.append(segments)
+        owners.extend([i] * len(segments))
+    return np.concatenate(all_segments).astype(np.float32), np.asarray(owners)
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _run_mode(mode, args):
+    import torch
+    from config_ai import MODEL
+    from services.model_architecture import CNN_LSTM_Architecture
+    from services.prediction_pipeline import load_model_from_checkpoint, predict_segment_probabilities
+    from services.quantization import quantize_model, load_calibration_segments
+
+    torch.set_num_threads(args.threads)
+    device = torch.device('cpu')
+    segments, _ = reference_set(args.reference, args.recordings, args.duration)
+    calibration = None
+    if mode != 'none':
+        calibration = load_calibration_segments(MODEL["calibration_path"])
+        if calibration is None:
+            # Calibrate on recordings disjoint from the reference set
+            calibration, _ = reference_set(None, 4, args.duration, seed_offset=1000)
+    rss_before = _max_rss_mb()
+
+    model_config = dict(MODEL, quantization='none', inference_batch_size=args.batch_size)
+    if args.checkpoint:
+        model = load_model_from_checkpoint(args.checkpoint, model_config, device)
+    else:
+        torch.manual_seed(0)
+        model = CNN_LSTM_Architecture(num_classes=MODEL["num_classes"]).eval()
+    if mode != 'none':
+        model = quantize_model(model, mode, device, calibration)
+
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    original = segments.copy()
+    seconds, probabilities = time_call(
+        predict_segment_probabilities, segments, model, None, model_config, device, repeats=args.repeats
+    )
+    # Every repeat and mode must score the same unscaled input
+    if not np.array_equal(segments, original):
+        raise RuntimeError(f"predict_segment_probabilities modified its input segments ({mode})")
+    return {
+        'probabilities': probabilities,
+        'seconds': seconds,
+        'segments': len(segments),
+        'weights_mb': buffer.tell() / 1024 / 1024,
+        'rss_growth_mb': _max_rss_mb() - rss_before,
+    }
+
+def _votes(probabilities, owners):
+    predictions = probabilities > 0.5
+    return np.array([np.mean(predictions[owners == i]) > 0.5 for i in np.unique(owners)])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['none', 'dynamic', 'static'])
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint to load (default: randomly initialised weights)')
+    parser.add_argument('--reference', default=None, help='.npy of unscaled log-mel segments')
+    parser.add_argument('--recordings', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    modes = ['none'] + [m for m in args.modes if m != 'none']
+    results = {}
+    for mode in modes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results[mode] = executor.submit(_run_mode, mode, args).result()
+
+    _, owners = reference_set(args.reference, args.recordings, args.duration)
+    reference = results['none']['probabilities']
+    print(f"{'mode':>8} {'ms/segment':>10} {'speedup':>8} {'weights_mb':>10} {'rss_mb':>7} "
+          f"{'max|dp|':>8} {'mean|dp|':>9} {'seg_agree':>9} {'vote_agree':>10}")
+    for mode in modes:
+        r = results[mode]
+        diff = np.abs(r['probabilities'] - reference)
+        seg_agree = np.mean((r['probabilities'] > 0.5) == (reference > 0.5))
+        vote_agree = np.mean(_votes(r['probabilities'], owners) == _votes(reference, owners))
+        print(f"{mode:>8} {r['seconds'] / r['segments'] * 1000:>10.2f} {results['none']['seconds'] / r['seconds']:>7.2f}x "
+              f"{r['weights_mb']:>10.2f} {r['rss_growth_mb']:>7.0f} {diff.max():>8.4f} {diff.mean():>9.5f} "
+              f"{seg_agree:>9.3f} {vote_agree:>10.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Latency and parity of the vectorized speech-feature extractor against the
+original calculate_speech_features_from_audio (librosa.load at 22,050 Hz, two
+effects.split passes, per-feature librosa calls), on synthetic 44.1 kHz uploads.
+
+    python -m benchmarks.bench_speech_features --durations 30 120 300
+
+Parity is checked the way the service computes the features: the upload is
+decoded at its native rate, as preprocessing does, and load_waveform resamples
+that buffer to FEATURES['speech_sample_rate']. The run exits non-zero if any
+normalized feature differs from the original by more than --tolerance.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+import librosa
+import soundfile as sf
+from benchmarks.common import synthetic_speech, time_call
+from config_ai import FEATURES
+from services.spectral_features import load_waveform
+from services.speech_features import extract_speech_features
+
+ORIGINAL_SR = 22050
+
+def original_speech_features(audio_path):
+    """calculate_speech_features_from_audio as it was before the shared STFT and vectorization."""
+    y, sr = librosa.load(audio_path, sr=ORIGINAL_SR)
+    intervals = librosa.effects.split(y, top_db=20)
+
+    # Pause Frequency
+    if len(intervals) > 1:
+        pauses = [ (intervals[i+1][0] - intervals[i][1]) / sr for i in range(len(intervals)-1) if (intervals[i+1][0] - intervals[i][1]) / sr > 0.15 ]
+        total_duration = len(y) / sr
+        pause_freq = len(pauses) / (total_duration / 60) if total_duration > 0 else 0
+        pause_freq_norm = min(pause_freq / 40, 1.0)
+    else:
+        pause_freq_norm = 0.1
+
+    # Speech Rate
+    speech_duration = sum((e - s) / sr for s, e in librosa.effects.split(y, top_db=25))
+    if speech_duration > 0:
+        onsets = librosa.onset.onset_detect(y=y, sr=sr, units='frames')
+        words = len(onsets) / 1.4
+        wpm = (words / speech_duration) * 60
+        speech_rate_norm = min((wpm - 50) / 200, 1.0) if wpm >= 100 else wpm / 200
+    else:
+        speech_rate_norm = 0.3
+
+    # Vocabulary & Fluency Proxies
+    centroid_var = np.var(librosa.feature.spectral_centroid(y=y, sr=sr)[0])
+    mfcc_var = np.mean(np.var(librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13), axis=1))
+    vocab_complexity_norm = np.clip((centroid_var / 1000000 + mfcc_var / 50) / 3, 0, 1)
+
+    zcr_stability = 1 - np.std(librosa.feature.zero_crossing_rate(y)[0])
+    flux = np.sum(np.diff(np.abs(librosa.stft(y)), axis=1)**2, axis=0)
+    flux_smoothness = 1 - (np.std(flux) / (np.mean(flux) + 1e-8))
+    semantic_fluency_norm = np.clip((max(zcr_stability, 0) + max(flux_smoothness, 0)) / 2, 0, 1)
+
+    return {
+        'pauseFrequency': float(round(np.clip(pause_freq_norm, 0.1, 0.9), 2)),
+        'speechRate': float(round(np.clip(speech_rate_norm, 0.2, 0.9), 2)),
+        'vocabularyComplexity': float(round(np.clip(vocab_complexity_norm, 0.3, 0.8), 2)),
+        'semanticFluency': float(round(np.clip(semantic_fluency_norm, 0.3, 0.9), 2))
+    }
+
+def service_speech_features(path, sample_rate):
+    """The service path: native-rate decode (PreprocessingPipeline.load_audio), then the vectorized extractor."""
+    y, sr = librosa.load(path, sr=None, mono=False)
+    return extract_speech_features(load_waveform((y.astype(np.float32, copy=False), sr), sample_rate), sample_rate)
+
+def max_difference(a, b):
+    return max(abs(a[k] - b[k]) for k in a)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--durations', type=float, nargs='+', default=[30, 120, 300])
+    parser.add_argument('--seeds', type=int, default=3, help='Synthetic clips per duration (parity only uses all of them)')
+    parser.add_argument('--upload-sr', type=int, default=44100)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=1e-6,
+                        help='Allowed difference per normalized feature (they are rounded to 0.01, so any flip fails)')
+    args = parser.parse_args()
+
+    service_sr = FEATURES['speech_sample_rate']
+    if service_sr != ORIGINAL_SR:
+        print(f"FEATURES['speech_sample_rate'] is {service_sr} Hz; the original ran at {ORIGINAL_SR} Hz")
+    out_dir = tempfile.mkdtemp(prefix='bench_speech_features_')
+    print(f"{'duration_s':>10} {'original_ms':>12} {'vectorized_ms':>14} {'speedup':>8} {'max|diff|':>10}")
+    worst = 0.0
+    for duration in args.durations:
+        differences = []
+        for seed in range(args.seeds):
+            path = os.path.join(out_dir, f'speech_{duration:g}s_{seed}.wav')
+            sf.write(path, synthetic_speech(duration, sr=args.upload_sr, seed=seed), args.upload_sr)
+            differences.append(max_difference(original_speech_features(path), service_speech_features(path, service_sr)))
+        # Both timed from the upload on disk, as the original decodes it itself
+        original_seconds, _ = time_call(original_speech_features, path, repeats=args.repeats)
+        vectorized_seconds, _ = time_call(service_speech_features, path, service_sr, repeats=args.repeats)
+        worst = max(worst, max(differences))
+        print(f"{duration:>10.0f} {original_seconds * 1000:>12.1f} {vectorized_seconds * 1000:>14.1f} "
+              f"{original_seconds / vectorized_seconds:>7.2f}x {max(differences):>10.2f}")
+    if worst > args.tolerance:
+        print(f"Parity check FAILED: normalized features differ from the original by up to {worst:.2f}")
+        sys.exit(1)
+    print("Parity check passed.")
+
+if __name__ == '__main__':
+    main()
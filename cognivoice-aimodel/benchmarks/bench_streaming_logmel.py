@@ -0,0 +1,55 @@
+"""
+Peak memory and time of log-mel segment extraction from a WAV file: the full
+in-memory path (process_audio_to_logmel_segments) against LogMelStream, whose
+segments are consumed one at a time as inference would. Each measurement runs
+in a fresh process so peak RSS is not shared between them.
+
+    python -m benchmarks.bench_streaming_logmel --durations 60 600 1800
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from benchmarks.common import write_long_wav
+
+def measure(mode, path):
+    import time
+    from config_ai import FEATURES
+    from services.resource_usage import peak_rss_mb
+    from services.prediction_pipeline import process_audio_to_logmel_segments
+    from services.streaming_logmel import LogMelStream
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'full':
+        n_segments = len(process_audio_to_logmel_segments(path, FEATURES))
+    else:
+        n_segments = sum(1 for _ in LogMelStream(path, FEATURES))
+    return {'seconds': time.perf_counter() - start, 'peak_rss_delta_mb': peak_rss_mb() - baseline, 'segments': n_segments}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--durations', type=float, nargs='+', default=[60, 600, 1800])
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(*args.child)))
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_stream_')
+    print(f"{'duration_s':>10} {'mode':>7} {'segments':>9} {'seconds':>8} {'peak_rss_delta_mb':>18}")
+    for duration in args.durations:
+        path = os.path.join(tmp_dir, f'speech_{int(duration)}.wav')
+        write_long_wav(path, duration)
+        for mode in ('full', 'stream'):
+            out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_streaming_logmel', '--child', mode, path],
+                                 capture_output=True, text=True, check=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{duration:>10.0f} {mode:>7} {result['segments']:>9} {result['seconds']:>8.2f} {result['peak_rss_delta_mb']:>18.0f}")
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
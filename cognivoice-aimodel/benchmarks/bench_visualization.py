@@ -0,0 +1,35 @@
+"""
+Compares the numpy LUT renderer with the matplotlib one on synthetic recordings.
+
+    python -m benchmarks.bench_visualization --durations 30 300
+"""
+import os
+import argparse
+import tempfile
+import numpy as np
+from benchmarks.common import synthetic_speech, time_call
+from services.spectral_features import SpectralFeatures
+from services.prediction_pipeline import RENDERERS
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--durations', type=float, nargs='+', default=[30, 300])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    out_dir = tempfile.mkdtemp(prefix='bench_viz_')
+    print(f"{'duration_s':>10} {'renderer':>11} {'seconds':>9} {'png_kb':>8}")
+    for duration in args.durations:
+        spectral = SpectralFeatures(synthetic_speech(duration), 16000)
+        spectrogram_db = spectral.spectrogram_db
+        n_segments = max(1, spectrogram_db.shape[1] // 224)
+        predictions = (np.arange(n_segments) % 3 == 0).astype(int).tolist()
+        for name, render in RENDERERS.items():
+            img_path = os.path.join(out_dir, f'{name}_{int(duration)}.png')
+            seconds, _ = time_call(render, spectrogram_db, spectral.sr, spectral.hop_length, predictions, 0, img_path,
+                                   repeats=args.repeats)
+            print(f"{duration:>10.0f} {name:>11} {seconds:>9.3f} {os.path.getsize(img_path) / 1024:>8.0f}")
+    print(f"Images written to {out_dir}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import numpy as np
+import soundfile as sf
+
+# Benchmarks run from cognivoice-aimodel/ (python -m benchmarks.<name>) and import the service modules directly
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+def synthetic_speech(duration_s, sr=16000, seed=0):
+    """
+    Deterministic speech-like test signal: a glottal pulse train with a wandering
+    pitch, two moving formant bands, syllable-rate amplitude modulation and pauses.
+    """
+    rng = np.random.RandomState(seed)
+    n = int(duration_s * sr)
+    t = np.arange(n) / sr
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.3 * t) + 10 * np.sin(2 * np.pi * 2.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    formants = np.sin(2 * np.pi * (500 + 200 * np.sin(2 * np.pi * 0.7 * t)) * t) * 0.3 \
+        + np.sin(2 * np.pi * (1500 + 400 * np.sin(2 * np.pi * 0.5 * t)) * t) * 0.15
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) ** 2
+    # Pauses: ~0.3-1.2 s gaps every few seconds
+    pauses = np.ones(n)
+    pos = int(rng.uniform(1.5, 4.0) * sr)
+    while pos < n:
+        length = int(rng.uniform(0.3, 1.2) * sr)
+        pauses[pos:pos + length] = 0
+        pos += length + int(rng.uniform(1.5, 4.0) * sr)
+    y = (voiced * 0.1 + formants) * syllables * pauses + 0.003 * rng.randn(n)
+    return (y / (np.max(np.abs(y)) + 1e-8) * 0.5).astype(np.float32)
+
+def write_long_wav(path, duration_s, sr=44100, chunk_s=60):
+    """Writes a synthetic recording chunk by chunk, so generating it needs no more than one chunk in memory."""
+    with sf.SoundFile(path, 'w', samplerate=sr, channels=1, subtype='PCM_16') as f:
+        written, seed = 0.0, 0
+        while written < duration_s:
+            length = min(chunk_s, duration_s - written)
+            f.write(synthetic_speech(length, sr=sr, seed=seed))
+            written += length
+            seed += 1
+
+def time_call(fn, *args, repeats=3, **kwargs):
+    """Runs `fn` `repeats` times and returns (best_seconds, last_result)."""
+    best, result = float('inf'), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
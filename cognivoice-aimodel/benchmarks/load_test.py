@@ -0,0 +1,338 @@
+"""
+End-to-end load test of the upload -> queue -> pipeline -> webhook path,
+without the Flask backend. A local stand-in for Flask's
+POST /internal/progress-update timestamps every progress update, while the
+driver fires /predict uploads at the given arrival rates (one run per rate).
+
+    # Let the harness start the service (uvicorn main:app) with its webhooks pointed at the receiver
+    python -m benchmarks.load_test --serve --rates 0.1 0.2 0.5 --requests 30
+
+    # Or load a running service that was started with FLASK_BACKEND_URL=http://127.0.0.1:5055
+    # (and the same INTERNAL_API_SECRET as this process)
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --rates 0.5 --requests 30 --output load.json
+
+Every upload is a distinct synthetic recording, so the result cache does not
+answer them. Per rate the report gives the admitted/rejected (503) counts,
+throughput of completed jobs, the /predict response time, the time from upload
+to the first update of each progress step and the time to the final result.
+The webhook dispatcher coalesces superseded intermediate steps, so not every
+job reports every step; `n` says how many did.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+import soundfile as sf
+from benchmarks.common import synthetic_speech
+
+PERCENTILES = (50, 90, 99)
+# Progress steps posted by analysis_service_ai (QUEUED_STEP while waiting for a worker, 99 on errors)
+STEP_NAMES = {-1: "queued", 0: "preprocessing", 1: "features", 2: "speech", 3: "insights", 4: "complete", 99: "error"}
+
+class WebhookReceiver:
+    """
+    Stand-in for Flask's POST /internal/progress-update. Checks the payload the
+    way Flask does (403 on a wrong secret, 400 on a missing field), answers
+    after `delay_s` (to simulate a slow backend) and keeps every accepted update
+    with the time it arrived.
+    """
+    def __init__(self, host='127.0.0.1', port=5055, secret=None, delay_s=0.0):
+        self.secret = secret
+        self.delay_s = delay_s
+        self.updates = defaultdict(list)
+        self.rejected = 0
+        self._finals = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), _receiver_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="webhook-receiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def receive(self, payload):
+        """Records one webhook body and returns Flask's `(message, status code)` for it."""
+        received = time.perf_counter()
+        if payload.get('secret_key') != self.secret:
+            with self._finals:
+                self.rejected += 1
+            return 'Forbidden', 403
+        request_id, update = payload.get('request_id'), payload.get('update')
+        if not (request_id and payload.get('user_id') and update):
+            with self._finals:
+                self.rejected += 1
+            return 'Invalid payload', 400
+        result = update.get('result') or {}
+        with self._finals:
+            self.updates[request_id].append({
+                "time": received, "step": update.get('step'), "message": update.get('message'),
+                "is_final": bool(update.get('is_final')), "error": result.get('error'),
+            })
+            if update.get('is_final'):
+                self._finals.notify_all()
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        return 'Update received', 200
+
+    def timeline(self, request_id):
+        with self._finals:
+            return list(self.updates.get(request_id, ()))
+
+    def wait_for_finals(self, request_ids, timeout):
+        """Waits until each of `request_ids` got a final update; returns those that did not."""
+        deadline = time.monotonic() + timeout
+        with self._finals:
+            while True:
+                missing = [rid for rid in request_ids if not any(u["is_final"] for u in self.updates.get(rid, ()))]
+                remaining = deadline - time.monotonic()
+                if not missing or remaining <= 0:
+                    return missing
+                self._finals.wait(min(remaining, 1.0))
+
+def _receiver_handler(receiver):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip('/') != '/internal/progress-update':
+                self._reply({"message": "Not found"}, 404)
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            except ValueError:
+                self._reply({"message": "Invalid JSON"}, 400)
+                return
+            message, code = receiver.receive(payload)
+            self._reply({"message": message}, code)
+
+        def _reply(self, body, code):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+def upload_clips(n, seconds, sr=44100, distinct=4, seed=0):
+    """
+    `n` WAV uploads that all hash differently: `distinct` synthetic recordings,
+    each upload with its own faint noise floor on top.
+    """
+    bases = [synthetic_speech(seconds, sr=sr, seed=seed + k) for k in range(min(distinct, n))]
+    clips = []
+    for i in range(n):
+        rng = np.random.RandomState(seed * 100003 + i)
+        y = bases[i % len(bases)] + 3e-4 * rng.randn(len(bases[0])).astype(np.float32)
+        buffer = io.BytesIO()
+        sf.write(buffer, y, sr, format='WAV', subtype='PCM_16')
+        clips.append(buffer.getvalue())
+    return clips
+
+def arrival_offsets(n, rate, process="poisson", seed=0):
+    """Send times (seconds from the start) of `n` requests arriving at `rate` per second."""
+    if process == "poisson":
+        gaps = np.random.RandomState(seed).exponential(1 / rate, n)
+    else:
+        gaps = np.full(n, 1 / rate)
+    return np.concatenate([[0.0], np.cumsum(gaps[:-1])])
+
+def post_upload(url, request_id, user_id, clip, timeout):
+    sent = time.perf_counter()
+    record = {"request_id": request_id, "sent": sent}
+    try:
+        response = requests.post(f"{url}/predict", data={'request_id': request_id, 'user_id': user_id},
+                                 files={'audio': (f'{request_id}.wav', clip, 'audio/wav')}, timeout=timeout)
+        record["status"] = response.status_code
+        record["body"] = response.json() if response.headers.get('content-type', '').startswith('application/json') else None
+    except requests.RequestException as e:
+        record["status"], record["body"] = None, {"error": str(e)}
+    record["responded"] = time.perf_counter()
+    return record
+
+def run_load(url, receiver, clips, rate, process, run_id, args):
+    """Fires one upload per clip at `rate`/s and waits for their final updates; returns one record per upload with its update timeline."""
+    offsets = arrival_offsets(len(clips), rate, process, seed=run_id)
+    with ThreadPoolExecutor(args.max_in_flight, thread_name_prefix="load-driver") as executor:
+        start, futures = time.perf_counter(), []
+        for i, (offset, clip) in enumerate(zip(offsets, clips)):
+            time.sleep(max(0.0, start + offset - time.perf_counter()))
+            futures.append(executor.submit(post_upload, url, f"load-{run_id}-{i:04d}", args.user_id, clip, args.upload_timeout))
+        records = [future.result() for future in futures]
+    admitted = [r["request_id"] for r in records if r["status"] == 200]
+    missing = receiver.wait_for_finals(admitted, args.result_timeout)
+    if missing:
+        print(f"  {len(missing)} admitted job(s) got no final result within {args.result_timeout:.0f}s")
+    # Times are kept as seconds since the run started
+    for record in records:
+        record["sent"] -= start
+        record["responded"] -= start
+        record["updates"] = [dict(update, time=update["time"] - start) for update in receiver.timeline(record["request_id"])]
+    return records
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    values = np.asarray(values)
+    summary = {"n": int(len(values))}
+    summary.update({f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES})
+    summary["max"] = float(values.max())
+    return summary
+
+def summarize(records, rate):
+    """Counts, throughput and latency percentiles of one run."""
+    admitted = [r for r in records if r["status"] == 200]
+    finals = {}
+    duplicate_finals = 0
+    step_latency = defaultdict(list)
+    for record in admitted:
+        first_seen = {}
+        record_finals = [u for u in record["updates"] if u["is_final"]]
+        duplicate_finals += max(0, len(record_finals) - 1)
+        for update in record["updates"]:
+            first_seen.setdefault(update["step"], update["time"] - record["sent"])
+        for step, latency in first_seen.items():
+            step_latency[step].append(latency)
+        if record_finals:
+            finals[record["request_id"]] = record_finals[0]
+    completed = [rid for rid, final in finals.items() if not final["error"]]
+    first_sent = min(r["sent"] for r in records)
+    last_final = max((final["time"] for final in finals.values()), default=first_sent)
+    span = last_final - first_sent
+    return {
+        "offered_rate_per_s": rate,
+        "sent": len(records),
+        "admitted": len(admitted),
+        "rejected_503": sum(r["status"] == 503 for r in records),
+        "http_errors": sum(r["status"] not in (200, 503) for r in records),
+        "cached_or_joined": sum(bool((r["body"] or {}).get("cached")) or "joined" in (r["body"] or {}).get("message", "")
+                                for r in admitted),
+        "completed": len(completed),
+        "failed": len(finals) - len(completed),
+        "errors": dict(Counter(final["error"] for final in finals.values() if final["error"])),
+        "no_final_result": len(admitted) - len(finals),
+        "duplicate_finals": duplicate_finals,
+        "throughput_per_min": len(completed) / span * 60 if span > 0 else 0.0,
+        "predict_response_s": percentiles([r["responded"] - r["sent"] for r in records if r["status"] is not None]),
+        "time_to_step_s": {STEP_NAMES.get(step, str(step)): percentiles(values) for step, values in sorted(step_latency.items())},
+        "time_to_final_s": percentiles([finals[rid]["time"] - r["sent"] for r in admitted if (rid := r["request_id"]) in finals]),
+    }
+
+def print_summary(summary):
+    print(f"  sent {summary['sent']}, admitted {summary['admitted']}, rejected (503) {summary['rejected_503']}, "
+          f"http errors {summary['http_errors']}, cached/joined {summary['cached_or_joined']}")
+    print(f"  completed {summary['completed']}, failed {summary['failed']}, no final result {summary['no_final_result']}, "
+          f"duplicate finals {summary['duplicate_finals']}; throughput {summary['throughput_per_min']:.2f} jobs/min")
+    for error, count in summary["errors"].items():
+        print(f"  {count} x {error}")
+    print(f"  {'latency (s)':>22} {'n':>5}" + "".join(f" {f'p{p}':>8}" for p in PERCENTILES) + f" {'max':>8}")
+    rows = [("/predict response", summary["predict_response_s"])]
+    rows += [(f"to step {name}", values) for name, values in summary["time_to_step_s"].items()]
+    rows.append(("to final result", summary["time_to_final_s"]))
+    for label, values in rows:
+        if values["n"]:
+            print(f"  {label:>22} {values['n']:>5}" + "".join(f" {values[f'p{p}']:>8.2f}" for p in PERCENTILES)
+                  + f" {values['max']:>8.2f}")
+
+def start_service(port, receiver, secret, log_path, startup_timeout):
+    """Runs `uvicorn main:app` from cognivoice-aimodel/ with its webhooks pointed at `receiver`, once /readyz is 200."""
+    env = dict(os.environ, FLASK_BACKEND_URL=receiver.url)
+    if secret is not None:
+        env["INTERNAL_API_SECRET"] = secret
+    service_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    log = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port)],
+                               cwd=service_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url, deadline = f"http://127.0.0.1:{port}", time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"The service exited during start-up (code {process.returncode}); see {log_path}")
+        try:
+            if requests.get(f"{url}/readyz", timeout=2).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    process.terminate()
+    raise SystemExit(f"The service was not ready after {startup_timeout:.0f}s; see {log_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help='Base URL of a running AI service (default with --serve: its own)')
+    parser.add_argument('--serve', action='store_true', help='Start the service (uvicorn main:app) for the test')
+    parser.add_argument('--service-port', type=int, default=8000)
+    parser.add_argument('--startup-timeout', type=float, default=600, help='Seconds to wait for /readyz with --serve')
+    parser.add_argument('--receiver-host', default='127.0.0.1')
+    parser.add_argument('--receiver-port', type=int, default=5055)
+    parser.add_argument('--receiver-delay-ms', type=float, default=0, help='Added to every webhook response (slow backend)')
+    parser.add_argument('--secret', default=os.environ.get('INTERNAL_API_SECRET'), help='Expected INTERNAL_API_SECRET')
+    parser.add_argument('--rates', type=float, nargs='+', default=[0.1], help='Arrival rates to test, uploads per second')
+    parser.add_argument('--arrivals', choices=['poisson', 'uniform'], default='poisson')
+    parser.add_argument('--requests', type=int, default=20, help='Uploads per rate')
+    parser.add_argument('--clip-seconds', type=float, default=30)
+    parser.add_argument('--user-id', type=int, default=1)
+    parser.add_argument('--max-in-flight', type=int, default=64, help='Concurrent /predict requests the driver can have open')
+    parser.add_argument('--upload-timeout', type=float, default=60)
+    parser.add_argument('--result-timeout', type=float, default=1800, help='Seconds to wait for final results after the last upload')
+    parser.add_argument('--output', default=None, help='JSON file for the summaries and every upload\'s update timeline')
+    args = parser.parse_args()
+    if not args.serve and not args.url:
+        parser.error("give --url of a running service, or --serve")
+
+    receiver = WebhookReceiver(args.receiver_host, args.receiver_port, secret=args.secret, delay_s=args.receiver_delay_ms / 1000)
+    receiver.start()
+    print(f"Webhook receiver on {receiver.url}/internal/progress-update")
+    service = None
+    try:
+        url = args.url
+        if args.serve:
+            log_path = os.path.join(tempfile.mkdtemp(prefix='load_test_'), 'service.log')
+            print(f"Starting the service (log: {log_path})")
+            service, url = start_service(args.service_port, receiver, args.secret, log_path, args.startup_timeout)
+            url = args.url or url
+        runs = []
+        for run_id, rate in enumerate(args.rates):
+            clips = upload_clips(args.requests, args.clip_seconds, seed=run_id)
+            print(f"\nRate {rate:g}/s ({args.arrivals}), {args.requests} x {args.clip_seconds:g}s uploads")
+            records = run_load(url, receiver, clips, rate, args.arrivals, run_id, args)
+            summary = summarize(records, rate)
+            print_summary(summary)
+            try:
+                summary["service_stats"] = requests.get(f"{url}/stats", timeout=10).json()
+            except requests.RequestException:
+                pass
+            runs.append({"summary": summary, "uploads": records})
+        if receiver.rejected:
+            print(f"\nThe receiver rejected {receiver.rejected} update(s): check that the service uses the same INTERNAL_API_SECRET")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({"settings": vars(args), "runs": runs}, f, indent=2, default=str)
+            print(f"Results written to {args.output}")
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait(timeout=60)
+        receiver.stop()
+
+if __name__ == '__main__':
+    main()
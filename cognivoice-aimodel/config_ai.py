@@ -5,19 +5,38 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env_ai'))
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 HF_AUTH_TOKEN = os.environ.get('HF_AUTH_TOKEN') # IMPORTANT: Add your token to .env
+# Debug mode keeps intermediate WAVs from the in-memory pipeline in temp_processing_ai
+DEBUG = os.environ.get('AI_DEBUG', 'false').lower() in ('1', 'true', 'yes')
 
 PREPROCESSING = {
         "denoiser_model_path": "htdemucs",
+        "denoiser_segment": None, # Seconds per Demucs chunk, None keeps the model default
+        "denoiser_overlap": 0.25,
+        "denoiser_shifts": 1,
+        "denoiser_num_workers": 0, # Threads separating chunks in parallel (0 = inline)
+        # Keep only the dominant speaker (pyannote); loaded on first use, never when disabled
+        "diarization_enabled": os.environ.get('AI_DIARIZATION', 'false').lower() in ('1', 'true', 'yes'),
+        "diarization_model": "pyannote/speaker-diarization-3.1",
         "num_diarization_speakers": 2, 
         "silence_top_db": 30, # Log-mel is sensitive, a lower dB might be better
-        "normalization_type": "rms"
+        "normalization_type": "rms",
+        "in_memory": True # Pass waveform buffers between stages instead of temp WAV files
     }
     
 FEATURES = {
         # Log-mel feature settings are now mostly inside the extraction function
         "sample_rate": 16000, 
         "n_mels": 224,
-        "segment_length": 224
+        "segment_length": 224,
+        # Recordings at least this long are read in blocks and their log-mel segments scored as they are
+        # produced, so log-mel extraction stays flat with duration (two passes over the audio instead of one).
+        # A job as a whole still grows with duration: decoding, Demucs, silence removal and speech features
+        # work on the whole waveform (python -m benchmarks.bench_pipeline --memory)
+        "streaming_min_duration_s": int(os.environ.get('AI_STREAMING_MIN_DURATION_S', 300)),
+        "streaming_block_s": 30,
+        # Speech features are computed from the decoded upload (not the denoised audio) at the rate the
+        # original librosa.load used; bench_speech_features checks them against the original at this rate
+        "speech_sample_rate": 22050
     }
 
 MODEL = {
@@ -28,5 +47,110 @@ MODEL = {
         "class_names": ['Control', 'Dementia'],
         # The input shape for the new model
         "input_shape": (3, FEATURES['n_mels'], FEATURES['segment_length']), 
-        "num_classes": 1
+        "num_classes": 1,
+        "inference_batch_size": 16, # Segments per forward pass
+        # Fold BatchNorms into Conv/Linear weights, run the LSTM as one step from zero state (checked against the original)
+        "optimize_graph": os.environ.get('AI_OPTIMIZE_MODEL', 'true').lower() in ('1', 'true', 'yes'),
+        "channels_last": True, # NHWC memory format for the CNN (with optimize_graph)
+        # Int8 CPU inference: "none", "dynamic" (LSTM + Linear) or "static" (also FX-quantized convolutions)
+        "quantization": os.environ.get('AI_QUANTIZATION', 'none'),
+        # Unscaled log-mel segments (N, 3, n_mels, segment_length) for static calibration and parity checks
+        "calibration_path": os.path.join(basedir, "models/calibration/logmel_segments.npy"),
+        # "eager" (PyTorch module), "torchscript" or "onnxruntime"; the latter two need `python export_model.py`
+        "backend": os.environ.get('AI_INFERENCE_BACKEND', 'eager'),
+        "export_dir": os.path.join(basedir, "models/exported"),
+        "onnx_intra_op_threads": 0 # 0 lets ONNX Runtime pick
+    }
+
+
+INFERENCE = {
+        # Cross-request micro-batching of segments from concurrent jobs
+        "scheduler_enabled": True,
+        "max_batch_size": 32,
+        "max_wait_ms": 10,
+        # Sequential probability ratio test on the segment votes: stop scoring once the majority
+        # is settled at `confidence` (vs P(dementia vote) = 0.5 +/- `indifference`)
+        "early_exit": {
+            "enabled": os.environ.get('AI_EARLY_EXIT', 'false').lower() in ('1', 'true', 'yes'),
+            "confidence": 0.99,
+            "indifference": 0.1,
+            "min_segments": 16
+        }
+    }
+
+VISUALIZATION = {
+        "static_folder": os.path.join(basedir, "static_predictions_ai"),
+        "renderer": "numpy", # "numpy" (LUT + zlib PNG encoder) or "matplotlib"
+        # Render PNGs on first request / in the background instead of before the final webhook
+        "lazy": True,
+        "prerender": True,
+        "max_columns": 2400, # Time frames kept per spectrogram (wider ones are averaged down)
+        "max_cache_mb": 500,
+        "max_age_hours": 72
+    }
+
+JOB_QUEUE = {
+        # Analysis jobs run on a fixed worker pool; uploads beyond max_depth get 503 + Retry-After
+        "workers": int(os.environ.get('AI_JOB_WORKERS', 2)),
+        "max_depth": int(os.environ.get('AI_JOB_QUEUE_DEPTH', 20)),
+        "retry_after_seconds": 30,
+        "shutdown_timeout_seconds": 120 # Running jobs get this long to finish before the service stops
+    }
+
+BATCH = {
+        # POST /predict/batch runs whole batches on their own queue ("workers" batches at a time, alongside
+        # single jobs); score_batch.py uses the same pipeline offline
+        "workers": 1,
+        "max_depth": int(os.environ.get('AI_BATCH_QUEUE_DEPTH', 4)),
+        "retry_after_seconds": 300,
+        "shutdown_timeout_seconds": 120,
+        # Decode/denoise/log-mel of upcoming recordings overlaps inference of the earlier ones
+        "extract_workers": int(os.environ.get('AI_BATCH_EXTRACT_WORKERS', 2)), # Process mode uses the pool size
+        "prefetch": 4, # Extracted recordings waiting for inference (bounds memory)
+        "max_files": 1000,
+        "max_upload_mb": 4096,
+        "keep_batches": 50, # Finished batches whose results GET /predict/batch/{batch_id} still returns
+        "upload_folder": os.path.join(basedir, "uploads_ai", "batches")
+    }
+
+WEBHOOKS = {
+        # Progress updates to Flask are sent by background threads over pooled keep-alive connections
+        "workers": 4,
+        "timeout_seconds": 5,
+        "max_retries": 5, # Final updates are retried with exponential backoff; superseded steps are dropped
+        "backoff_base_seconds": 0.5,
+        "backoff_max_seconds": 30
+    }
+
+OUTBOX = {
+        # Final results are written here before delivery and kept until Flask has accepted them
+        "enabled": os.environ.get('AI_OUTBOX', 'true').lower() in ('1', 'true', 'yes'),
+        "db_path": os.path.join(basedir, "cache", "outbox.sqlite3"),
+        "redelivery_interval_seconds": 30,
+        "batch_size": 50,
+        "lease_seconds": 120 # Longer than a full retry cycle (max_retries x timeout + backoff) of WEBHOOKS
+    }
+
+RESULT_CACHE = {
+        # Results keyed by upload SHA-256 + model/config fingerprint; repeated uploads skip the pipeline
+        "enabled": os.environ.get('AI_RESULT_CACHE', 'true').lower() in ('1', 'true', 'yes'),
+        "db_path": os.path.join(basedir, "cache", "results.sqlite3"),
+        "max_entries": 10000,
+        "ttl_hours": 72 # Matches VISUALIZATION["max_age_hours"] so cached image URLs stay valid
+    }
+
+WARMUP = {
+        # Synthetic clip pushed through the whole pipeline at startup; /readyz turns 200 once it has run
+        "enabled": os.environ.get('AI_WARMUP', 'true').lower() in ('1', 'true', 'yes'),
+        "duration_s": 12
+    }
+
+EXECUTION = {
+        # "thread": everything runs on the JobQueue worker threads.
+        # "process": preprocessing + feature extraction run in a process pool (one model copy per process).
+        "mode": os.environ.get('AI_EXECUTION_MODE', 'thread'),
+        "process_workers": int(os.environ.get('AI_PROCESS_WORKERS', 2)),
+        # Keep process_workers x threads <= physical cores to avoid oversubscription
+        "torch_threads_per_process": int(os.environ.get('AI_TORCH_THREADS_PER_PROCESS', 1)),
+        "blas_threads_per_process": int(os.environ.get('AI_BLAS_THREADS_PER_PROCESS', 1))
     }
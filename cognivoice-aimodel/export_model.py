@@ -0,0 +1,93 @@
+"""
+Exports the CNN-LSTM checkpoint to TorchScript and ONNX for the non-eager inference backends.
+
+    python export_model.py [--checkpoint PATH] [--scaler PATH] [--out-dir DIR] [--formats torchscript onnx]
+
+The MinMax scaler is folded into the exported graphs exactly as at service
+startup, and export.json records the checkpoint/scaler fingerprint so the
+service refuses stale artifacts (see MODEL["backend"] in config_ai.py).
+"""
+import os
+import json
+import logging
+import argparse
+import joblib
+import numpy as np
+import torch
+from config_ai import MODEL
+from services.prediction_pipeline import load_model_from_checkpoint
+from services.inference_backends import (
+    EagerBackend, TorchScriptBackend, OnnxRuntimeBackend, TORCHSCRIPT_FILE, ONNX_FILE, EXPORT_METADATA_FILE
+)
+from services.result_cache import cache_version
+
+logger = logging.getLogger(__name__)
+
+def export_torchscript(model, example, path):
+    with torch.no_grad():
+        # Frozen (weights inlined as constants); optimize_for_inference runs again on load
+        scripted = torch.jit.freeze(torch.jit.trace(model, example.clone()))
+    scripted.save(path)
+
+def export_onnx(model, example, path, opset):
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (example.clone(),),
+            path,
+            input_names=["segments"],
+            output_names=["logits"],
+            dynamic_axes={"segments": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset,
+            dynamo=False,
+        )
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default=MODEL["checkpoint_path"])
+    parser.add_argument('--scaler', default=MODEL["scaler_path"])
+    parser.add_argument('--out-dir', default=MODEL["export_dir"])
+    parser.add_argument('--formats', nargs='+', choices=['torchscript', 'onnx'], default=['torchscript', 'onnx'])
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    scaler = joblib.load(args.scaler) if os.path.exists(args.scaler) else None
+    # Always export the fp32 graph; int8 quantization is an eager-backend option
+    model = load_model_from_checkpoint(args.checkpoint, dict(MODEL, quantization="none"), device, scaler=scaler)
+    scales_input = model.input_scaler is not None
+    if scaler is not None and not scales_input:
+        raise SystemExit(f"Scaler {type(scaler).__name__} cannot be folded into the graph; export is not supported.")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    example = torch.rand((2,) + tuple(MODEL["input_shape"]))
+    check = np.random.RandomState(0).rand(5, *MODEL["input_shape"]).astype(np.float32)
+    reference = EagerBackend(model, device).predict_proba(check.copy())
+
+    for fmt in args.formats:
+        if fmt == 'torchscript':
+            path = os.path.join(args.out_dir, TORCHSCRIPT_FILE)
+            export_torchscript(model, example, path)
+            exported = TorchScriptBackend(path, device, scales_input)
+        else:
+            path = os.path.join(args.out_dir, ONNX_FILE)
+            export_onnx(model, example, path, args.opset)
+            exported = OnnxRuntimeBackend(path, scales_input)
+        # Different batch size than the trace example, to exercise the dynamic batch axis
+        max_diff = float(np.max(np.abs(exported.predict_proba(check.copy()) - reference)))
+        logger.info(f"Exported {fmt} to {path} (max |dp| vs eager: {max_diff:.2e})")
+        if max_diff > 1e-4:
+            raise SystemExit(f"{fmt} export does not match the eager model (max |dp| = {max_diff:.2e}).")
+
+    with open(os.path.join(args.out_dir, EXPORT_METADATA_FILE), 'w') as f:
+        json.dump({
+            "model_version": cache_version([args.checkpoint, args.scaler]),
+            "scales_input": scales_input,
+            "formats": args.formats,
+            "input_shape": list(MODEL["input_shape"]),
+            "torch_version": torch.__version__,
+        }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,35 @@
 import os
+import uuid
 import shutil
+import hashlib
+import zipfile
 import logging
 import joblib
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, Form, HTTPException
+from typing import List
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager # 1. Import the context manager
 
 # Import your config and services
-from config_ai import MODEL, FEATURES, PREPROCESSING, DEVICE, HF_AUTH_TOKEN
+from config_ai import MODEL, FEATURES, PREPROCESSING, INFERENCE, VISUALIZATION, JOB_QUEUE, BATCH, WEBHOOKS, OUTBOX, RESULT_CACHE, WARMUP, EXECUTION, DEVICE, HF_AUTH_TOKEN
 from services.preprocessing_pipeline import Preprocessor
-from services.prediction_pipeline import load_model_from_checkpoint
-from services.analysis_service_ai import run_analysis_pipeline_ai
+from services.denoiser import DemucsDenoiser
+from services.prediction_pipeline import load_predictor, RENDERERS
+from services.inference_scheduler import InferenceScheduler
+from services.visualization_cache import VisualizationCache
+from services.job_queue import JobQueue, QueueFullError
+from services.process_pool import FeatureExtractionPool
+from services.result_cache import ResultCache, cache_version
+from services.resource_usage import StartupReport, rss_mb
+from services.instrumentation import Stage, record_stages, render_metrics
+from services.warmup import WarmUp
+from services.webhook_dispatcher import WebhookDispatcher
+from services.outbox import ResultOutbox
+from services.early_exit import SequentialVote
+from services.batch_scoring import BatchScorer, BatchRegistry, BatchTooLargeError, save_uploads, run_batch, cancel_batch, results_csv
+from services.analysis_service_ai import run_analysis_pipeline_ai, cancel_analysis_ai, warm_up_pipeline, use_webhook_dispatcher, progress_webhook_url, send_progress_update, send_cached_result, notify_waiters, QUEUED_STEP
 
 load_dotenv('.env_ai')
 
@@ -26,40 +45,258 @@ async def lifespan(app: FastAPI):
     os.makedirs('temp_processing_ai', exist_ok=True)
     
     # Load all the models into the global dictionary
-    ml_models["predictor"] = load_model_from_checkpoint(MODEL["checkpoint_path"], MODEL, DEVICE)
-    ml_models["scaler"] = joblib.load(MODEL["scaler_path"])
-    ml_models["preprocessor"] = Preprocessor(HF_AUTH_TOKEN, DEVICE, PREPROCESSING)
+    startup = ml_models["startup"] = StartupReport()
+    with startup.stage("predictor"):
+        ml_models["scaler"] = joblib.load(MODEL["scaler_path"]) if os.path.exists(MODEL["scaler_path"]) else None
+        ml_models["predictor"] = load_predictor(MODEL, DEVICE, scaler=ml_models["scaler"])
+    if INFERENCE["scheduler_enabled"]:
+        ml_models["scheduler"] = InferenceScheduler.from_config(ml_models["predictor"], DEVICE, INFERENCE)
+    ml_models["early_exit"] = SequentialVote.from_config(INFERENCE["early_exit"])
+    if EXECUTION["mode"] == "process":
+        # Each pool process loads its own Preprocessor/Demucs; the parent only runs inference
+        with startup.stage("process_pool"):
+            ml_models["process_pool"] = FeatureExtractionPool.from_config(EXECUTION, HF_AUTH_TOKEN, DEVICE, PREPROCESSING, FEATURES, VISUALIZATION)
+            ml_models["process_pool"].preload()
+    else:
+        with startup.stage("denoiser"):
+            ml_models["denoiser"] = DemucsDenoiser.from_config(PREPROCESSING, DEVICE)
+        with startup.stage("preprocessor"):
+            ml_models["preprocessor"] = Preprocessor(HF_AUTH_TOKEN, DEVICE, PREPROCESSING, denoiser=ml_models["denoiser"])
+    if VISUALIZATION["lazy"]:
+        ml_models["visualizer"] = VisualizationCache.from_config(VISUALIZATION, RENDERERS[VISUALIZATION["renderer"]])
+    if RESULT_CACHE["enabled"]:
+        with startup.stage("result_cache"):
+            version = cache_version([MODEL["checkpoint_path"], MODEL["scaler_path"]], MODEL, FEATURES, PREPROCESSING, INFERENCE["early_exit"])
+            ml_models["result_cache"] = ResultCache.from_config(RESULT_CACHE, version)
     logging.info("--- AI Service: Models loaded successfully. ---")
+    outbox = ml_models["outbox"] = ResultOutbox.from_config(OUTBOX) if OUTBOX["enabled"] else None
+    ml_models["webhooks"] = WebhookDispatcher.from_config(progress_webhook_url(), WEBHOOKS, outbox=outbox, outbox_config=OUTBOX,
+                                                          secret_key=os.getenv('INTERNAL_API_SECRET'))
+    use_webhook_dispatcher(ml_models["webhooks"])
+    ml_models["job_queue"] = JobQueue.from_config(JOB_QUEUE)
+    ml_models["batch_scorer"] = BatchScorer.from_config(ml_models, BATCH, MODEL, FEATURES, VISUALIZATION, DEVICE)
+    ml_models["batch_registry"] = BatchRegistry(keep=BATCH["keep_batches"])
+    ml_models["batch_queue"] = JobQueue.from_config(BATCH)
+    startup.finish()
+    # Warm-up runs in the background: /healthz answers right away, /readyz once it is done
+    ml_models["warmup"] = WarmUp(warm_up_pipeline, ml_models, WARMUP["duration_s"]).start() if WARMUP["enabled"] else WarmUp.skipped()
     
     # The 'yield' signals that the startup is complete and the app can start accepting requests.
     yield
-    
-    
+
+    # The warm-up uses the scheduler and process pool, so let it finish before they go away
+    ml_models["warmup"].join(timeout=60)
+    # Before the dispatcher, outbox and scheduler go away: jobs that never started get their error final,
+    # and running ones get up to shutdown_timeout_seconds to finish and send theirs
+    ml_models["job_queue"].shutdown()
+    ml_models["batch_queue"].shutdown()
+    # Let queued progress updates go out before the process exits
+    ml_models["webhooks"].shutdown()
+    use_webhook_dispatcher(None)
+    if ml_models.get("outbox") is not None:
+        # Anything still undelivered stays on disk and is redelivered on the next start
+        ml_models["outbox"].close()
+    if "scheduler" in ml_models:
+        ml_models["scheduler"].shutdown()
+    if "visualizer" in ml_models:
+        ml_models["visualizer"].shutdown()
+    if "process_pool" in ml_models:
+        ml_models["process_pool"].shutdown()
+    if "result_cache" in ml_models:
+        ml_models["result_cache"].close()
 
 # 3. Attach the lifespan manager to the FastAPI app
 app = FastAPI(title="CogniVoice AI Service", lifespan=lifespan)
 
 # REMOVED: The old @app.on_event("startup") decorator and load_models function are gone.
 
+def _queue_full_error(retry_after):
+    return HTTPException(
+        status_code=503,
+        detail="AI service is at capacity, please retry later",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def _visualization_available(result):
+    """A cached result is only reusable while the image its URL points to can still be served."""
+    img_name = os.path.basename(result.get('visualizationUrl') or '')
+    if not img_name:
+        return True
+    if "visualizer" in ml_models:
+        return ml_models["visualizer"].exists(img_name)
+    return os.path.exists(os.path.join(VISUALIZATION["static_folder"], img_name))
+
+def _save_upload(upload_file, file_path, upload):
+    """Writes the upload to `file_path` (timed as `upload`) and returns its SHA-256, for the result cache."""
+    content_hash = hashlib.sha256()
+    with upload, open(file_path, "wb") as buffer:
+        for chunk in iter(lambda: upload_file.read(1024 * 1024), b''):
+            content_hash.update(chunk)
+            buffer.write(chunk)
+    return content_hash.hexdigest()
+
 @app.post("/predict")
 async def create_prediction_job(
-    background_tasks: BackgroundTasks,
     request_id: str = Form(...),
     user_id: int = Form(...), 
     audio: UploadFile = File(...)
 ):
+    job_queue = ml_models["job_queue"]
+    # Cheap admission check before the upload is written to disk
+    if job_queue.is_full():
+        raise _queue_full_error(job_queue.retry_after_seconds)
+
     upload_folder = 'uploads_ai'
     file_path = os.path.join(upload_folder, f"{request_id}_{audio.filename}")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(audio.file, buffer)
-
-    background_tasks.add_task(
-        run_analysis_pipeline_ai, 
-        file_path, 
-        request_id, 
-        user_id, # <-- Pass user_id to the background task
-        ml_models
-    )
-    return {"message": "AI analysis job queued", "request_id": request_id}
+    # Hash the upload while it is written out, off the event loop
+    upload = Stage("upload_write")
+    content_hash = await run_in_threadpool(_save_upload, audio.file, file_path, upload)
+
+    result_cache = ml_models.get("result_cache")
+    if result_cache is not None:
+        cached, joined = result_cache.get_or_join(content_hash, (request_id, user_id, file_path), is_valid=_visualization_available)
+        if cached is not None or joined:
+            record_stages([upload.as_dict()])
+            os.remove(file_path)
+            if cached is not None:
+                await run_in_threadpool(send_cached_result, request_id, user_id, cached, file_path)
+                return {"message": "AI analysis served from cache", "request_id": request_id, "cached": True}
+            # An identical upload is already being analysed; its job will notify this request too
+            return {"message": "AI analysis joined an identical in-flight job", "request_id": request_id, "cached": False}
+    else:
+        content_hash = None
+
+    try:
+        # submit() may post a queue-position webhook, so keep it off the event loop
+        position = await run_in_threadpool(
+            job_queue.submit,
+            request_id,
+            run_analysis_pipeline_ai, 
+            file_path, 
+            request_id, 
+            user_id, # <-- Pass user_id to the background task
+            ml_models,
+            content_hash,
+            upload.as_dict(),
+            on_position=lambda position: send_progress_update(request_id, user_id, QUEUED_STEP, f"Queued (position {position})"),
+            on_cancel=lambda: cancel_analysis_ai(file_path, request_id, user_id, ml_models, content_hash)
+        )
+    except Exception as e:
+        # The job was not queued: nobody will finish this hash, so its waiters are told now
+        record_stages([upload.as_dict()])
+        os.remove(file_path)
+        if content_hash is not None:
+            waiters = result_cache.release(content_hash)
+            error = "AI service is at capacity" if isinstance(e, QueueFullError) else "Could not queue the AI analysis"
+            await run_in_threadpool(notify_waiters, waiters, 99, "Error", {"error": error})
+        if isinstance(e, QueueFullError):
+            raise _queue_full_error(e.retry_after)
+        raise
+    return {"message": "AI analysis job queued", "request_id": request_id, "queue_position": position}
+
+def _save_batch_uploads(files, batch_dir):
+    recordings = save_uploads([(f.filename, f.file) for f in files], batch_dir, BATCH["max_files"],
+                              BATCH["max_upload_mb"] * 1024 * 1024)
+    if not recordings:
+        raise ValueError("No audio files in the upload")
+    return recordings
+
+@app.post("/predict/batch", status_code=202)
+async def create_batch_job(files: List[UploadFile] = File(...)):
+    """
+    Queues a batch of recordings (several audio files and/or zip archives of them).
+    Results are not sent by webhook; poll GET /predict/batch/{batch_id}.
+    """
+    batch_queue = ml_models["batch_queue"]
+    if batch_queue.is_full():
+        raise _queue_full_error(batch_queue.retry_after_seconds)
+
+    batch_id = uuid.uuid4().hex
+    batch_dir = os.path.join(BATCH["upload_folder"], batch_id)
+    os.makedirs(batch_dir)
+    try:
+        saved = await run_in_threadpool(_save_batch_uploads, files, batch_dir)
+    except BatchTooLargeError as e:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, zipfile.BadZipFile) as e:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    # Result file names (and so visualization images) are unique per batch and position
+    recordings = [(name, path, f"{batch_id}_{i:05d}_{os.path.basename(name)}") for i, (name, path) in enumerate(saved)]
+
+    registry = ml_models["batch_registry"]
+    registry.create(batch_id, len(recordings))
+    try:
+        batch_queue.submit(batch_id, run_batch, batch_id, recordings, batch_dir, ml_models["batch_scorer"], registry,
+                           on_cancel=lambda: cancel_batch(batch_id, batch_dir, registry))
+    except QueueFullError as e:
+        registry.discard(batch_id)
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        raise _queue_full_error(e.retry_after)
+    return {"message": "AI batch analysis queued", "batch_id": batch_id, "files": len(recordings),
+            "status_url": f"/predict/batch/{batch_id}"}
+
+@app.get("/predict/batch/{batch_id}")
+async def get_batch_job(batch_id: str, format: str = "json"):
+    """Status and results so far of a batch, as JSON or (format=csv) one CSV row per recording."""
+    batch = ml_models["batch_registry"].get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if format == "csv":
+        return Response(results_csv(batch["results"], MODEL["class_names"]), media_type="text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="batch_{batch_id}.csv"'})
+    return batch
+
+@app.get("/static_predictions/{img_name}")
+async def get_visualization(img_name: str):
+    if "visualizer" in ml_models:
+        # Renders on first access; run off the event loop since drawing is CPU-bound
+        img_path = await run_in_threadpool(ml_models["visualizer"].get_path, img_name)
+    else:
+        img_path = os.path.join(VISUALIZATION["static_folder"], os.path.basename(img_name))
+    if not img_path or not os.path.exists(img_path):
+        raise HTTPException(status_code=404, detail="Visualization not found")
+    return FileResponse(img_path, media_type="image/png")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving HTTP."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: models are loaded and the warm-up run has completed."""
+    status = ml_models["warmup"].status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: per-stage wall time, CPU time and peak RSS histograms, plus a few gauges."""
+    job_queue = ml_models["job_queue"].stats()
+    gauges = [
+        ("process_resident_memory_bytes", "Resident memory size in bytes.", rss_mb() * 1024 * 1024),
+        ("cognivoice_job_queue_queued", "Analysis jobs waiting for a worker.", job_queue["queued"]),
+        ("cognivoice_job_queue_busy_workers", "Analysis workers running a job.", job_queue["busy_workers"]),
+        ("cognivoice_webhooks_pending", "Progress updates waiting to be delivered.", ml_models["webhooks"].stats()["pending_requests"]),
+    ]
+    return Response(render_metrics(gauges), media_type="text/plain; version=0.0.4")
 
-    return {"message": "AI analysis job queued", "request_id": request_id}
\ No newline at end of file
+@app.get("/stats")
+async def get_stats():
+    stats = {"job_queue": ml_models["job_queue"].stats(), "webhooks": ml_models["webhooks"].stats()}
+    stats["batches"] = dict(ml_models["batch_registry"].stats(), queue=ml_models["batch_queue"].stats())
+    if "scheduler" in ml_models:
+        stats["inference_scheduler"] = ml_models["scheduler"].stats()
+    if "result_cache" in ml_models:
+        stats["result_cache"] = ml_models["result_cache"].stats()
+    if "process_pool" in ml_models:
+        stats["process_pool"] = {"workers": ml_models["process_pool"].num_workers, "restarts": ml_models["process_pool"].restarts}
+    stats["startup"] = ml_models["startup"].as_dict()
+    stats["warmup"] = ml_models["warmup"].status()
+    preprocessor = ml_models.get("preprocessor")
+    if preprocessor is not None and preprocessor.diarizer is not None:
+        stats["diarization"] = preprocessor.diarizer.stats()
+    else:
+        stats["diarization"] = {"enabled": PREPROCESSING.get("diarization_enabled", False)}
+    return stats
\ No newline at end of file
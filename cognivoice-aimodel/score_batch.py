@@ -0,0 +1,84 @@
+"""
+Scores a directory of recordings offline with the service's models and writes
+one row per recording (prediction, confidence, votes, speech features) to CSV
+or Parquet.
+
+    python score_batch.py RECORDINGS_DIR --output results.csv [--workers 4] [--processes] [--images DIR]
+
+The Preprocessor (Demucs) and the predictor are loaded once. Decoding,
+denoising and log-mel extraction of upcoming recordings run on --workers
+threads sharing that Preprocessor (or, with --processes, in worker processes
+with one each) while inference runs on the recordings already extracted.
+CSV rows are written as they are scored; Parquet (needs pyarrow) at the end.
+"""
+import os
+import time
+import logging
+import argparse
+import joblib
+from config_ai import MODEL, FEATURES, PREPROCESSING, INFERENCE, VISUALIZATION, BATCH, EXECUTION, DEVICE, HF_AUTH_TOKEN
+from services.preprocessing_pipeline import Preprocessor
+from services.denoiser import DemucsDenoiser
+from services.prediction_pipeline import load_predictor
+from services.process_pool import FeatureExtractionPool
+from services.early_exit import SequentialVote
+from services.batch_scoring import BatchScorer, ResultsWriter, find_recordings, result_columns, result_row
+
+logger = logging.getLogger(__name__)
+
+def load_models(workers, processes):
+    """The models of a service start-up (see main.py), without the webhook/queue/cache machinery."""
+    ml_models = {}
+    ml_models["scaler"] = joblib.load(MODEL["scaler_path"]) if os.path.exists(MODEL["scaler_path"]) else None
+    ml_models["predictor"] = load_predictor(MODEL, DEVICE, scaler=ml_models["scaler"])
+    ml_models["early_exit"] = SequentialVote.from_config(INFERENCE["early_exit"])
+    if processes:
+        execution_config = dict(EXECUTION, process_workers=workers)
+        ml_models["process_pool"] = FeatureExtractionPool.from_config(execution_config, HF_AUTH_TOKEN, DEVICE, PREPROCESSING,
+                                                                      FEATURES, VISUALIZATION)
+        ml_models["process_pool"].preload()
+    else:
+        denoiser = DemucsDenoiser.from_config(PREPROCESSING, DEVICE)
+        ml_models["preprocessor"] = Preprocessor(HF_AUTH_TOKEN, DEVICE, PREPROCESSING, denoiser=denoiser)
+    return ml_models
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='Directory searched recursively for audio files')
+    parser.add_argument('--output', required=True, help='Results file (.csv or .parquet)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None, help='Defaults to the output extension')
+    parser.add_argument('--workers', type=int, default=BATCH["extract_workers"], help='Concurrent feature extractions')
+    parser.add_argument('--processes', action='store_true', help='Extract features in worker processes instead of threads')
+    parser.add_argument('--prefetch', type=int, default=BATCH["prefetch"], help='Extracted recordings waiting for inference')
+    parser.add_argument('--images', default=None, help='Visualization PNGs (default: <output name>_images next to the output)')
+    args = parser.parse_args()
+
+    fmt = args.format or ('parquet' if args.output.lower().endswith('.parquet') else 'csv')
+    image_dir = args.images or os.path.splitext(args.output)[0] + '_images'
+    # Result (and image) names keep the sub-directory, so equal file names in different folders do not collide
+    recordings = [(name, path, name.replace(os.sep, '__')) for name, path in find_recordings(args.directory)]
+    if not recordings:
+        raise SystemExit(f"No audio files found under {args.directory}")
+
+    # Opened first, so a missing Parquet dependency fails before the models are loaded
+    writer = ResultsWriter(args.output, result_columns(MODEL["class_names"]), fmt)
+    ml_models = load_models(args.workers, args.processes)
+    scorer = BatchScorer(ml_models, MODEL, FEATURES, image_dir, DEVICE, extract_workers=args.workers, prefetch=args.prefetch,
+                         viz_max_columns=VISUALIZATION.get("max_columns", 2400))
+    start, failed = time.perf_counter(), 0
+    try:
+        for i, (name, result) in enumerate(scorer.score(recordings), start=1):
+            writer.write(result_row(name, result, MODEL["class_names"]))
+            failed += 'error' in result
+            logger.info(f"[{i}/{len(recordings)}] {name}: {result.get('finalPrediction') or result.get('error')}")
+    finally:
+        writer.close()
+        if "process_pool" in ml_models:
+            ml_models["process_pool"].shutdown()
+    elapsed = time.perf_counter() - start
+    logger.info(f"Scored {len(recordings)} recording(s) ({failed} failed) in {elapsed:.1f}s "
+                f"({len(recordings) / elapsed * 60:.1f}/min); results in {args.output}, images in {image_dir}")
+
+if __name__ == '__main__':
+    main()
@@ -2,52 +2,26 @@ import logging
 import shutil
 import requests
 import os
-import librosa
+import tempfile
 import numpy as np
-from config_ai import MODEL, FEATURES, PREPROCESSING, DEVICE # <-- Import config
-from .prediction_pipeline import predict_from_audio
+import soundfile as sf
+from config_ai import MODEL, FEATURES, PREPROCESSING, VISUALIZATION, DEVICE, DEBUG # <-- Import config
+from .prediction_pipeline import predict_from_audio, predict_from_segments, process_audio_to_logmel_segments, predict_segment_probabilities, shared_image_name, RENDERERS
+from .spectral_features import SpectralFeatures, load_waveform
+from .speech_features import extract_speech_features
+from .warmup import synthetic_clip
+from .instrumentation import StageTrace, stage, tracing, not_recorded
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def calculate_speech_features_from_audio(audio_path):
+# Progress step used while a job waits in the JobQueue, before step 0 starts
+QUEUED_STEP = -1
+
+def calculate_speech_features_from_audio(audio):
     try:
-        y, sr = librosa.load(audio_path, sr=22050)
-        intervals = librosa.effects.split(y, top_db=20)
-        
-        # Pause Frequency
-        if len(intervals) > 1:
-            pauses = [ (intervals[i+1][0] - intervals[i][1]) / sr for i in range(len(intervals)-1) if (intervals[i+1][0] - intervals[i][1]) / sr > 0.15 ]
-            total_duration = len(y) / sr
-            pause_freq = len(pauses) / (total_duration / 60) if total_duration > 0 else 0
-            pause_freq_norm = min(pause_freq / 40, 1.0)
-        else:
-            pause_freq_norm = 0.1
-        
-        # Speech Rate
-        speech_duration = sum((e - s) / sr for s, e in librosa.effects.split(y, top_db=25))
-        if speech_duration > 0:
-            onsets = librosa.onset.onset_detect(y=y, sr=sr, units='frames')
-            words = len(onsets) / 1.4
-            wpm = (words / speech_duration) * 60
-            speech_rate_norm = min((wpm - 50) / 200, 1.0) if wpm >= 100 else wpm / 200
-        else:
-            speech_rate_norm = 0.3
-            
-        # Vocabulary & Fluency Proxies
-        centroid_var = np.var(librosa.feature.spectral_centroid(y=y, sr=sr)[0])
-        mfcc_var = np.mean(np.var(librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13), axis=1))
-        vocab_complexity_norm = np.clip((centroid_var / 1000000 + mfcc_var / 50) / 3, 0, 1)
-        
-        zcr_stability = 1 - np.std(librosa.feature.zero_crossing_rate(y)[0])
-        flux = np.sum(np.diff(np.abs(librosa.stft(y)), axis=1)**2, axis=0)
-        flux_smoothness = 1 - (np.std(flux) / (np.mean(flux) + 1e-8))
-        semantic_fluency_norm = np.clip((max(zcr_stability, 0) + max(flux_smoothness, 0)) / 2, 0, 1)
-
-        features = {
-            'pauseFrequency': float(round(np.clip(pause_freq_norm, 0.1, 0.9), 2)),
-            'speechRate': float(round(np.clip(speech_rate_norm, 0.2, 0.9), 2)),
-            'vocabularyComplexity': float(round(np.clip(vocab_complexity_norm, 0.3, 0.8), 2)),
-            'semanticFluency': float(round(np.clip(semantic_fluency_norm, 0.3, 0.9), 2))
-        }
+        with stage("speech_features"):
+            # `audio` is the decoded upload ((y, sr) buffer) or its path; resampled only if its rate differs
+            y = load_waveform(audio, FEATURES['speech_sample_rate'])
+            features = extract_speech_features(y, FEATURES['speech_sample_rate'])
         logging.info(f"Calculated speech features: {features}")
         return features
     except Exception as e:
@@ -55,56 +29,214 @@ def calculate_speech_features_from_audio(audio_path):
         return {'pauseFrequency': 0.45, 'speechRate': 0.65, 'vocabularyComplexity': 0.55, 'semanticFluency': 0.62}
 
 
+# Set at startup (see main.py); without a dispatcher, updates are posted inline
+_webhook_dispatcher = None
+
+def use_webhook_dispatcher(dispatcher):
+    global _webhook_dispatcher
+    _webhook_dispatcher = dispatcher
+
+def progress_webhook_url():
+    return f"{os.getenv('FLASK_BACKEND_URL')}/internal/progress-update"
+
 def send_progress_update(request_id: str, user_id: int, step: int, message: str, is_final: bool = False, result: dict = None): # <-- Accept user_id
-    webhook_url = f"{os.getenv('FLASK_BACKEND_URL')}/internal/progress-update"
+    webhook_url = progress_webhook_url()
     payload = {
         "request_id": request_id,
         "user_id": user_id, # <-- Include user_id in the webhook
         "secret_key": os.getenv('INTERNAL_API_SECRET'),
         "update": {"step": step, "message": message, "is_final": is_final, "result": result}
     }
+    if _webhook_dispatcher is not None:
+        # Queued for the background sender; superseded intermediate steps are coalesced
+        _webhook_dispatcher.enqueue(request_id, payload, is_final=is_final)
+        return
     try:
-        requests.post(webhook_url, json=payload, timeout=5)
+        with stage("webhook"):
+            requests.post(webhook_url, json=payload, timeout=5)
     except requests.RequestException as e:
         logging.error(f"[{request_id}] CRITICAL: Could not send webhook to Flask! Error: {e}")
 
+def result_for_upload(result, audio_path):
+    """
+    A shared result (cache hit or deduplicated job) named after the upload it
+    answers. Its visualizationUrl is already neutral (see shared_image_name).
+    """
+    return dict(result, fileName=f"{os.path.splitext(os.path.basename(audio_path))[0]}_final.wav")
+
+def notify_waiters(waiters, step, message, result):
+    """
+    Sends a final update to requests that joined an identical in-flight job
+    (see ResultCache); each successful result is named after the waiter's own upload.
+    """
+    for waiter_id, waiter_user_id, waiter_path in waiters:
+        waiter_result = result if 'error' in result else result_for_upload(result, waiter_path)
+        send_progress_update(waiter_id, waiter_user_id, step, message, is_final=True, result=waiter_result)
+
+def cancel_analysis_ai(audio_path, request_id, user_id, ml_models, content_hash=None):
+    """For a job dropped from the queue before it ran: the error final to it and its waiters, and its upload removed."""
+    error_result = {"error": "AI service shut down before the analysis started"}
+    if content_hash is not None:
+        notify_waiters(ml_models["result_cache"].release(content_hash), 99, "Error", error_result)
+    send_progress_update(request_id, user_id, 99, "Error", is_final=True, result=error_result)
+    if os.path.exists(audio_path):
+        os.remove(audio_path)
+
+def share_result(result_cache, content_hash, result, request_id):
+    """
+    Caches a successful result and sends it to the identical uploads that joined
+    this job. Failures (e.g. a locked or full SQLite file) are only logged: the
+    job itself succeeded.
+    """
+    try:
+        waiters = result_cache.put(content_hash, result)
+    except Exception as e:
+        logging.error(f"[{request_id}] Could not cache the AI result: {e}", exc_info=True)
+        waiters = result_cache.release(content_hash)
+    try:
+        notify_waiters(waiters, 4, "Complete", result)
+    except Exception as e:
+        logging.error(f"[{request_id}] Could not send the AI result to identical uploads: {e}", exc_info=True)
+
+def send_cached_result(request_id, user_id, result, audio_path):
+    """Delivers a result-cache hit through the usual final webhook, named after this upload."""
+    result = result_for_upload(result, audio_path)
+    logging.info(f"[{request_id}] Serving cached AI result.")
+    send_progress_update(request_id, user_id, 4, "Complete", is_final=True, result=result)
+
+def warm_up_pipeline(ml_models, duration_s=12, sample_rate=44100):
+    """
+    Pushes a synthetic clip through every stage of an analysis job (preprocessing,
+    speech features, log-mel, inference, rendering) without webhooks or stored
+    results, so kernel selection, allocator growth and librosa's filterbank/numba
+    caches are paid before the first real request.
+    """
+    clip = synthetic_clip(duration_s, sample_rate)
+    # First-run costs would skew the stage histograms
+    with not_recorded(), tempfile.TemporaryDirectory(prefix="warmup_") as tmp_dir:
+        if ml_models.get("process_pool") is not None:
+            clip_path = os.path.join(tmp_dir, "warmup.wav")
+            sf.write(clip_path, clip, sample_rate)
+            extracted = ml_models["process_pool"].warm_up(clip_path)
+            segments, spectral = extracted["segments"], extracted["visualization"]
+        else:
+            clean_audio = ml_models["preprocessor"].run_full_pipeline_in_memory(clip, sample_rate)
+            calculate_speech_features_from_audio((clip, sample_rate))
+            spectral = SpectralFeatures.from_audio(clean_audio, FEATURES)
+            segments = process_audio_to_logmel_segments(spectral, FEATURES)
+        if segments is None:
+            raise RuntimeError("Warm-up clip produced no log-mel segments")
+
+        probabilities = predict_segment_probabilities(segments, ml_models["predictor"], ml_models["scaler"], MODEL, DEVICE,
+                                                      scheduler=ml_models.get("scheduler"))
+        # One full-size batch as well, so batched kernels and buffers reach their steady-state sizes
+        full_batch = np.resize(segments, (MODEL.get("inference_batch_size", 16),) + segments.shape[1:]).astype(np.float32)
+        predict_segment_probabilities(full_batch, ml_models["predictor"], ml_models["scaler"], MODEL, DEVICE)
+
+        predictions = (probabilities > 0.5).astype(int).tolist()
+        RENDERERS[VISUALIZATION["renderer"]](spectral.spectrogram_db, spectral.sr, spectral.hop_length, predictions, 0,
+                                             os.path.join(tmp_dir, "warmup.png"))
+
+def finalize_result(result, speech_features):
+    """Adds the speech features and the risk level to a prediction result."""
+    result["speechfeatures"] = speech_features
+    risk_level = 'low'
+    if result['finalPrediction'] == 'Dementia':
+            confidence = float(result.get('confidence', 0))
+            if confidence > 0.75: risk_level = 'high'
+            elif confidence >= 0.5: risk_level = 'moderate'
+    result['riskLevel'] = risk_level
+    return result
+
 # This is your run_analysis_pipeline, refactored for FastAPI
-def run_analysis_pipeline_ai(audio_path, request_id,user_id, ml_models):
+def run_analysis_pipeline_ai(audio_path, request_id,user_id, ml_models, content_hash=None, upload_stage=None):
+    # Per-stage wall/CPU time and peak RSS of this job (from the upload on); feeds the /metrics histograms
+    trace = StageTrace()
+    if upload_stage is not None:
+        trace.add(upload_stage)
+    with tracing(trace):
+        _run_analysis_pipeline(audio_path, request_id, user_id, ml_models, content_hash, trace)
+
+def _run_analysis_pipeline(audio_path, request_id, user_id, ml_models, content_hash, trace):
     try:
         send_progress_update(request_id,user_id, 0, "Preprocessing audio...")
         temp_folder_path = 'temp_processing_ai'
-        clean_audio_path = ml_models["preprocessor"].run_full_pipeline(audio_path,temp_folder_path)
-        
-        send_progress_update(request_id,user_id, 1, "Feature extraction...")
-        speech_features = calculate_speech_features_from_audio(audio_path) 
-        
-        send_progress_update(request_id,user_id, 2, "Speech pattern analysis...")
-        result = predict_from_audio(
-            clean_audio_path,
-            ml_models["predictor"],
-            ml_models["scaler"],
-            MODEL,
-            FEATURES,
-            'static_predictions_ai', # Define a folder for visualization images
-            DEVICE
-        )
+        base_name = os.path.splitext(os.path.basename(audio_path))[0]
+        file_name = f"{base_name}_final.wav"
+        # A cacheable result may be served to other users' uploads, so its image must not carry this request's name
+        image_name = shared_image_name(content_hash) if content_hash is not None else None
+        debug_dir = os.path.join(temp_folder_path, base_name) if DEBUG else None
+        if ml_models.get("process_pool") is not None:
+            # Preprocessing and feature extraction run in a worker process; only inference stays here
+            extracted = ml_models["process_pool"].extract(audio_path, debug_dir)
+            send_progress_update(request_id,user_id, 1, "Feature extraction...")
+            speech_features = extracted["speech_features"]
+
+            send_progress_update(request_id,user_id, 2, "Speech pattern analysis...")
+            result = predict_from_segments(
+                extracted["segments"],
+                extracted["visualization"],
+                ml_models["predictor"],
+                ml_models["scaler"],
+                MODEL,
+                FEATURES,
+                VISUALIZATION["static_folder"],
+                DEVICE,
+                file_name,
+                scheduler=ml_models.get("scheduler"),
+                visualizer=ml_models.get("visualizer"),
+                early_exit=ml_models.get("early_exit"),
+                image_name=image_name
+            )
+        else:
+            preprocessor = ml_models["preprocessor"]
+            if PREPROCESSING.get("in_memory", True):
+                # Decode once and hand waveform buffers between stages; WAVs only when debugging
+                raw_audio = preprocessor.load_audio(audio_path)
+                clean_audio = preprocessor.run_full_pipeline_in_memory(*raw_audio, debug_dir=debug_dir)
+            else:
+                clean_audio_path = preprocessor.run_full_pipeline(audio_path,temp_folder_path)
+                raw_audio, clean_audio = audio_path, clean_audio_path
+            
+            send_progress_update(request_id,user_id, 1, "Feature extraction...")
+            speech_features = calculate_speech_features_from_audio(raw_audio)
+            
+            send_progress_update(request_id,user_id, 2, "Speech pattern analysis...")
+            # One spectral feature set for the clean audio, shared by log-mel and visualization
+            # (or a block-wise LogMelStream for long recordings)
+            result = predict_from_audio(
+                clean_audio,
+                ml_models["predictor"],
+                ml_models["scaler"],
+                MODEL,
+                FEATURES,
+                VISUALIZATION["static_folder"], # Folder for visualization images
+                DEVICE,
+                file_name=file_name,
+                scheduler=ml_models.get("scheduler"),
+                visualizer=ml_models.get("visualizer"),
+                early_exit=ml_models.get("early_exit"),
+                image_name=image_name
+            )
         if 'error' in result: raise Exception(result['error'])
         
         send_progress_update(request_id,user_id, 3, "Generating insights...")
-        result["speechfeatures"] = speech_features
-        risk_level = 'low'
-        if result['finalPrediction'] == 'Dementia':
-                confidence = float(result.get('confidence', 0))
-                if confidence > 0.75: risk_level = 'high'
-                elif confidence >= 0.5: risk_level = 'moderate'
-        result['riskLevel'] = risk_level
+        finalize_result(result, speech_features)
         
-        send_progress_update(request_id,user_id, 4, "Complete", is_final=True, result=result)
+        if content_hash is not None:
+            # Before the final update: once "Complete" is queued, nothing may turn this job into an error
+            share_result(ml_models["result_cache"], content_hash, result, request_id)
+
+        # The breakdown goes out with this job's webhook only, never into the result cache
+        final_result = dict(result, stages=trace.as_list()) if DEBUG else result
+        send_progress_update(request_id,user_id, 4, "Complete", is_final=True, result=final_result)
         logging.info(f"[{request_id}] AI pipeline completed successfully.")
     except Exception as e:
         logging.error(f"[{request_id}] AI Pipeline error: {e}", exc_info=True)
         error_result = {"error": str(e)}
-        send_progress_update(request_id, 99, "Error", is_final=True, result=error_result)
+        if content_hash is not None:
+            notify_waiters(ml_models["result_cache"].release(content_hash), 99, "Error", error_result)
+        send_progress_update(request_id, user_id, 99, "Error", is_final=True, result=error_result)
     finally:
         # This cleanup is important for a long-running service
         if os.path.exists(audio_path):
@@ -0,0 +1,300 @@
+import os
+import io
+import csv
+import time
+import shutil
+import zipfile
+import logging
+import itertools
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from .analysis_service_ai import finalize_result
+from .prediction_pipeline import predict_from_segments
+from .process_pool import extract_features
+from .instrumentation import StageTrace, tracing
+
+logger = logging.getLogger(__name__)
+
+# Decoded by librosa.load (soundfile, or audioread/ffmpeg for compressed formats)
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3', '.m4a', '.aac', '.webm', '.opus')
+SPEECH_FEATURES = ('pauseFrequency', 'speechRate', 'vocabularyComplexity', 'semanticFluency')
+
+class BatchTooLargeError(Exception):
+    pass
+
+def is_audio_file(name):
+    return os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+
+def find_recordings(directory):
+    """(path relative to `directory`, full path) of every audio file below it, sorted."""
+    recordings = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if is_audio_file(name) and not name.startswith('.'):
+                path = os.path.join(root, name)
+                recordings.append((os.path.relpath(path, directory), path))
+    return recordings
+
+def save_uploads(uploads, dest_dir, max_files, max_bytes):
+    """
+    Writes `(filename, file object)` uploads into `dest_dir` and returns
+    `(original name, saved path)` per recording. Zip archives are unpacked (audio
+    members only). Saved files get generated names, so neither upload names nor
+    archive member names are ever used as paths.
+    """
+    recordings, remaining_bytes = [], max_bytes
+
+    def save(name, source):
+        nonlocal remaining_bytes
+        if len(recordings) >= max_files:
+            raise BatchTooLargeError(f"A batch holds at most {max_files} recordings")
+        path = os.path.join(dest_dir, f"{len(recordings):05d}{os.path.splitext(name)[1].lower()}")
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                remaining_bytes -= len(chunk)
+                if remaining_bytes < 0:
+                    raise BatchTooLargeError(f"A batch holds at most {max_bytes // (1024 * 1024)} MB of audio")
+                f.write(chunk)
+        recordings.append((name, path))
+
+    for filename, fileobj in uploads:
+        if filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(fileobj) as archive:
+                for member in archive.infolist():
+                    if member.is_dir() or not is_audio_file(member.filename) or member.filename.startswith('__MACOSX/'):
+                        continue
+                    with archive.open(member) as source:
+                        save(member.filename, source)
+        elif is_audio_file(filename):
+            save(filename, fileobj)
+        else:
+            raise ValueError(f"Unsupported file type: {filename}")
+    return recordings
+
+class BatchScorer:
+    """
+    Scores many recordings with the loaded models, pipelined across files:
+    `extract_workers` threads decode, denoise and extract log-mel segments of
+    upcoming recordings (through the process pool when there is one) while the
+    consuming thread runs inference on those already extracted. At most
+    `prefetch` extracted recordings wait for inference, which bounds memory.
+    """
+    def __init__(self, ml_models, model_config, features_config, static_folder, device, extract_workers=2, prefetch=4,
+                 viz_max_columns=2400):
+        self.ml_models = ml_models
+        self.model_config = model_config
+        self.features_config = features_config
+        self.static_folder = static_folder
+        self.device = device
+        self.extract_workers = extract_workers
+        self.prefetch = prefetch
+        self.viz_max_columns = viz_max_columns
+
+    @classmethod
+    def from_config(cls, ml_models, batch_config, model_config, features_config, viz_config, device):
+        pool = ml_models.get("process_pool")
+        return cls(
+            ml_models,
+            model_config,
+            features_config,
+            viz_config["static_folder"],
+            device,
+            # With a process pool the threads only wait on it, so one per process keeps it full
+            extract_workers=pool.num_workers if pool is not None else batch_config["extract_workers"],
+            prefetch=batch_config["prefetch"],
+            viz_max_columns=viz_config.get("max_columns", 2400),
+        )
+
+    def _extract(self, audio_path):
+        # Stage timings are per recording, as for single jobs
+        with tracing(StageTrace()):
+            pool = self.ml_models.get("process_pool")
+            if pool is not None:
+                return pool.extract(audio_path)
+            return extract_features(self.ml_models["preprocessor"], audio_path, self.features_config, self.viz_max_columns)
+
+    def _predict(self, extracted, file_name):
+        result = predict_from_segments(
+            extracted["segments"],
+            extracted["visualization"],
+            self.ml_models["predictor"],
+            self.ml_models["scaler"],
+            self.model_config,
+            self.features_config,
+            self.static_folder,
+            self.device,
+            file_name,
+            scheduler=self.ml_models.get("scheduler"),
+            visualizer=self.ml_models.get("visualizer"),
+            early_exit=self.ml_models.get("early_exit"),
+        )
+        return result if 'error' in result else finalize_result(result, extracted["speech_features"])
+
+    def score(self, recordings):
+        """
+        Yields `(name, result)` for every `(name, audio path, result file name)`
+        in `recordings`, in order. A recording that fails gets {'error': ...}
+        instead of stopping the batch.
+        """
+        recordings = iter(recordings)
+        with ThreadPoolExecutor(self.extract_workers, thread_name_prefix="batch-extract") as executor:
+            pending = deque((item, executor.submit(self._extract, item[1]))
+                            for item in itertools.islice(recordings, self.extract_workers + self.prefetch))
+            while pending:
+                (name, _, file_name), future = pending.popleft()
+                following = next(recordings, None)
+                if following is not None:
+                    pending.append((following, executor.submit(self._extract, following[1])))
+                try:
+                    extracted = future.result()
+                    with tracing(StageTrace()):
+                        result = self._predict(extracted, file_name)
+                except Exception as e:
+                    logger.error(f"Batch scoring failed for {name}: {e}", exc_info=True)
+                    result = {'error': str(e) or type(e).__name__}
+                yield name, result
+
+def result_columns(class_names):
+    return (['file', 'finalPrediction', 'confidence', 'riskLevel'] + [f'votes{name}' for name in class_names]
+            + ['segmentsEvaluated', 'segmentsTotal'] + list(SPEECH_FEATURES) + ['image', 'error'])
+
+def result_row(name, result, class_names):
+    """One flat CSV/Parquet row for a recording's result (mostly empty, with the error, if it failed)."""
+    votes = result.get('voteCounts', {})
+    speech_features = result.get('speechfeatures', {})
+    row = {
+        'file': name,
+        'finalPrediction': result.get('finalPrediction'),
+        'confidence': float(result['confidence']) if 'confidence' in result else None,
+        'riskLevel': result.get('riskLevel'),
+    }
+    row.update({f'votes{class_name}': votes.get(class_name) for class_name in class_names})
+    row['segmentsEvaluated'] = result.get('segmentsEvaluated')
+    row['segmentsTotal'] = result.get('segmentsTotal')
+    row.update({key: speech_features.get(key) for key in SPEECH_FEATURES})
+    row['image'] = os.path.basename(result.get('visualizationUrl') or '') or None
+    row['error'] = result.get('error')
+    return row
+
+def results_csv(results, class_names):
+    """CSV text of `[{"file": name, "result": result}]`, as kept by BatchRegistry."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=result_columns(class_names))
+    writer.writeheader()
+    writer.writerows(result_row(entry["file"], entry["result"], class_names) for entry in results)
+    return out.getvalue()
+
+class ResultsWriter:
+    """
+    Result rows to a CSV file, written as they come so an interrupted run keeps
+    what it scored, or to a Parquet file on close (needs pyarrow).
+    """
+    def __init__(self, path, columns, fmt="csv"):
+        self.path = path
+        self.columns = columns
+        self.fmt = fmt
+        self._rows = []
+        if fmt == "parquet":
+            # Imported up front so a missing pyarrow fails before any scoring
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError as e:
+                raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)") from e
+            self._file = None
+        else:
+            self._file = open(path, 'w', newline='')
+            self._writer = csv.DictWriter(self._file, fieldnames=columns)
+            self._writer.writeheader()
+
+    def write(self, row):
+        if self._file is None:
+            self._rows.append(row)
+            return
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pylist(self._rows) if self._rows else pa.table({column: [] for column in self.columns})
+        pq.write_table(table, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class BatchRegistry:
+    """
+    Status and results of /predict/batch runs, kept in memory. Beyond `keep`
+    finished batches, the oldest finished ones are forgotten.
+    """
+    def __init__(self, keep=50):
+        self.keep = keep
+        self._batches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, batch_id, total):
+        with self._lock:
+            self._batches[batch_id] = {
+                "batch_id": batch_id, "status": "queued", "total": total, "completed": 0, "failed": 0,
+                "created": time.time(), "finished": None, "error": None, "results": [],
+            }
+
+    def discard(self, batch_id):
+        with self._lock:
+            self._batches.pop(batch_id, None)
+
+    def start(self, batch_id):
+        with self._lock:
+            self._batches[batch_id]["status"] = "running"
+
+    def add(self, batch_id, name, result):
+        with self._lock:
+            batch = self._batches[batch_id]
+            batch["results"].append({"file": name, "result": result})
+            batch["failed" if 'error' in result else "completed"] += 1
+
+    def finish(self, batch_id, error=None):
+        with self._lock:
+            batch = self._batches[batch_id]
+            batch["status"], batch["error"], batch["finished"] = "failed" if error else "done", error, time.time()
+            finished = [key for key, b in self._batches.items() if b["finished"] is not None]
+            for key in finished[:max(0, len(finished) - self.keep)]:
+                del self._batches[key]
+
+    def get(self, batch_id):
+        """A snapshot of the batch, or None if it is unknown or was forgotten."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return None if batch is None else dict(batch, results=list(batch["results"]))
+
+    def stats(self):
+        with self._lock:
+            statuses = [batch["status"] for batch in self._batches.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+def run_batch(batch_id, recordings, batch_dir, scorer, registry):
+    """Batch-queue job for one /predict/batch upload: scores every recording, then removes the uploads."""
+    registry.start(batch_id)
+    try:
+        for name, result in scorer.score(recordings):
+            registry.add(batch_id, name, result)
+        registry.finish(batch_id)
+        logger.info(f"[batch {batch_id}] Scored {len(recordings)} recording(s).")
+    except Exception as e:
+        registry.finish(batch_id, error=str(e))
+        raise
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+def cancel_batch(batch_id, batch_dir, registry):
+    """For a batch dropped from the queue before it ran: marked failed, and its uploads removed."""
+    registry.finish(batch_id, error="AI service shut down before the batch started")
+    shutil.rmtree(batch_dir, ignore_errors=True)
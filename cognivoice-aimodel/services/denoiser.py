@@ -0,0 +1,79 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+import librosa
+from demucs.pretrained import get_model
+from demucs.apply import apply_model
+
+logger = logging.getLogger(__name__)
+
+class DemucsDenoiser:
+    """
+    Keeps a Demucs source-separation model resident in memory and extracts the
+    vocals stem from waveforms, so each job only pays for the separation itself.
+    """
+    def __init__(self, model_name, device, segment=None, overlap=0.25, shifts=1, num_workers=0):
+        logger.info(f"Loading Demucs model '{model_name}'...")
+        self.model = get_model(model_name)
+        self.model.to(device)
+        self.model.eval()
+        self.device = device
+        self.segment = segment
+        self.overlap = overlap
+        self.shifts = shifts
+        self.num_workers = num_workers
+        # One long-lived pool instead of letting apply_model create one per call
+        self._pool = ThreadPoolExecutor(num_workers) if num_workers > 0 and device.type == 'cpu' else None
+        self.vocals_index = self.model.sources.index('vocals')
+        logger.info(f"Demucs model loaded (samplerate={self.samplerate}, channels={self.audio_channels}).")
+
+    @classmethod
+    def from_config(cls, pp_config, device):
+        return cls(
+            pp_config["denoiser_model_path"],
+            device,
+            segment=pp_config.get("denoiser_segment"),
+            overlap=pp_config.get("denoiser_overlap", 0.25),
+            shifts=pp_config.get("denoiser_shifts", 1),
+            num_workers=pp_config.get("denoiser_num_workers", 0),
+        )
+
+    @property
+    def samplerate(self):
+        return self.model.samplerate
+
+    @property
+    def audio_channels(self):
+        return self.model.audio_channels
+
+    def separate_vocals(self, y, sr):
+        """
+        Returns the vocals stem of `y` as a float32 array of shape (channels, samples)
+        sampled at `self.samplerate`. `y` may be mono (samples,) or (channels, samples).
+        The whole clip goes through one apply_model call, which holds every stem of
+        it at once, so memory grows with the clip's length (`segment` only bounds the
+        chunks the network sees).
+        """
+        wav = np.atleast_2d(np.asarray(y, dtype=np.float32))
+        if sr != self.samplerate:
+            wav = librosa.resample(wav, orig_sr=sr, target_sr=self.samplerate)
+        if wav.shape[0] == 1 and self.audio_channels > 1:
+            wav = np.repeat(wav, self.audio_channels, axis=0)
+        elif wav.shape[0] > self.audio_channels:
+            wav = wav.mean(axis=0, keepdims=True).repeat(self.audio_channels, axis=0)
+
+        mix = torch.from_numpy(np.ascontiguousarray(wav))
+        # Same normalisation as `demucs.separate`
+        ref = mix.mean(0)
+        ref_mean, ref_std = ref.mean(), ref.std() + 1e-8
+        mix = (mix - ref_mean) / ref_std
+
+        kwargs = dict(shifts=self.shifts, split=True, overlap=self.overlap, progress=False,
+                      device=self.device, num_workers=self.num_workers, segment=self.segment)
+        if self._pool is not None:
+            kwargs["pool"] = self._pool
+        with torch.no_grad():
+            sources = apply_model(self.model, mix[None], **kwargs)[0]
+        vocals = sources[self.vocals_index] * ref_std + ref_mean
+        return vocals.cpu().numpy().astype(np.float32, copy=False)
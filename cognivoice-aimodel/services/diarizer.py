@@ -0,0 +1,72 @@
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SpeakerDiarizer:
+    """
+    Keeps only the dominant speaker of a recording. The pyannote pipeline (a heavy
+    import plus a model download) is loaded on first use rather than at startup,
+    and only if diarization is enabled in PREPROCESSING.
+    """
+    def __init__(self, hf_token, device, model_name="pyannote/speaker-diarization-3.1", num_speakers=None):
+        self.hf_token = hf_token
+        self.device = device
+        self.model_name = model_name
+        self.num_speakers = num_speakers
+        self.load_seconds = None
+        self._pipeline = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, pp_config, hf_token, device):
+        return cls(
+            hf_token,
+            device,
+            model_name=pp_config.get("diarization_model", "pyannote/speaker-diarization-3.1"),
+            num_speakers=pp_config.get("num_diarization_speakers"),
+        )
+
+    @property
+    def loaded(self):
+        return self._pipeline is not None
+
+    @property
+    def pipeline(self):
+        if self._pipeline is None:
+            with self._lock:
+                if self._pipeline is None:
+                    start = time.perf_counter()
+                    logger.info("Initializing Speaker Diarization pipeline...")
+                    from pyannote.audio import Pipeline
+                    pipeline = Pipeline.from_pretrained(self.model_name, use_auth_token=self.hf_token)
+                    pipeline.to(self.device)
+                    self.load_seconds = time.perf_counter() - start
+                    self._pipeline = pipeline
+                    logger.info(f"Diarization pipeline loaded in {self.load_seconds:.1f}s.")
+        return self._pipeline
+
+    def dominant_speaker_waveform(self, y, sr):
+        """Concatenates the turns of the speaker with the most talk time; returns the input if none are found."""
+        import torch
+
+        diarization = self.pipeline(
+            {"waveform": torch.from_numpy(np.ascontiguousarray(y, dtype=np.float32)[None]), "sample_rate": sr},
+            num_speakers=self.num_speakers,
+        )
+        talk_time = {}
+        for turn, _, speaker in diarization.itertracks(yield_label=True):
+            talk_time[speaker] = talk_time.get(speaker, 0.0) + turn.end - turn.start
+        if not talk_time:
+            return y, sr
+        dominant_speaker = max(talk_time, key=talk_time.get)
+        turns = [
+            y[int(turn.start * sr):int(turn.end * sr)]
+            for turn, _, speaker in diarization.itertracks(yield_label=True) if speaker == dominant_speaker
+        ]
+        return np.concatenate(turns), sr
+
+    def stats(self):
+        return {"enabled": True, "loaded": self.loaded, "load_seconds": self.load_seconds}
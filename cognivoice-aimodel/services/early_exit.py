@@ -0,0 +1,48 @@
+import math
+import numpy as np
+
+class SequentialVote:
+    """
+    Early stopping for the segment majority vote, as a sequential probability
+    ratio test on the binary votes: H0 "P(dementia vote) = 0.5 - indifference"
+    against H1 "= 0.5 + indifference", with both error rates 1 - confidence.
+    Each vote moves the log-likelihood ratio by the same step, so the test
+    stops once one class leads by `lead_to_stop` votes (and at least
+    `min_segments` were scored). Scoring also stops as soon as the remaining
+    segments could no longer flip the majority, which is exact.
+
+    Segments are scored in `scoring_order`, a fixed shuffle of the recording:
+    neighbouring segments vote alike, so in time order the first few minutes
+    would look like far more independent evidence than they are.
+    """
+    def __init__(self, confidence=0.99, indifference=0.1, min_segments=16):
+        alpha = 1 - confidence
+        step = math.log((0.5 + indifference) / (0.5 - indifference))
+        self.lead_to_stop = math.ceil(math.log((1 - alpha) / alpha) / step)
+        self.confidence = confidence
+        self.indifference = indifference
+        self.min_segments = min_segments
+
+    @classmethod
+    def from_config(cls, early_exit_config):
+        """None when early exit is disabled."""
+        if not early_exit_config.get("enabled"):
+            return None
+        return cls(
+            confidence=early_exit_config["confidence"],
+            indifference=early_exit_config["indifference"],
+            min_segments=early_exit_config["min_segments"],
+        )
+
+    @staticmethod
+    def scoring_order(n_segments):
+        """Deterministic permutation of range(n_segments), so a recording always gets the same result."""
+        return np.random.RandomState(0).permutation(n_segments)
+
+    def should_stop(self, probabilities, n_total=None):
+        """True once the votes in `probabilities` (scored so far) settle the vote over `n_total` segments."""
+        n_scored = len(probabilities)
+        lead = abs(2 * int(np.count_nonzero(probabilities > 0.5)) - n_scored)
+        if n_total is not None and lead > n_total - n_scored:
+            return True
+        return n_scored >= self.min_segments and lead >= self.lead_to_stop
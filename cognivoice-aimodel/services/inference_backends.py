@@ -0,0 +1,96 @@
+import os
+import json
+import logging
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKENDS = ("eager", "torchscript", "onnxruntime")
+TORCHSCRIPT_FILE = "model.ts.pt"
+ONNX_FILE = "model.onnx"
+EXPORT_METADATA_FILE = "export.json"
+
+def _sigmoid(logits):
+    return 1.0 / (1.0 + np.exp(-logits))
+
+class EagerBackend:
+    """Runs the PyTorch module as-is (fp32 or quantized)."""
+    name = "eager"
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+        # The InputScaler folded at load time applies the MinMax scaling inside the model
+        self.scales_input = getattr(model, "input_scaler", None) is not None
+
+    def predict_proba(self, batch):
+        """(B, 3, n_mels, segment_length) float32 array -> B probabilities."""
+        with torch.no_grad():
+            output_logits = self.model(torch.from_numpy(batch).to(self.device))
+            return torch.sigmoid(output_logits).view(-1).cpu().numpy()
+
+class TorchScriptBackend(EagerBackend):
+    """A frozen TorchScript graph, re-optimised for inference (Conv+BN folding, fused kernels) on load."""
+    name = "torchscript"
+
+    def __init__(self, path, device, scales_input):
+        module = torch.jit.load(path, map_location=device)
+        if device.type == "cpu":
+            module = torch.jit.optimize_for_inference(module)
+        super().__init__(module, device)
+        self.scales_input = scales_input
+
+class OnnxRuntimeBackend:
+    """ONNX Runtime on the CPU execution provider with all graph optimisations enabled."""
+    name = "onnxruntime"
+
+    def __init__(self, path, scales_input, intra_op_threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.scales_input = scales_input
+
+    def predict_proba(self, batch):
+        (logits,) = self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})
+        return _sigmoid(logits.reshape(-1)).astype(np.float32, copy=False)
+
+def as_backend(model, device):
+    """Wraps a plain nn.Module so callers can treat every predictor as a backend."""
+    return model if hasattr(model, "predict_proba") else EagerBackend(model, device)
+
+def read_export_metadata(export_dir):
+    path = os.path.join(export_dir, EXPORT_METADATA_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def load_exported_backend(backend, export_dir, device, model_version, intra_op_threads=0):
+    """
+    Loads a TorchScript or ONNX artifact written by export_model.py. Returns None
+    (so the caller can fall back to eager) if it is missing or was exported from
+    a different checkpoint/scaler.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {INFERENCE_BACKENDS}")
+    metadata = read_export_metadata(export_dir)
+    if metadata is None:
+        logger.warning(f"No exported model in {export_dir}; run export_model.py to use the {backend} backend.")
+        return None
+    if metadata.get("model_version") != model_version:
+        logger.warning(f"Exported model in {export_dir} is stale (checkpoint or scaler changed); re-run export_model.py.")
+        return None
+
+    if backend == "torchscript":
+        predictor = TorchScriptBackend(os.path.join(export_dir, TORCHSCRIPT_FILE), device, metadata["scales_input"])
+    else:
+        if device.type != "cpu":
+            logger.warning(f"The onnxruntime backend only uses the CPU execution provider (DEVICE is {device}).")
+        predictor = OnnxRuntimeBackend(os.path.join(export_dir, ONNX_FILE), metadata["scales_input"], intra_op_threads)
+    logger.info(f"Using the {backend} inference backend from {export_dir}.")
+    return predictor
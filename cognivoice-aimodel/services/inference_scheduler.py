@@ -0,0 +1,165 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from .inference_backends import as_backend
+
+logger = logging.getLogger(__name__)
+
+class _Job:
+    """Collects the per-chunk probabilities of one submitted segment array."""
+    def __init__(self, n_segments):
+        self.future = Future()
+        self.probabilities = np.empty(n_segments, dtype=np.float32)
+        self.remaining = n_segments
+        self.lock = threading.Lock()
+
+    def fill(self, offset, probabilities):
+        with self.lock:
+            self.probabilities[offset:offset + len(probabilities)] = probabilities
+            self.remaining -= len(probabilities)
+            done = self.remaining == 0
+        if done and not self.future.done():
+            self.future.set_result(self.probabilities)
+
+class InferenceScheduler:
+    """
+    Dynamic micro-batcher for the CNN-LSTM predictor. Analysis jobs submit their
+    scaled segments; a single worker thread groups segments from concurrent jobs
+    into batches of up to `max_batch_size`, waiting at most `max_wait_ms` for a
+    batch to fill, and routes each probability back to the job that sent it.
+    Once shut down, `submit` raises and work still queued fails instead of
+    leaving its futures unresolved.
+    """
+    def __init__(self, model, device, max_batch_size=32, max_wait_ms=10):
+        self.backend = as_backend(model, device)
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._pending_segments = 0
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._segments = 0
+        self._last_batch_size = 0
+        self._running = True
+        self._submit_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_config(cls, model, device, inference_config):
+        return cls(
+            model,
+            device,
+            max_batch_size=inference_config.get("max_batch_size", 32),
+            max_wait_ms=inference_config.get("max_wait_ms", 10),
+        )
+
+    def submit(self, segments):
+        """Queues an (N, 3, n_mels, segment_length) float32 array; the future resolves to N probabilities."""
+        job = _Job(len(segments))
+        if len(segments) == 0:
+            job.future.set_result(job.probabilities)
+            return job.future
+        with self._submit_lock:
+            if not self._running:
+                raise RuntimeError("Inference scheduler is shut down")
+            with self._stats_lock:
+                self._pending_segments += len(segments)
+            # Oversized submissions are split so every chunk fits in a single batch
+            for offset in range(0, len(segments), self.max_batch_size):
+                self._queue.put((job, offset, segments[offset:offset + self.max_batch_size]))
+        return job.future
+
+    def infer(self, segments):
+        return self.submit(segments).result()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._pending_segments,
+                "batches": self._batches,
+                "segments": self._segments,
+                "max_batch_size": self.max_batch_size,
+                "last_batch_fill_ratio": self._last_batch_size / self.max_batch_size,
+                "mean_batch_fill_ratio": (self._segments / (self._batches * self.max_batch_size)) if self._batches else 0.0,
+            }
+
+    def shutdown(self):
+        with self._submit_lock:
+            self._running = False
+            self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    def _collect_batch(self, first):
+        """Greedily adds queued chunks to `first` until the batch is full or `max_wait` expires."""
+        batch, size = [first], len(first[2])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            if size + len(item[2]) > self.max_batch_size:
+                # Does not fit: it starts the next batch instead
+                return batch, item
+            batch.append(item)
+            size += len(item[2])
+        return batch, None
+
+    def _run(self):
+        carry = None
+        while self._running:
+            first = carry if carry is not None else self._queue.get()
+            if first is None:
+                break
+            batch, carry = self._collect_batch(first)
+            self._run_batch(batch)
+        # Whatever was queued behind the shutdown marker will never run
+        leftover = [carry] if carry is not None else []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                leftover.append(item)
+        error = RuntimeError("Inference scheduler is shut down")
+        for job, _, chunk in leftover:
+            with self._stats_lock:
+                self._pending_segments -= len(chunk)
+            if not job.future.done():
+                job.future.set_exception(error)
+
+    def _run_batch(self, batch):
+        inputs = np.concatenate([chunk for _, _, chunk in batch]) if len(batch) > 1 else batch[0][2]
+        try:
+            probabilities = self.backend.predict_proba(inputs)
+        except Exception as e:
+            logger.error(f"Batched inference failed: {e}", exc_info=True)
+            for job, _, chunk in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            probabilities = None
+
+        with self._stats_lock:
+            self._pending_segments -= len(inputs)
+            self._batches += 1
+            self._segments += len(inputs)
+            self._last_batch_size = len(inputs)
+
+        if probabilities is None:
+            return
+        position = 0
+        for job, offset, chunk in batch:
+            job.fill(offset, probabilities[position:position + len(chunk)])
+            position += len(chunk)
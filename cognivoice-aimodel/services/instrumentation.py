@@ -0,0 +1,228 @@
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from .resource_usage import rss_mb
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages in job order; each one gets a series in every stage histogram
+STAGES = ("upload_write", "denoise", "diarization", "silence_removal", "normalize", "speech_features", "logmel", "scaler",
+          "inference", "visualization", "visualization_render", "webhook")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RSS_BUCKETS = tuple(2 ** i * 1024 * 1024 for i in range(7, 15))  # 128 MiB .. 16 GiB
+
+# RSS is sampled this often while any stage is running
+RSS_SAMPLE_INTERVAL_S = 0.01
+
+class Histogram:
+    """Thread-safe histogram with one label, rendered in the Prometheus text exposition format."""
+    def __init__(self, name, help_text, label, buckets, label_values=()):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        # Known label values are exported from the start, with zero counts
+        self._series = {value: self._empty() for value in label_values}
+        self._lock = threading.Lock()
+
+    def _empty(self):
+        return {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = self._empty()
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._series.items()}
+        for label_value, values in series.items():
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, values["buckets"]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{float(bound)!r}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values["count"]}')
+            lines.append(f'{self.name}_sum{{{label}}} {values["sum"]!r}')
+            lines.append(f'{self.name}_count{{{label}}} {values["count"]}')
+        return "\n".join(lines)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Observed once per job with the job's total for the stage (once per run outside a job)
+STAGE_WALL_SECONDS = Histogram("cognivoice_stage_duration_seconds", "Wall time of each pipeline stage per job.", "stage",
+                               DURATION_BUCKETS, STAGES)
+STAGE_CPU_SECONDS = Histogram("cognivoice_stage_cpu_seconds", "Process CPU time (all threads) while each pipeline stage ran, per job.",
+                              "stage", DURATION_BUCKETS, STAGES)
+STAGE_PEAK_RSS_BYTES = Histogram("cognivoice_stage_peak_rss_bytes", "Highest process RSS sampled while each pipeline stage ran.",
+                                 "stage", RSS_BUCKETS, STAGES)
+HISTOGRAMS = (STAGE_WALL_SECONDS, STAGE_CPU_SECONDS, STAGE_PEAK_RSS_BYTES)
+
+class _RssSampler:
+    """One background thread that samples RSS into every running Stage, and sleeps while none is running."""
+    def __init__(self):
+        self._active = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, stage):
+        with self._cond:
+            self._active.add(stage)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, stage):
+        with self._cond:
+            self._active.discard(stage)
+
+    def _sample(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+                active = list(self._active)
+            current = rss_mb()
+            for stage in active:
+                stage.peak_rss_mb = max(stage.peak_rss_mb, current)
+            time.sleep(RSS_SAMPLE_INTERVAL_S)
+
+_sampler = _RssSampler()
+_trace = contextvars.ContextVar("stage_trace", default=None)
+_recording = contextvars.ContextVar("stage_recording", default=True)
+
+class Stage:
+    """
+    Wall time, process CPU time and peak RSS of a pipeline stage. It can be
+    entered several times (e.g. once per streamed batch) and then reports the
+    totals as one record. CPU time and RSS are process-wide, so they include
+    whatever else the service is doing at the same time.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_mb = 0.0
+        self._start = None
+
+    def __enter__(self):
+        self.peak_rss_mb = max(self.peak_rss_mb, rss_mb())
+        _sampler.add(self)
+        self._start = (time.perf_counter(), time.process_time())
+        return self
+
+    def __exit__(self, *exc):
+        wall_start, cpu_start = self._start
+        self.wall_seconds += time.perf_counter() - wall_start
+        self.cpu_seconds += time.process_time() - cpu_start
+        self.runs += 1
+        _sampler.remove(self)
+        self.peak_rss_mb = max(self.peak_rss_mb, rss_mb())
+
+    def as_dict(self):
+        return {"stage": self.name, "runs": self.runs, "wall_seconds": self.wall_seconds, "cpu_seconds": self.cpu_seconds,
+                "peak_rss_mb": self.peak_rss_mb}
+
+class StageTrace:
+    """
+    Per-job totals of each stage, in the order the stages first ran: wall and
+    CPU time summed over the stage's runs (e.g. one per streamed batch), peak
+    RSS the highest of them.
+    """
+    def __init__(self):
+        self._stages = {}
+
+    def add(self, record):
+        total = self._stages.get(record["stage"])
+        if total is None:
+            self._stages[record["stage"]] = dict(record)
+            return
+        total["runs"] += record["runs"]
+        total["wall_seconds"] += record["wall_seconds"]
+        total["cpu_seconds"] += record["cpu_seconds"]
+        total["peak_rss_mb"] = max(total["peak_rss_mb"], record["peak_rss_mb"])
+
+    def as_list(self):
+        return [dict(record, wall_seconds=round(record["wall_seconds"], 4), cpu_seconds=round(record["cpu_seconds"], 4),
+                     peak_rss_mb=round(record["peak_rss_mb"], 1)) for record in self._stages.values()]
+
+    def records(self):
+        return list(self._stages.values())
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as one run of stage `name`."""
+    timer = Stage(name)
+    try:
+        with timer:
+            yield timer
+    finally:
+        record_stages([timer.as_dict()])
+
+def record_stages(records):
+    """
+    Adds stage records (`Stage.as_dict()`, or a pool process's StageTrace) to
+    the job trace of the calling context, or straight to the histograms outside
+    a job.
+    """
+    if not _recording.get():
+        return
+    trace = _trace.get()
+    for record in records:
+        if trace is not None:
+            trace.add(record)
+        else:
+            _observe(record)
+
+def _observe(record):
+    STAGE_WALL_SECONDS.observe(record["stage"], record["wall_seconds"])
+    STAGE_CPU_SECONDS.observe(record["stage"], record["cpu_seconds"])
+    STAGE_PEAK_RSS_BYTES.observe(record["stage"], record["peak_rss_mb"] * 1024 * 1024)
+
+@contextmanager
+def tracing(trace):
+    """
+    Collects the stages run by the enclosed block (in this thread) into
+    `trace`, then adds each stage's per-job total to the histograms.
+    """
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        if _recording.get():
+            for record in trace.records():
+                _observe(record)
+
+@contextmanager
+def not_recorded():
+    """Stages in the enclosed block are timed but not recorded (e.g. the start-up warm-up run)."""
+    token = _recording.set(False)
+    try:
+        yield
+    finally:
+        _recording.reset(token)
+
+def render_metrics(gauges=()):
+    """
+    The stage histograms plus `(name, help, value)` gauges, in the Prometheus
+    text exposition format (version 0.0.4).
+    """
+    sections = [histogram.render() for histogram in HISTOGRAMS]
+    for name, help_text, value in gauges:
+        sections.append(f"# HELP {name} {help_text}\n# TYPE {name} gauge\n{name} {float(value)!r}")
+    return "\n".join(sections) + "\n"
@@ -0,0 +1,157 @@
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("AI job queue is full")
+        self.retry_after = retry_after
+
+class _QueuedJob:
+    def __init__(self, job_id, fn, args, on_position, on_cancel):
+        self.job_id = job_id
+        self.fn = fn
+        self.args = args
+        self.on_position = on_position
+        self.on_cancel = on_cancel
+
+class JobQueue:
+    """
+    Bounded FIFO of analysis jobs drained by a fixed number of worker threads.
+    `submit` rejects work with QueueFullError once `max_depth` jobs are waiting,
+    and every waiting job is told its position (1 = next to run) when it is
+    queued and each time the queue moves. Jobs still waiting at `shutdown` never
+    run; their `on_cancel` is called instead, so they can report and clean up.
+    """
+    def __init__(self, num_workers=2, max_depth=20, retry_after_seconds=30, shutdown_timeout_seconds=120):
+        self.num_workers = num_workers
+        self.max_depth = max_depth
+        self.retry_after_seconds = retry_after_seconds
+        self.shutdown_timeout = shutdown_timeout_seconds
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._busy = 0
+        self._accepted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._workers = [
+            threading.Thread(target=self._work, name=f"analysis-worker-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @classmethod
+    def from_config(cls, queue_config):
+        return cls(
+            num_workers=queue_config["workers"],
+            max_depth=queue_config["max_depth"],
+            retry_after_seconds=queue_config["retry_after_seconds"],
+            shutdown_timeout_seconds=queue_config.get("shutdown_timeout_seconds", 120),
+        )
+
+    def is_full(self):
+        with self._cond:
+            return len(self._pending) >= self.max_depth
+
+    def submit(self, job_id, fn, *args, on_position=None, on_cancel=None):
+        """Queues `fn(*args)`; returns the job's position or raises QueueFullError."""
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("AI job queue is shut down")
+            if len(self._pending) >= self.max_depth:
+                self._rejected += 1
+                raise QueueFullError(self.retry_after_seconds)
+            self._pending.append(_QueuedJob(job_id, fn, args, on_position, on_cancel))
+            self._accepted += 1
+            position = len(self._pending)
+            # With an idle worker the job starts right away; no need to announce a wait
+            starts_now = self._busy + position <= self.num_workers
+            self._cond.notify()
+        if not starts_now:
+            self._report_position(job_id, position, on_position)
+        return position
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.num_workers,
+                "busy_workers": self._busy,
+                "queued": len(self._pending),
+                "max_depth": self.max_depth,
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+            }
+
+    def shutdown(self):
+        """
+        Cancels every job still waiting, then waits up to `shutdown_timeout`
+        seconds for the running ones to finish, so they can still send their
+        results before the services they use are torn down.
+        """
+        with self._cond:
+            self._running = False
+            cancelled = list(self._pending)
+            self._pending.clear()
+            self._cancelled += len(cancelled)
+            self._cond.notify_all()
+        if cancelled:
+            logger.warning(f"Cancelling {len(cancelled)} queued job(s) on shutdown.")
+        for job in cancelled:
+            if job.on_cancel is None:
+                continue
+            try:
+                job.on_cancel()
+            except Exception as e:
+                logger.error(f"[{job.job_id}] Could not cancel queued job: {e}", exc_info=True)
+        deadline = time.monotonic() + self.shutdown_timeout
+        for worker in self._workers:
+            worker.join(timeout=max(0.0, deadline - time.monotonic()))
+        still_running = sum(worker.is_alive() for worker in self._workers)
+        if still_running:
+            logger.warning(f"{still_running} job(s) still running after {self.shutdown_timeout}s; stopping without them.")
+
+    def _report_position(self, job_id, position, on_position):
+        if on_position is None:
+            return
+        try:
+            on_position(position)
+        except Exception as e:
+            logger.warning(f"[{job_id}] Could not report queue position: {e}")
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                job = self._pending.popleft()
+                self._busy += 1
+                waiting = list(self._pending)
+
+            # Everyone behind the job that just started moved up by one
+            for position, queued in enumerate(waiting, start=1):
+                self._report_position(queued.job_id, position, queued.on_position)
+
+            try:
+                job.fn(*job.args)
+                succeeded = True
+            except Exception as e:
+                logger.error(f"[{job.job_id}] Queued job failed: {e}", exc_info=True)
+                succeeded = False
+            with self._cond:
+                self._busy -= 1
+                if succeeded:
+                    self._completed += 1
+                else:
+                    self._failed += 1
@@ -1,6 +1,65 @@
 import torch
 import torch.nn as nn
 
+class InputScaler(nn.Module):
+    """
+    Per-feature affine scaling (`x * scale + offset`) folded from a fitted sklearn
+    MinMaxScaler. Out of place, so the caller's input array is left as it was.
+    `clip` is the scaler's `feature_range` when it was fitted with `clip=True`.
+    """
+    def __init__(self, scale, offset, clip=None):
+        super(InputScaler, self).__init__()
+        # Non-persistent: derived from the scaler, never part of the model state_dict
+        self.register_buffer("scale", torch.as_tensor(scale, dtype=torch.float32), persistent=False)
+        self.register_buffer("offset", torch.as_tensor(offset, dtype=torch.float32), persistent=False)
+        self.clip = None if clip is None else (float(clip[0]), float(clip[1]))
+
+    @classmethod
+    def from_sklearn(cls, scaler, input_shape):
+        if not (hasattr(scaler, "scale_") and hasattr(scaler, "min_")):
+            return None
+        clip = scaler.feature_range if getattr(scaler, "clip", False) else None
+        return cls(scaler.scale_.reshape(input_shape), scaler.min_.reshape(input_shape), clip=clip)
+
+    def forward(self, x):
+        x = x * self.scale + self.offset
+        if self.clip is not None:
+            x = torch.clamp(x, self.clip[0], self.clip[1])
+        return x
+
+class SingleStepLSTM(nn.Module):
+    """
+    Inference replacement for a multi-layer `nn.LSTM` that only ever sees one time
+    step from a zero initial state. With h0 = c0 = 0 the recurrent weights and the
+    forget gate drop out, so each layer is one Linear producing the input, cell and
+    output gates: c = sigmoid(i) * tanh(g), h = sigmoid(o) * tanh(c).
+    """
+    def __init__(self, lstm):
+        super(SingleStepLSTM, self).__init__()
+        if lstm.bidirectional or lstm.proj_size or not lstm.batch_first:
+            raise ValueError("SingleStepLSTM only supports unidirectional, batch_first LSTMs without projections")
+        hidden = lstm.hidden_size
+        # PyTorch gate order is (input, forget, cell, output); keep i, g, o
+        keep = torch.cat([torch.arange(0, hidden), torch.arange(2 * hidden, 4 * hidden)])
+        self.layers = nn.ModuleList()
+        for k in range(lstm.num_layers):
+            weight_ih = getattr(lstm, f"weight_ih_l{k}").detach()
+            bias = torch.zeros(4 * hidden)
+            if lstm.bias:
+                bias = (getattr(lstm, f"bias_ih_l{k}") + getattr(lstm, f"bias_hh_l{k}")).detach()
+            layer = nn.Linear(weight_ih.shape[1], 3 * hidden)
+            layer.weight.data.copy_(weight_ih[keep])
+            layer.bias.data.copy_(bias[keep])
+            self.layers.append(layer)
+
+    def forward(self, x):
+        """Same contract as nn.LSTM for input (B, 1, features): returns ((B, 1, hidden), None)."""
+        h = x[:, -1, :]
+        for layer in self.layers:
+            i, g, o = layer(h).chunk(3, dim=1)
+            h = torch.sigmoid(o) * torch.tanh(torch.sigmoid(i) * torch.tanh(g))
+        return h.unsqueeze(1), None
+
 # You can rename this file to avoid confusion if you wish
 class CNN_LSTM_Architecture(nn.Module):
     def __init__(self, num_classes=1): # Default num_classes to 1 for binary
@@ -53,7 +112,16 @@ class CNN_LSTM_Architecture(nn.Module):
             nn.Linear(128, 1)
         )
 
+        # Optional InputScaler attached at load time (see load_model_from_checkpoint)
+        self.input_scaler = None
+        # Set by model_optimization.optimize_for_inference when the CNN runs in NHWC
+        self.channels_last = False
+
     def forward(self, x):
+        if self.input_scaler is not None:
+            x = self.input_scaler(x)
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
         x = self.cnn(x)  # (B, 256, H, W)
         x = self.global_avg_pool(x)  # (B, 256, 1, 1)
         x = x.view(x.size(0), 1, -1)  # (B, 1, 256)
@@ -0,0 +1,82 @@
+import copy
+import logging
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from .model_architecture import SingleStepLSTM
+
+logger = logging.getLogger(__name__)
+
+def _fold_cnn(cnn):
+    """Folds every BatchNorm2d into the Conv2d before it and drops eval-time no-ops (Dropout)."""
+    layers = []
+    for module in cnn:
+        if isinstance(module, nn.BatchNorm2d) and layers and isinstance(layers[-1], nn.Conv2d):
+            layers[-1] = fuse_conv_bn_eval(layers[-1], module)
+        elif not isinstance(module, (nn.Dropout, nn.Identity)):
+            layers.append(module)
+    return nn.Sequential(*layers)
+
+def _fold_classifier(classifier):
+    """Folds a BatchNorm1d into the Linear that follows it: W' = W * s, b' = W @ t + b."""
+    layers, bn = [], None
+    for module in classifier:
+        if isinstance(module, nn.BatchNorm1d):
+            bn = module
+        elif isinstance(module, nn.Linear) and bn is not None:
+            scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+            shift = bn.bias - bn.running_mean * scale
+            folded = nn.Linear(module.in_features, module.out_features)
+            with torch.no_grad():
+                folded.weight.copy_(module.weight * scale)
+                folded.bias.copy_(module.weight @ shift + module.bias)
+            layers.append(folded)
+            bn = None
+        elif not isinstance(module, (nn.Dropout, nn.Identity)):
+            if bn is not None:
+                layers.append(bn)
+                bn = None
+            layers.append(module)
+    if bn is not None:
+        layers.append(bn)
+    return nn.Sequential(*layers)
+
+def optimize_for_inference(model, channels_last=True):
+    """
+    Returns an eval-only copy of a CNN_LSTM_Architecture with the BatchNorms
+    folded into the adjacent Conv2d/Linear weights, Dropouts removed, the
+    5-layer LSTM replaced by its single-step equivalent and, optionally, the CNN
+    running in channels-last (NHWC) memory format.
+    """
+    model = copy.deepcopy(model).eval()
+    with torch.no_grad():
+        model.cnn = _fold_cnn(model.cnn)
+        model.lstm = SingleStepLSTM(model.lstm)
+        model.classifier = _fold_classifier(model.classifier)
+    if channels_last:
+        model.cnn = model.cnn.to(memory_format=torch.channels_last)
+        model.channels_last = True
+    return model
+
+def max_output_difference(reference, optimized, input_shape, n_samples=8, seed=0):
+    """Largest absolute probability difference between two models on log-mel-like random input."""
+    generator = torch.Generator().manual_seed(seed)
+    # Unscaled log-mel stacks span roughly [-80, 0] dB
+    x = torch.rand((n_samples,) + tuple(input_shape), generator=generator) * -80.0
+    with torch.no_grad():
+        expected = torch.sigmoid(reference(x))
+        actual = torch.sigmoid(optimized(x))
+    return float((expected - actual).abs().max())
+
+def build_inference_model(model, input_shape, channels_last=True, tolerance=1e-4):
+    """
+    optimize_for_inference plus an equivalence check against the original;
+    returns the original model if the rewritten one drifts beyond `tolerance`.
+    """
+    optimized = optimize_for_inference(model, channels_last=channels_last)
+    difference = max_output_difference(model, optimized, input_shape)
+    if difference > tolerance:
+        logger.error(f"Optimized model differs from the original (max |dp| = {difference:.2e}); keeping the original.")
+        return model
+    logger.info(f"Model optimized for inference (BN folded, single-step LSTM, channels_last={channels_last}; max |dp| = {difference:.2e}).")
+    return optimized
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ResultOutbox:
+    """
+    Durable (SQLite) record of final updates owed to the backend. An entry is
+    written before the first delivery attempt and removed once delivered, so a
+    finished analysis survives backend outages and service restarts.
+
+    Entries are leased while a delivery is in progress; `claim_due` hands out
+    the ones whose lease or retry delay has expired. Payloads are stored without
+    the shared secret.
+    """
+    def __init__(self, db_path, lease_seconds=120):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, request_id TEXT NOT NULL, payload TEXT NOT NULL,"
+            " created REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, last_error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_next_attempt ON outbox (next_attempt)")
+        # Nothing can be in flight in a fresh process: make every entry due now
+        released = self._db.execute("UPDATE outbox SET next_attempt = ?", (time.time(),)).rowcount
+        self._db.commit()
+        if released:
+            logger.warning(f"Outbox holds {released} undelivered final result(s) from a previous run; redelivering.")
+
+    @classmethod
+    def from_config(cls, outbox_config):
+        return cls(outbox_config["db_path"], lease_seconds=outbox_config["lease_seconds"])
+
+    def record(self, request_id, payload):
+        """Persists a final update (leased to the caller's delivery attempt) and returns its id."""
+        stored = {k: v for k, v in payload.items() if k != "secret_key"}
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO outbox (request_id, payload, created, next_attempt) VALUES (?, ?, ?, ?)",
+                (request_id, json.dumps(stored), now, now + self.lease_seconds),
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    def delete(self, entry_id):
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+            self._db.commit()
+
+    def defer(self, entry_id, error, delay_seconds):
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay_seconds, str(error)[:500], entry_id),
+            )
+            self._db.commit()
+
+    def claim_due(self, limit):
+        """Leases up to `limit` entries that are due; returns [(id, request_id, payload)]."""
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, request_id, payload FROM outbox WHERE next_attempt <= ? ORDER BY id LIMIT ?", (now, limit)
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE outbox SET next_attempt = ? WHERE id = ?", [(now + self.lease_seconds, row[0]) for row in rows]
+            )
+            self._db.commit()
+        return [(entry_id, request_id, json.loads(payload)) for entry_id, request_id, payload in rows]
+
+    def stats(self):
+        with self._lock:
+            pending, oldest = self._db.execute("SELECT COUNT(*), MIN(created) FROM outbox").fetchone()
+        return {"pending": pending, "oldest_pending_age_seconds": round(time.time() - oldest, 1) if oldest else None}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
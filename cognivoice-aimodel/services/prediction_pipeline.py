@@ -1,19 +1,25 @@
 import os
 import logging
 import time
+import itertools
 import torch
 import numpy as np
 import librosa
-import librosa.display
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from collections import Counter
-from .model_architecture import CNN_LSTM_Architecture
+from .model_architecture import CNN_LSTM_Architecture, InputScaler
+from .model_optimization import build_inference_model
+from .quantization import quantize_model, load_calibration_segments
+from .inference_backends import EagerBackend, as_backend, load_exported_backend
+from .result_cache import cache_version
+from .spectral_features import SpectralFeatures
+from .streaming_logmel import LogMelStream, use_streaming
+from .spectrogram_renderer import render_spectrogram_png, NOT_SCORED
+from .instrumentation import Stage, stage, record_stages
+from config_ai import VISUALIZATION
 
 logger = logging.getLogger(__name__)
 
-def load_model_from_checkpoint(checkpoint_path,model_config, device):
+def load_model_from_checkpoint(checkpoint_path,model_config, device, scaler=None):
     logger.info(f"Loading checkpoint from: {checkpoint_path}")
     
     
@@ -21,129 +27,318 @@ def load_model_from_checkpoint(checkpoint_path,model_config, device):
     model = CNN_LSTM_Architecture(num_classes=model_config["num_classes"])
     
     
-    checkpoint = torch.load(checkpoint_path, map_location=device,weights_only=False)
-    model.load_state_dict(checkpoint if isinstance(checkpoint, dict) and 'model_state_dict' not in checkpoint else checkpoint['model_state_dict'])
+    try:
+        # Memory-mapped: tensors are paged in from the file instead of read and copied up front
+        checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False, mmap=True)
+    except RuntimeError:
+        # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+        checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+    state_dict = checkpoint if isinstance(checkpoint, dict) and 'model_state_dict' not in checkpoint else checkpoint['model_state_dict']
+    model.load_state_dict(state_dict, assign=True)
+
+    # Fold the MinMax scaler (bundled in the checkpoint or loaded separately) into the model input path
+    if isinstance(checkpoint, dict) and checkpoint.get('scaler') is not None:
+        scaler = checkpoint['scaler']
+    if scaler is not None:
+        model.input_scaler = InputScaler.from_sklearn(scaler, model_config["input_shape"])
+        if model.input_scaler is None:
+            logger.warning(f"Scaler {type(scaler).__name__} cannot be folded; it will run through sklearn.")
+    else:
+        logger.info("No scaler found for this checkpoint; segments are fed to the model unscaled.")
 
     model.to(device)
     model.eval()
+
+    if model_config.get("optimize_graph", False):
+        model = build_inference_model(model, model_config["input_shape"], channels_last=model_config.get("channels_last", True))
+
+    quantization = model_config.get("quantization", "none")
+    if quantization != "none":
+        calibration_segments = load_calibration_segments(model_config.get("calibration_path")) if quantization == "static" else None
+        if calibration_segments is not None and model.input_scaler is None and scaler is not None:
+            calibration_segments = scaler.transform(calibration_segments.reshape(len(calibration_segments), -1)) \
+                .astype(np.float32).reshape(calibration_segments.shape)
+        model = quantize_model(model, quantization, device, calibration_segments)
     logger.info("New Log-Mel CNN-LSTM model loaded successfully.")
     return model
 
-def process_audio_to_logmel_segments(audio_path,features_config):
+def load_predictor(model_config, device, scaler=None):
+    """
+    Builds the inference backend selected by model_config["backend"]: the eager
+    module from the checkpoint, or a TorchScript/ONNX Runtime artifact produced by
+    export_model.py (falling back to eager if it is missing or stale).
+    """
+    backend = model_config.get("backend", "eager")
+    if backend != "eager":
+        model_version = cache_version([model_config["checkpoint_path"], model_config["scaler_path"]])
+        predictor = load_exported_backend(backend, model_config["export_dir"], device, model_version,
+                                          intra_op_threads=model_config.get("onnx_intra_op_threads", 0))
+        if predictor is not None:
+            if model_config.get("quantization", "none") != "none":
+                logger.warning("MODEL['quantization'] only applies to the eager backend; exported models run in fp32.")
+            return predictor
+        logger.warning("Falling back to the eager backend.")
+    return EagerBackend(load_model_from_checkpoint(model_config["checkpoint_path"], model_config, device, scaler=scaler), device)
+
+def process_audio_to_logmel_segments(audio,features_config):
     """
-    Extracts log-Mel features from an audio file and splits them into segments.
+    Extracts log-Mel features from an audio file, `(y, sr)` buffer or SpectralFeatures
+    and splits them into segments.
     """
     try:
-        # 1. Extract raw log-Mel features
-        
-        sample_rate = features_config['sample_rate']
-        n_mels = features_config['n_mels']
-        
-        y, sr = librosa.load(audio_path, sr=sample_rate)
-
-        mel_spec = librosa.feature.melspectrogram(
-            y=y, sr=sr, n_fft=2048, hop_length=512, win_length=2048, n_mels=n_mels, window='hann'
-        )
-        log_mel = librosa.power_to_db(mel_spec, ref=np.max)
-        delta = librosa.feature.delta(log_mel)
-        delta2 = librosa.feature.delta(log_mel, order=2)
-        
-        features = np.stack([log_mel, delta, delta2], axis=0)
+        with stage("logmel"):
+            # 1. Extract raw log-Mel features (cached on the job's SpectralFeatures)
+            spectral = SpectralFeatures.from_audio(audio, features_config)
+            features = spectral.logmel_stack
 
-        # 2. Segment the raw features into chunks
-        segment_length = features_config['segment_length']
-        if features.shape[2] < segment_length:
-            logger.warning("Audio is too short to create a full segment.")
-            return None
+            # 2. Segment the raw features into chunks
+            segment_length = features_config['segment_length']
+            if features.shape[2] < segment_length:
+                logger.warning("Audio is too short to create a full segment.")
+                return None
 
-        segments = []
-        for start in range(0, features.shape[2] - segment_length + 1, segment_length):
-            segments.append(features[:, :, start:start + segment_length])
-        
-        return np.array(segments) if segments else None
+            # (3, n_mels, n * L) -> (n, 3, n_mels, L) in a single copy; a trailing partial segment is dropped
+            n_segments = features.shape[2] // segment_length
+            segments = features[:, :, :n_segments * segment_length].reshape(features.shape[0], features.shape[1], n_segments, segment_length)
+            return np.ascontiguousarray(segments.transpose(2, 0, 1, 3))
 
     except Exception as e:
         logger.error(f"Error processing audio to log-mel segments: {e}", exc_info=True)
         return None
     
-def predict_from_audio(audio_path, model, scaler,model_config, features_config, static_folder,device):
+def predict_segment_probabilities(segments, model, scaler, model_config, device, scheduler=None):
+    """
+    Scales every segment in one vectorized call (or inside the model when the
+    scaler was folded into it at load time) and scores them in mini-batches of
+    `model_config["inference_batch_size"]`, or through the shared `scheduler` so
+    concurrent jobs are batched together. Returns P(dementia) per segment.
+    """
+    n_segments = len(segments)
+    backend = as_backend(model, device)
+    with stage("scaler"):
+        scaled_segments = scale_segments(segments, backend, scaler, model_config)
+
+    with stage("inference"):
+        if scheduler is not None:
+            return scheduler.infer(scaled_segments)
+
+        batch_size = model_config.get("inference_batch_size", 16)
+        probabilities = np.empty(n_segments, dtype=np.float32)
+        for start in range(0, n_segments, batch_size):
+            probabilities[start:start + batch_size] = backend.predict_proba(scaled_segments[start:start + batch_size])
+        return probabilities
+
+def scale_segments(segments, backend, scaler, model_config):
+    if backend.scales_input or scaler is None:
+        # Scaling (if any) happens inside the model, directly on the float32 segments
+        return np.ascontiguousarray(segments, dtype=np.float32)
+    # (N, 3, 224, 224) -> (N, 150528) for the scaler, then back for the model
+    n_segments = len(segments)
+    scaled_segments = scaler.transform(segments.reshape(n_segments, -1)).astype(np.float32, copy=False)
+    return scaled_segments.reshape((n_segments,) + tuple(model_config["input_shape"]))
+
+def predict_stream_probabilities(segments, model, scaler, model_config, device, scheduler=None, early_exit=None, n_total=None):
+    """
+    Scores an iterable of segments (e.g. a LogMelStream) in batches of
+    `model_config["inference_batch_size"]` as they are produced. With a
+    scheduler, extracting the next batch overlaps inference of the previous one;
+    at most two batches are held at a time either way. With `early_exit` (a
+    SequentialVote), scoring stops after the batch that settles the vote over
+    `n_total` segments and the rest of `segments` is never produced.
+    """
+    backend = as_backend(model, device)
+    batch_size = model_config.get("inference_batch_size", 16)
+    # Extraction and inference alternate per batch; each stage is recorded once, with its totals
+    logmel, scaling, inference = Stage("logmel"), Stage("scaler"), Stage("inference")
+    try:
+        if n_total is None and hasattr(segments, '__len__'):
+            with logmel:
+                n_total = len(segments)
+        iterator = iter(segments)
+        probabilities, in_flight = [], None
+
+        def settled():
+            return early_exit is not None and early_exit.should_stop(np.concatenate(probabilities), n_total)
+
+        while True:
+            with logmel:
+                batch = list(itertools.islice(iterator, batch_size))
+            if in_flight is not None:
+                with inference:
+                    probabilities.append(in_flight.result())
+                in_flight = None
+                if settled():
+                    break
+            if not batch:
+                break
+            with scaling:
+                scaled = scale_segments(np.stack(batch), backend, scaler, model_config)
+            if scheduler is not None:
+                in_flight = scheduler.submit(scaled)
+                continue
+            with inference:
+                probabilities.append(backend.predict_proba(scaled))
+            if settled():
+                break
+        if hasattr(iterator, 'close'):
+            iterator.close()
+    finally:
+        record_stages([timer.as_dict() for timer in (logmel, scaling, inference) if timer.runs])
+    return np.concatenate(probabilities) if probabilities else np.empty(0, dtype=np.float32)
+
+def predict_until_settled(segments, model, scaler, model_config, device, early_exit, scheduler=None):
+    """
+    Scores indexable `segments` (an array or a LogMelStream) in the early-exit
+    scoring order until the vote is settled. Returns the indices that were
+    scored and their P(dementia), in scoring order.
+    """
+    with stage("logmel"):
+        # A LogMelStream's first pass (frame count and decibel references) runs here
+        order = early_exit.scoring_order(len(segments))
+    probabilities = predict_stream_probabilities((segments[i] for i in order), model, scaler, model_config, device,
+                                                 scheduler=scheduler, early_exit=early_exit, n_total=len(order))
+    return order[:len(probabilities)], probabilities
+
+def predict_from_audio(audio, model, scaler,model_config, features_config, static_folder,device, file_name=None, scheduler=None, visualizer=None, early_exit=None, image_name=None):
+    # `audio` is a path, an in-memory (y, sr) buffer or the job's SpectralFeatures;
+    # the STFT behind the segments and the visualization is computed only once.
+    file_name = file_name or (os.path.basename(audio) if isinstance(audio, (str, os.PathLike)) else "audio.wav")
+    if use_streaming(audio, features_config):
+        # Long recordings: segments are extracted block by block and scored as they come
+        stream = LogMelStream(audio, features_config, max_columns=visualizer.max_columns if visualizer is not None else 2400)
+        if early_exit is not None:
+            # Segments are read one by one in the scoring order, so unscored audio is only read for the image
+            scored, segment_probabilities = predict_until_settled(stream, model, scaler, model_config, device, early_exit,
+                                                                  scheduler=scheduler)
+        else:
+            scored, segment_probabilities = None, predict_stream_probabilities(stream, model, scaler, model_config, device,
+                                                                               scheduler=scheduler)
+        logger.info(f"Streamed {len(segment_probabilities)}/{len(stream)} log-mel segments in {stream.block_seconds}s blocks.")
+        with stage("visualization"):
+            # Only takes its own pass over the audio when early exit skipped the sequential one
+            visualization = stream.visualization
+        return summarize_predictions(segment_probabilities, visualization, model_config, features_config, static_folder,
+                                     file_name, visualizer=visualizer, scored_indices=scored, n_total=len(stream), image_name=image_name)
+    spectral = SpectralFeatures.from_audio(audio, features_config)
+
     # 1. Get all the unscaled segments in one step.
-    segments = process_audio_to_logmel_segments(audio_path,features_config)
-    
+    segments = process_audio_to_logmel_segments(spectral,features_config)
+    return predict_from_segments(segments, spectral, model, scaler, model_config, features_config, static_folder, device,
+                                 file_name=file_name, scheduler=scheduler, visualizer=visualizer, early_exit=early_exit,
+                                 image_name=image_name)
+
+def predict_from_segments(segments, spectral, model, scaler, model_config, features_config, static_folder, device, file_name, scheduler=None, visualizer=None, early_exit=None, image_name=None):
+    """
+    Scores already-extracted log-mel segments and builds the result payload. Used
+    directly when feature extraction ran elsewhere (e.g. in the process pool).
+    """
     if segments is None or len(segments) == 0:
         return {'error': 'Could not create valid feature segments from audio.'}
 
-    
-    segment_predictions, segment_probabilities = [], []
-    
-    with torch.no_grad():
-        # 2. Loop through each segment, scale it, and predict.
-        for segment in segments:
-            # `segment` has shape (3, 224, 224)
-            
-            # Reshape for the scaler: (1, 150528)
-            flat_segment = segment.reshape(1, -1)
-            
-            # Use the pre-trained scaler to transform this single segment
-            scaled_segment_flat = scaler.transform(flat_segment)
-            
-            # Reshape for the model: (3, 224, 224)
-            scaled_segment = scaled_segment_flat.reshape(model_config["input_shape"])
-
-            # Create the tensor and predict
-            segment_tensor = torch.FloatTensor(scaled_segment).unsqueeze(0).to(device)
-            output_logit = model(segment_tensor)
-            prob_dementia = torch.sigmoid(output_logit).item()
-            
-            segment_probabilities.append(prob_dementia)
-            segment_predictions.append(1 if prob_dementia > 0.5 else 0)
-
-    if not segment_predictions:
-        return {'error': 'No predictions were made.'}
-        
-    # The rest of the function (voting, confidence, visualization) is the same and correct.
-    final_vote = Counter(segment_predictions).most_common(1)[0][0]
+    if early_exit is not None:
+        # Scored batch by batch so the vote can stop as soon as it is settled
+        scored, segment_probabilities = predict_until_settled(segments, model, scaler, model_config, device, early_exit,
+                                                              scheduler=scheduler)
+    else:
+        scored, segment_probabilities = None, predict_segment_probabilities(segments, model, scaler, model_config, device,
+                                                                            scheduler=scheduler)
+    return summarize_predictions(segment_probabilities, spectral, model_config, features_config, static_folder, file_name,
+                                 visualizer=visualizer, scored_indices=scored, n_total=len(segments), image_name=image_name)
+
+def summarize_predictions(segment_probabilities, spectral, model_config, features_config, static_folder, file_name, visualizer=None,
+                          scored_indices=None, n_total=None, image_name=None):
+    """
+    Majority vote, confidence and visualization for per-segment P(dementia).
+    When the vote exited early, `scored_indices` gives the segment each
+    probability belongs to, out of `n_total`; the others are drawn as NOT_SCORED.
+    The image is named after `file_name` unless an `image_name` is given.
+    """
+    n_evaluated = len(segment_probabilities)
+    if n_evaluated == 0:
+        return {'error': 'Could not create valid feature segments from audio.'}
+    votes = (segment_probabilities > 0.5).astype(int)
+    if scored_indices is None:
+        segment_predictions = votes.tolist()
+    else:
+        segment_predictions = np.full(n_total, NOT_SCORED, dtype=int)
+        segment_predictions[scored_indices] = votes
+        segment_predictions = segment_predictions.tolist()
+    n_total = len(segment_predictions)
+
+    # Majority vote (in time order, so a full scoring breaks ties as before), then
+    # the mean probability of the winning class as confidence.
+    vote_counts = Counter(p for p in segment_predictions if p != NOT_SCORED)
+    final_vote = vote_counts.most_common(1)[0][0]
     
     if final_vote == 1: # Dementia
-        winning_probs = [p for p, pred in zip(segment_probabilities, segment_predictions) if pred == 1]
-        confidence = np.mean(winning_probs) if winning_probs else 0
+        winning_probs = segment_probabilities[segment_probabilities > 0.5]
     else: # Control
-        winning_probs = [1 - p for p, pred in zip(segment_probabilities, segment_predictions) if pred == 0]
-        confidence = np.mean(winning_probs) if winning_probs else 0
+        winning_probs = 1 - segment_probabilities[segment_probabilities <= 0.5]
+    confidence = np.mean(winning_probs, dtype=np.float64) if winning_probs.size else 0
 
-    viz_url = save_visualization(audio_path, segment_predictions, final_vote,static_folder, features_config)
+    with stage("visualization"):
+        if visualizer is not None:
+            # Rendered lazily (on first request or by the background worker), not on the critical path
+            viz_url = visualizer.register(image_name or visualization_image_name(file_name), spectral, segment_predictions, final_vote)
+        else:
+            viz_url = save_visualization(spectral, segment_predictions, final_vote,static_folder, features_config, file_name=file_name,
+                                         img_name=image_name)
 
     return {
-        'fileName': os.path.basename(audio_path),
+        'fileName': file_name,
         'finalPrediction': model_config["class_names"][final_vote],
         'confidence': f"{confidence:.2f}",
-        'voteCounts': {model_config["class_names"][i]: Counter(segment_predictions).get(i, 0) for i in range(len(model_config["class_names"]))},
+        'voteCounts': {model_config["class_names"][i]: vote_counts.get(i, 0) for i in range(len(model_config["class_names"]))},
+        'segmentsEvaluated': n_evaluated,
+        'segmentsTotal': n_total,
         'visualizationUrl': viz_url
     }
 
-def save_visualization(audio_path, predictions, final_vote,static_folder, features_config):
+def visualization_image_name(audio, file_name=None):
+    file_name = file_name or (os.path.basename(audio) if isinstance(audio, (str, os.PathLike)) else "audio.wav")
+    return os.path.splitext(file_name)[0] + '_analysis.png'
+
+def shared_image_name(content_hash):
+    """Image name of a result the ResultCache may hand to other uploads: it names no request or file."""
+    return f"{content_hash}_analysis.png"
+
+def render_visualization(spectrogram_db, sr, hop_length, predictions, final_vote, img_path):
+    """Draws the spectrogram and the per-segment votes into `img_path` with matplotlib."""
+    # Imported lazily: only this legacy renderer needs matplotlib
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import librosa.display
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), gridspec_kw={'height_ratios': [2, 1]})
     try:
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), gridspec_kw={'height_ratios': [2, 1]})
-        y, sr = librosa.load(audio_path, sr=features_config["sample_rate"])
-        D = librosa.stft(y)
-        S_db = librosa.amplitude_to_db(np.abs(D), ref=np.max)
-        librosa.display.specshow(S_db, sr=sr, x_axis='time', y_axis='log', ax=ax1)
+        librosa.display.specshow(spectrogram_db, sr=sr, hop_length=hop_length, x_axis='time', y_axis='log', ax=ax1)
         ax1.set_title('Spectrogram')
-        colors = ['#1f77b4' if p == final_vote else '#d62728' for p in predictions]
+        colors = ['#7f7f7f' if p == NOT_SCORED else '#1f77b4' if p == final_vote else '#d62728' for p in predictions]
         ax2.bar(range(len(predictions)), [1]*len(predictions), color=colors)
-        ax2.set_yticks([]); ax2.set_title(f'Segment Predictions (Blue = Final Vote)')
+        ax2.set_yticks([]); ax2.set_title(f'Segment Predictions (Blue = Final Vote, Grey = Not Scored)')
         plt.tight_layout()
-        
-        img_name = os.path.splitext(os.path.basename(audio_path))[0] + '_analysis.png'
+        fig.savefig(img_path, format='png')
+    finally:
+        plt.close(fig)
+
+# Interchangeable image renderers, selected with VISUALIZATION["renderer"]
+RENDERERS = {
+    "numpy": render_spectrogram_png,
+    "matplotlib": render_visualization,
+}
+
+def save_visualization(audio, predictions, final_vote,static_folder, features_config, file_name=None, renderer=None, img_name=None):
+    try:
+        spectral = SpectralFeatures.from_audio(audio, features_config)
+        img_name = img_name or visualization_image_name(audio, file_name)
         os.makedirs(static_folder, exist_ok=True)
 
         img_path = os.path.join(static_folder, img_name)
-        plt.savefig(img_path)
-        plt.close(fig)
+        RENDERERS[renderer or VISUALIZATION["renderer"]](spectral.spectrogram_db, spectral.sr, spectral.hop_length, predictions, final_vote, img_path)
         
-        # This will be accessed via a static route if you set one up, or served directly.
-        # For simplicity, we return a path the frontend can use.
+        # Served by the AI service's /static_predictions route (see main.py).
         return f'/static_predictions/{img_name}' 
     except Exception as e:
         logger.error(f"Failed to save visualization: {e}")
-        return ""
\ No newline at end of file
+        return ""
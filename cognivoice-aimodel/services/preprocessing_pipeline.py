@@ -1,81 +1,88 @@
 import os
-import subprocess
 import logging
-import shutil
-from pydub import AudioSegment
 import librosa
 import soundfile as sf
 import numpy as np
-from pyannote.audio import Pipeline
+from .denoiser import DemucsDenoiser
+from .diarizer import SpeakerDiarizer
+from .speech_features import frame_energy_db, non_silent_intervals
+from .instrumentation import stage
 
 logger = logging.getLogger(__name__)
 
 class Preprocessor:
-    def __init__(self, hf_token, device,pp_config):
-        logger.info("Initializing Speaker Diarization pipeline...")
-        # Use config from the Flask application context
-        self.diarization_pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1",
-            use_auth_token=hf_token
-        )
-        self.diarization_pipeline.to(device)
-        logger.info("Diarization pipeline loaded.")
+    def __init__(self, hf_token, device,pp_config, denoiser=None):
         self.pp_config = pp_config
+        # Share the resident Demucs engine loaded at startup when one is given
+        self.denoiser = denoiser or DemucsDenoiser.from_config(pp_config, device)
+        # Optional stage; pyannote is only imported and loaded on first use
+        self.diarizer = SpeakerDiarizer.from_config(pp_config, hf_token, device) if pp_config.get("diarization_enabled") else None
+
+    def load_audio(self, input_path):
+        # Decode the upload once at its native rate; every stage works on this buffer
+        y, sr = librosa.load(input_path, sr=None, mono=False)
+        return y.astype(np.float32, copy=False), sr
+
+    def denoise_waveform(self, y, sr):
+        logger.info("Step 1: Denoising waveform")
+        vocals = self.denoiser.separate_vocals(y, sr)
+        return librosa.to_mono(vocals), self.denoiser.samplerate
+
     def denoise(self, input_path, output_dir):
         logger.info(f"Step 1: Denoising {input_path}")
-        model_name = self.pp_config["denoiser_model_path"]
-        cmd = ['python', '-m', 'demucs.separate', '--out', output_dir, '-n', model_name, input_path]
-        
-        try:
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
-            input_filename_without_ext = os.path.splitext(os.path.basename(input_path))[0]
-            demucs_output_path = os.path.join(output_dir, model_name, input_filename_without_ext, "vocals.wav")
-
-            if not os.path.exists(demucs_output_path):
-                raise FileNotFoundError(f"Denoised file not found: {demucs_output_path}")
-
-            final_denoised_path = os.path.join(output_dir, f"{input_filename_without_ext}_denoised.wav")
-            shutil.move(demucs_output_path, final_denoised_path)
-            shutil.rmtree(os.path.join(output_dir, model_name))
-            
-            logger.info(f"Denoising successful. Output: {final_denoised_path}")
-            return final_denoised_path
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Demucs execution failed. Stderr: {e.stderr}")
-            raise
-
-    """def diarize(self, input_path, output_path,pp_config):
+        y, sr = librosa.load(input_path, sr=self.denoiser.samplerate, mono=False)
+        vocals = self.denoiser.separate_vocals(y, sr)
+
+        input_filename_without_ext = os.path.splitext(os.path.basename(input_path))[0]
+        final_denoised_path = os.path.join(output_dir, f"{input_filename_without_ext}_denoised.wav")
+        sf.write(final_denoised_path, vocals.T, self.denoiser.samplerate)
+
+        logger.info(f"Denoising successful. Output: {final_denoised_path}")
+        return final_denoised_path
+
+    def diarize_waveform(self, y, sr):
+        logger.info("Step 2: Diarizing waveform")
+        return self.diarizer.dominant_speaker_waveform(y, sr)
+
+    def diarize(self, input_path, output_path):
         logger.info(f"Step 2: Diarizing {input_path}")
-        num_speakers = self.pp_config["num_diarization_speakers"]
-        diarization = self.diarization_pipeline(input_path, num_speakers=num_speakers)
-        
-        dominant_speaker = max(diarization.labels(), key=lambda s: sum(turn.end - turn.start for turn, _, spk in diarization.itertracks(yield_label=True) if spk == s))
-        
-        audio = AudioSegment.from_wav(input_path)
-        dominant_audio = sum([audio[int(t.start*1000):int(t.end*1000)] for t, _, s in diarization.itertracks(yield_label=True) if s == dominant_speaker], AudioSegment.empty())
-        dominant_audio.export(output_path, format="wav")
+        y, sr = librosa.load(input_path, sr=None)
+        dominant_audio, sr = self.diarize_waveform(y, sr)
+        sf.write(output_path, dominant_audio, sr)
         logger.info(f"Diarization successful. Saved to {output_path}")
-        return output_path"""
+        return output_path
+
+    def remove_silence_waveform(self, y, sr):
+        top_db = self.pp_config["silence_top_db"]
+        if y.ndim == 1:
+            # Same intervals as librosa.effects.split without framing the whole signal (~6x its size)
+            intervals = non_silent_intervals(frame_energy_db(y), top_db, len(y))
+        else:
+            intervals = librosa.effects.split(y, top_db=top_db)
+        non_silent_audio = np.concatenate([y[s:e] for s, e in intervals]) if len(intervals) > 0 else y
+        return non_silent_audio, sr
 
     def remove_silence(self, input_path, output_path):
         logger.info(f"Step 3: Removing silence from {input_path}")
         audio, sr = librosa.load(input_path, sr=None)
-        top_db = self.pp_config["silence_top_db"]
-        intervals = librosa.effects.split(audio, top_db=top_db)
-        non_silent_audio = np.concatenate([audio[s:e] for s, e in intervals]) if len(intervals) > 0 else audio
+        non_silent_audio, sr = self.remove_silence_waveform(audio, sr)
         sf.write(output_path, non_silent_audio, sr)
         logger.info(f"Silence removal successful. Saved to {output_path}")
         return output_path
 
-    def normalize(self, input_path, output_path):
-        logger.info(f"Step 4: Normalizing {input_path}")
-        y, sr = librosa.load(input_path, sr=None)
+    def normalize_waveform(self, y, sr):
         norm_type = self.pp_config["normalization_type"]
         if norm_type == "rms":
             rms = np.sqrt(np.mean(y**2))
             y_norm = y / (rms + 1e-8) * 0.1
         else: # max
             y_norm = y / (np.max(np.abs(y)) + 1e-8)
+        return y_norm.astype(np.float32, copy=False), sr
+
+    def normalize(self, input_path, output_path):
+        logger.info(f"Step 4: Normalizing {input_path}")
+        y, sr = librosa.load(input_path, sr=None)
+        y_norm, sr = self.normalize_waveform(y, sr)
         sf.write(output_path, y_norm, sr)
         logger.info(f"Normalization successful. Saved to {output_path}")
         return output_path
@@ -86,13 +93,54 @@ class Preprocessor:
         os.makedirs(processing_dir, exist_ok=True)
 
         # Step 1: Denoise
-        denoised_path = self.denoise(input_path, processing_dir)
+        with stage("denoise"):
+            denoised_path = self.denoise(input_path, processing_dir)
         
-        # Step 2: Remove Silence (now acts on the denoised path)
-        silence_removed_path = self.remove_silence(denoised_path, os.path.join(processing_dir, f"{base_name}_silence_removed.wav"))
+        # Step 2 (optional): keep the dominant speaker
+        if self.diarizer is not None:
+            with stage("diarization"):
+                denoised_path = self.diarize(denoised_path, os.path.join(processing_dir, f"{base_name}_diarized.wav"))
+
+        # Step 3: Remove Silence (now acts on the denoised path)
+        with stage("silence_removal"):
+            silence_removed_path = self.remove_silence(denoised_path, os.path.join(processing_dir, f"{base_name}_silence_removed.wav"))
         
-        # Step 3: Normalize
-        final_path = self.normalize(silence_removed_path, os.path.join(processing_dir, f"{base_name}_final.wav"))
+        # Step 4: Normalize
+        with stage("normalize"):
+            final_path = self.normalize(silence_removed_path, os.path.join(processing_dir, f"{base_name}_final.wav"))
         
-        logger.info(f"Preprocessing pipeline (without diarization) complete. Final file: {final_path}")
-        return final_path
\ No newline at end of file
+        logger.info(f"Preprocessing pipeline ({'with' if self.diarizer else 'without'} diarization) complete. Final file: {final_path}")
+        return final_path
+
+    def run_full_pipeline_in_memory(self, y, sr, debug_dir=None):
+        """
+        Same stages as `run_full_pipeline`, but each one takes and returns a float32
+        waveform plus its sample rate. Intermediate WAVs are only written to
+        `debug_dir` when one is given. Every stage holds the whole recording, so
+        memory grows with its duration (about 3 GiB above the loaded models for an
+        hour at 44.1 kHz, without Demucs' own share).
+        """
+        if debug_dir:
+            os.makedirs(debug_dir, exist_ok=True)
+
+        with stage("denoise"):
+            y, sr = self.denoise_waveform(y, sr)
+        if debug_dir: sf.write(os.path.join(debug_dir, "denoised.wav"), y, sr)
+
+        if self.diarizer is not None:
+            with stage("diarization"):
+                y, sr = self.diarize_waveform(y, sr)
+            if debug_dir: sf.write(os.path.join(debug_dir, "diarized.wav"), y, sr)
+
+        with stage("silence_removal"):
+            y, sr = self.remove_silence_waveform(y, sr)
+        logger.info("Step 3: Silence removed from waveform")
+        if debug_dir: sf.write(os.path.join(debug_dir, "silence_removed.wav"), y, sr)
+
+        with stage("normalize"):
+            y, sr = self.normalize_waveform(y, sr)
+        logger.info("Step 4: Waveform normalized")
+        if debug_dir: sf.write(os.path.join(debug_dir, "final.wav"), y, sr)
+
+        logger.info(f"In-memory preprocessing complete ({len(y) / sr:.1f}s at {sr} Hz).")
+        return y, sr
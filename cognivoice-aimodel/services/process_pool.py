@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import torch
+from threadpoolctl import threadpool_limits
+from .instrumentation import record_stages, stage
+
+logger = logging.getLogger(__name__)
+
+# Per-process state, filled once by _init_worker in every pool process
+_worker = {}
+
+def _init_worker(hf_token, device, pp_config, features_config, viz_max_columns, torch_threads, blas_threads):
+    start = time.perf_counter()
+    # Keep pool_size x threads within the core count instead of every process grabbing all cores
+    torch.set_num_threads(torch_threads)
+    threadpool_limits(limits=blas_threads)
+
+    from .preprocessing_pipeline import Preprocessor
+    _worker["preprocessor"] = Preprocessor(hf_token, device, pp_config)
+    _worker["features_config"] = features_config
+    _worker["viz_max_columns"] = viz_max_columns
+    from .resource_usage import rss_mb
+    logger.info(f"Feature-extraction worker {os.getpid()} ready in {time.perf_counter() - start:.1f}s (RSS {rss_mb():.0f} MiB).")
+
+def _worker_ready():
+    return os.getpid()
+
+def _extract_features(audio_path, debug_dir):
+    """Runs extract_features for one upload inside a pool process, with its stage timings for the parent."""
+    from .instrumentation import StageTrace, tracing
+    trace = StageTrace()
+    with tracing(trace):
+        extracted = extract_features(_worker["preprocessor"], audio_path, _worker["features_config"], _worker["viz_max_columns"], debug_dir)
+    return dict(extracted, stages=trace.records())
+
+def extract_features(preprocessor, audio_path, features_config, viz_max_columns=2400, debug_dir=None):
+    """
+    Preprocessing, speech features and log-mel segments for one recording, with
+    a time-pooled spectrogram for the visualization: everything inference and
+    the result need, without the waveform.
+    """
+    from .analysis_service_ai import calculate_speech_features_from_audio
+    from .prediction_pipeline import process_audio_to_logmel_segments
+    from .spectral_features import SpectralFeatures
+    from .streaming_logmel import LogMelStream, use_streaming
+    from .visualization_cache import pool_columns
+
+    raw_audio = preprocessor.load_audio(audio_path)
+    clean_audio = preprocessor.run_full_pipeline_in_memory(*raw_audio, debug_dir=debug_dir)
+    speech_features = calculate_speech_features_from_audio(raw_audio)
+
+    if use_streaming(clean_audio, features_config):
+        # Segments still have to go back to the parent, so all of them are materialized here (and again in
+        # the parent when unpickled): n_segments x 3 x n_mels x segment_length float32, ~190 MiB per hour
+        # of speech at the defaults. Only the block-wise extraction itself is bounded.
+        stream = LogMelStream(clean_audio, features_config, max_columns=viz_max_columns)
+        with stage("logmel"):
+            segments = stream.to_array()
+        return {"speech_features": speech_features, "segments": segments, "visualization": stream.visualization}
+
+    spectral = SpectralFeatures.from_audio(clean_audio, features_config)
+    segments = process_audio_to_logmel_segments(spectral, features_config)
+    # Only a time-pooled spectrogram goes back to the parent, for the visualization
+    spectrogram_db, factor = pool_columns(spectral.spectrogram_db, viz_max_columns)
+    return {
+        "speech_features": speech_features,
+        "segments": segments,
+        "visualization": SpectralFeatures.for_visualization(spectrogram_db, spectral.sr, spectral.hop_length * factor),
+    }
+
+class FeatureExtractionPool:
+    """
+    Runs the CPU-bound part of an analysis job (Demucs, silence removal,
+    normalisation, speech features and log-mel extraction) in a pool of worker
+    processes, each holding its own preloaded Preprocessor, so the work is not
+    serialised on the service's GIL. Inference stays in the parent process.
+
+    If a worker dies (OOM kill, native crash) the executor is broken for good;
+    it is then replaced by a fresh one and the extraction is retried once.
+    """
+    def __init__(self, num_workers, hf_token, device, pp_config, features_config, viz_max_columns=2400,
+                 torch_threads=1, blas_threads=1):
+        self.num_workers = num_workers
+        self._initargs = (hf_token, device, pp_config, features_config, viz_max_columns, torch_threads, blas_threads)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+        self.restarts = 0
+
+    def _new_executor(self):
+        # 'spawn' avoids forking a process that already holds torch/OpenMP threads
+        return ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=self._initargs,
+        )
+
+    def _replace(self, broken):
+        """Swaps in a new executor, unless a concurrent job already replaced `broken`."""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        logger.warning(f"Feature-extraction pool was broken (a worker died); started a new one (restart {self.restarts}).")
+
+    @classmethod
+    def from_config(cls, execution_config, hf_token, device, pp_config, features_config, viz_config):
+        return cls(
+            execution_config["process_workers"],
+            hf_token,
+            device,
+            pp_config,
+            features_config,
+            viz_max_columns=viz_config.get("max_columns", 2400),
+            torch_threads=execution_config["torch_threads_per_process"],
+            blas_threads=execution_config["blas_threads_per_process"],
+        )
+
+    def preload(self):
+        """Starts every worker process (loading its models) before the first job arrives."""
+        futures = [self._executor.submit(_worker_ready) for _ in range(self.num_workers)]
+        pids = {f.result() for f in futures}
+        logger.info(f"Feature-extraction pool started ({len(pids)} process(es)).")
+
+    def warm_up(self, audio_path):
+        """Runs one extraction per worker (concurrently, so each process gets one) and returns the first."""
+        futures = [self._executor.submit(_extract_features, audio_path, None) for _ in range(self.num_workers)]
+        return [f.result() for f in futures][0]
+
+    def extract(self, audio_path, debug_dir=None):
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                extracted = executor.submit(_extract_features, audio_path, debug_dir).result()
+                break
+            except BrokenProcessPool:
+                self._replace(executor)
+                if attempt:
+                    raise
+                logger.warning(f"Retrying feature extraction of {audio_path} on the new pool.")
+        # Stages that ran in the worker count towards the calling job
+        record_stages(extracted.pop("stages"))
+        return extracted
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
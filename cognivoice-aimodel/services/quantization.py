@@ -0,0 +1,66 @@
+import os
+import copy
+import logging
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("none", "dynamic", "static")
+
+def _select_engine():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError(f"No int8 quantized engine available (supported: {engines})")
+
+def load_calibration_segments(path, max_segments=64):
+    """Log-mel segments `(N, 3, n_mels, segment_length)` used to calibrate static activation ranges."""
+    if not path or not os.path.exists(path):
+        return None
+    segments = np.load(path, mmap_mode='r')
+    return np.array(segments[:max_segments], dtype=np.float32)
+
+def _quantize_cnn_fx(model, calibration_segments, engine, batch_size=16):
+    """Static int8 convolutions via FX graph mode (Conv+BN fused), calibrated through the full model."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    example = torch.from_numpy(calibration_segments[:1].copy())
+    model.cnn = prepare_fx(model.cnn, get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for start in range(0, len(calibration_segments), batch_size):
+            model(torch.from_numpy(calibration_segments[start:start + batch_size]))
+    model.cnn = convert_fx(model.cnn)
+    return model
+
+def quantize_model(model, mode, device, calibration_segments=None):
+    """
+    Returns an int8 CPU copy of a loaded CNN_LSTM_Architecture:
+      - "dynamic": LSTM and Linear weights in int8, activations quantized on the fly;
+      - "static": additionally int8 convolutions calibrated on `calibration_segments`.
+    "none" (or a non-CPU device) returns `model` unchanged.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode '{mode}', expected one of {QUANTIZATION_MODES}")
+    if mode == "none":
+        return model
+    if device.type != "cpu":
+        logger.warning(f"Int8 quantization is CPU-only; keeping the fp32 model on {device}.")
+        return model
+
+    from torch.ao.quantization import quantize_dynamic
+
+    engine = _select_engine()
+    model = copy.deepcopy(model).eval()
+    if mode == "static":
+        if calibration_segments is None or len(calibration_segments) == 0:
+            logger.warning("No calibration segments for static quantization; falling back to dynamic int8.")
+        else:
+            model = _quantize_cnn_fx(model, calibration_segments, engine)
+    model = quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+    logger.info(f"Model quantized to int8 ({mode}, engine={engine}).")
+    return model
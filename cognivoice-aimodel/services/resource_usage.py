@@ -0,0 +1,52 @@
+import os
+import time
+import logging
+import resource
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+def rss_mb():
+    """Current resident set size of this process in MiB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 if os.uname().sysname != 'Darwin' else peak / (1024 * 1024)
+
+class StartupReport:
+    """Wall time and RSS growth of each component loaded at startup."""
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._rss_start = rss_mb()
+        self.components = {}
+        self.total_seconds = None
+
+    @contextmanager
+    def stage(self, name):
+        start, rss_before = time.perf_counter(), rss_mb()
+        yield
+        self.components[name] = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "rss_delta_mb": round(rss_mb() - rss_before, 1),
+        }
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self._start
+        breakdown = ", ".join(f"{name} {c['seconds']:.2f}s/{c['rss_delta_mb']:+.0f} MiB" for name, c in self.components.items())
+        logger.info(f"Startup took {self.total_seconds:.2f}s, RSS {rss_mb():.0f} MiB ({breakdown}).")
+
+    def as_dict(self):
+        return {
+            "seconds": round(self.total_seconds, 3) if self.total_seconds is not None else None,
+            "rss_at_start_mb": round(self._rss_start, 1),
+            "rss_mb": round(rss_mb(), 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "components": self.components,
+        }
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the cached result payload changes shape (2: images named after the content hash)
+RESULT_FORMAT = 2
+
+def cache_version(file_paths, *configs):
+    """Fingerprint of the model files and the configs that shape a result; part of every cache key."""
+    digest = hashlib.sha256(f"format {RESULT_FORMAT}".encode())
+    for path in file_paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    for config in configs:
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+class ResultCache:
+    """
+    Persistent (SQLite) map from upload content hash to analysis result, scoped
+    to one model/config `version`. Entries expire after `ttl_seconds`, and the
+    least recently used ones are dropped beyond `max_entries`.
+
+    It also tracks in-flight computations: the first request for a hash becomes
+    the leader and must call `put` or `release`; identical uploads arriving
+    meanwhile are recorded as waiters and handed back to the leader to notify.
+    """
+    def __init__(self, db_path, version, max_entries=10000, ttl_seconds=72 * 3600):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._db.commit()
+        self._inflight = {}
+        self._hits = 0
+        self._misses = 0
+        self._joined = 0
+        self._evicted = 0
+
+    @classmethod
+    def from_config(cls, cache_config, version):
+        return cls(
+            cache_config["db_path"],
+            version,
+            max_entries=cache_config["max_entries"],
+            ttl_seconds=cache_config["ttl_hours"] * 3600,
+        )
+
+    def _key(self, content_hash):
+        return f"{self.version}:{content_hash}"
+
+    def get_or_join(self, content_hash, waiter, is_valid=None):
+        """
+        Returns `(result, joined)`. A cached result is returned as-is (unless
+        `is_valid(result)` rejects it); if the hash is already being computed,
+        `waiter` is attached to it and `joined` is True. Otherwise
+        `(None, False)`: the caller is now the leader.
+        """
+        key = self._key(content_hash)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT result, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                result = json.loads(row[0])
+                if now - row[1] <= self.ttl_seconds and (is_valid is None or is_valid(result)):
+                    self._db.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._hits += 1
+                    return result, False
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._db.commit()
+                self._evicted += 1
+            if key in self._inflight:
+                self._inflight[key].append(waiter)
+                self._joined += 1
+                return None, True
+            self._inflight[key] = []
+            self._misses += 1
+            return None, False
+
+    def put(self, content_hash, result):
+        """Stores the leader's result and returns the waiters that joined it."""
+        key = self._key(content_hash)
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, result, created, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result), now, now),
+                )
+                self._evict(now)
+                self._db.commit()
+            except sqlite3.Error:
+                # The hash stays in flight, so the caller can still release it and notify its waiters
+                self._db.rollback()
+                raise
+            return self._inflight.pop(key, [])
+
+    def release(self, content_hash):
+        """Drops an in-flight computation without caching anything; returns its waiters."""
+        with self._lock:
+            return self._inflight.pop(self._key(content_hash), [])
+
+    def _evict(self, now):
+        expired = self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+        overflow = self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            " SELECT key FROM results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self._evicted += expired + overflow
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            lookups = self._hits + self._misses + self._joined
+            return {
+                "version": self.version,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "deduplicated": self._joined,
+                "evicted": self._evicted,
+                "in_flight": len(self._inflight),
+                "hit_ratio": (self._hits + self._joined) / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,86 @@
+import os
+from functools import cached_property
+import numpy as np
+import librosa
+
+def load_waveform(audio, sample_rate):
+    """
+    Returns a mono float32 waveform at `sample_rate`. `audio` is either a file path
+    or an in-memory `(y, sr)` buffer, which is only resampled when its rate differs.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        y, _ = librosa.load(audio, sr=sample_rate)
+        return y
+    y, sr = audio
+    if y.ndim > 1:
+        y = librosa.to_mono(y)
+    if sr != sample_rate:
+        y = librosa.resample(y, orig_sr=sr, target_sr=sample_rate)
+    return y.astype(np.float32, copy=False)
+
+# STFT hop of every log-mel/spectrogram frame (librosa's default)
+HOP_LENGTH = 512
+
+class SpectralFeatures:
+    """
+    Spectral features of one recording at a canonical sample rate. The magnitude
+    STFT is computed once; mel/log-mel/deltas and the visualization spectrogram
+    are derived from it lazily and cached, so each one is computed at most once
+    per job. (Speech features are computed separately, see speech_features.py.)
+    """
+    def __init__(self, y, sr, n_fft=2048, hop_length=HOP_LENGTH, n_mels=224):
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+
+    @classmethod
+    def from_audio(cls, audio, features_config):
+        """Builds the feature set from a path, a `(y, sr)` buffer or an existing SpectralFeatures."""
+        if isinstance(audio, cls):
+            return audio
+        sample_rate = features_config['sample_rate']
+        return cls(load_waveform(audio, sample_rate), sample_rate, n_mels=features_config['n_mels'])
+
+    @classmethod
+    def for_visualization(cls, spectrogram_db, sr, hop_length):
+        """A waveform-less feature set carrying only a precomputed visualization spectrogram."""
+        spectral = cls(None, sr, hop_length=hop_length)
+        spectral.__dict__['spectrogram_db'] = spectrogram_db
+        return spectral
+
+    @cached_property
+    def magnitude(self):
+        return np.abs(librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length, win_length=self.n_fft, window='hann'))
+
+    @cached_property
+    def power(self):
+        return self.magnitude ** 2
+
+    # --- Model input: log-mel + deltas ---
+    @cached_property
+    def mel(self):
+        return librosa.feature.melspectrogram(S=self.power, sr=self.sr, n_fft=self.n_fft, n_mels=self.n_mels)
+
+    @cached_property
+    def log_mel(self):
+        return librosa.power_to_db(self.mel, ref=np.max)
+
+    @cached_property
+    def delta(self):
+        return librosa.feature.delta(self.log_mel)
+
+    @cached_property
+    def delta2(self):
+        return librosa.feature.delta(self.log_mel, order=2)
+
+    @cached_property
+    def logmel_stack(self):
+        """(3, n_mels, frames): log-mel, delta and delta-delta."""
+        return np.stack([self.log_mel, self.delta, self.delta2], axis=0)
+
+    # --- Visualization ---
+    @cached_property
+    def spectrogram_db(self):
+        return librosa.amplitude_to_db(self.magnitude, ref=np.max)
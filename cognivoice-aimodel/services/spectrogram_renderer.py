@@ -0,0 +1,240 @@
+import struct
+import zlib
+from functools import lru_cache
+import numpy as np
+
+# Matplotlib's "magma" (librosa's default for dB spectrograms) sampled at 17 points
+_MAGMA_ANCHORS = np.array([
+    (0, 0, 4), (10, 8, 34), (29, 17, 71), (54, 16, 107), (81, 18, 124), (106, 28, 129),
+    (131, 38, 129), (156, 46, 127), (183, 55, 121), (208, 65, 111), (231, 82, 99),
+    (245, 107, 92), (252, 137, 97), (254, 167, 114), (254, 196, 136), (253, 226, 163),
+    (252, 253, 191),
+], dtype=np.float64)
+_LUT_SIZE = 256
+_positions = np.linspace(0, 1, len(_MAGMA_ANCHORS))
+COLORMAP_LUT = np.stack(
+    [np.interp(np.linspace(0, 1, _LUT_SIZE), _positions, _MAGMA_ANCHORS[:, c]) for c in range(3)], axis=1
+).round().astype(np.uint8)
+
+FINAL_VOTE_COLOR = np.array([0x1f, 0x77, 0xb4], dtype=np.uint8)  # '#1f77b4'
+OTHER_VOTE_COLOR = np.array([0xd6, 0x27, 0x28], dtype=np.uint8)  # '#d62728'
+NOT_SCORED_COLOR = np.array([0x7f, 0x7f, 0x7f], dtype=np.uint8)  # '#7f7f7f'
+# Prediction of a segment the early-exit vote never scored
+NOT_SCORED = -1
+BACKGROUND = 255
+FRAME = 0
+
+# Same figure geometry as the matplotlib version: 12x8 in at 100 dpi, panels 2:1
+WIDTH, HEIGHT = 1200, 800
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM, PANEL_GAP = 70, 20, 40, 30, 60
+
+# 5x7 bitmap glyphs for the titles, tick labels and axis labels (only the characters they use)
+_GLYPHS = {
+    '0': ("01110", "10001", "10011", "10101", "11001", "10001", "01110"),
+    '1': ("00100", "01100", "00100", "00100", "00100", "00100", "01110"),
+    '2': ("01110", "10001", "00001", "00010", "00100", "01000", "11111"),
+    '3': ("11111", "00010", "00100", "00010", "00001", "10001", "01110"),
+    '4': ("00010", "00110", "01010", "10010", "11111", "00010", "00010"),
+    '5': ("11111", "10000", "11110", "00001", "00001", "10001", "01110"),
+    '6': ("00110", "01000", "10000", "11110", "10001", "10001", "01110"),
+    '7': ("11111", "00001", "00010", "00100", "01000", "01000", "01000"),
+    '8': ("01110", "10001", "10001", "01110", "10001", "10001", "01110"),
+    '9': ("01110", "10001", "10001", "01111", "00001", "00010", "01100"),
+    ':': ("00000", "01100", "01100", "00000", "01100", "01100", "00000"),
+    '(': ("00010", "00100", "01000", "01000", "01000", "00100", "00010"),
+    ')': ("01000", "00100", "00010", "00010", "00010", "00100", "01000"),
+    '=': ("00000", "00000", "11111", "00000", "11111", "00000", "00000"),
+    ',': ("00000", "00000", "00000", "00000", "01100", "00100", "01000"),
+    ' ': ("00000",) * 7,
+    'B': ("11110", "10001", "10001", "11110", "10001", "10001", "11110"),
+    'F': ("11111", "10000", "10000", "11110", "10000", "10000", "10000"),
+    'G': ("01110", "10001", "10000", "10111", "10001", "10001", "01111"),
+    'H': ("10001", "10001", "10001", "11111", "10001", "10001", "10001"),
+    'N': ("10001", "10001", "11001", "10101", "10011", "10001", "10001"),
+    'P': ("11110", "10001", "10001", "11110", "10000", "10000", "10000"),
+    'S': ("01111", "10000", "10000", "01110", "00001", "00001", "11110"),
+    'T': ("11111", "00100", "00100", "00100", "00100", "00100", "00100"),
+    'V': ("10001", "10001", "10001", "10001", "10001", "01010", "00100"),
+    'a': ("00000", "00000", "01110", "00001", "01111", "10001", "01111"),
+    'c': ("00000", "00000", "01110", "10000", "10000", "10001", "01110"),
+    'd': ("00001", "00001", "01101", "10011", "10001", "10001", "01111"),
+    'e': ("00000", "00000", "01110", "10001", "11111", "10000", "01110"),
+    'g': ("00000", "01111", "10001", "10001", "01111", "00001", "01110"),
+    'i': ("00100", "00000", "01100", "00100", "00100", "00100", "01110"),
+    'l': ("01100", "00100", "00100", "00100", "00100", "00100", "01110"),
+    'm': ("00000", "00000", "11010", "10101", "10101", "10001", "10001"),
+    'n': ("00000", "00000", "10110", "11001", "10001", "10001", "10001"),
+    'o': ("00000", "00000", "01110", "10001", "10001", "10001", "01110"),
+    'p': ("00000", "11110", "10001", "10001", "11110", "10000", "10000"),
+    'r': ("00000", "00000", "10110", "11001", "10000", "10000", "10000"),
+    's': ("00000", "00000", "01110", "10000", "01110", "00001", "11110"),
+    't': ("01000", "01000", "11100", "01000", "01000", "01001", "00110"),
+    'u': ("00000", "00000", "10001", "10001", "10001", "10011", "01101"),
+    'y': ("00000", "10001", "10001", "10001", "01111", "00001", "01110"),
+    'z': ("00000", "00000", "11111", "00010", "00100", "01000", "11111"),
+}
+GLYPH_WIDTH, GLYPH_HEIGHT = 5, 7
+# Candidate time-axis tick spacings in seconds; the first giving at most MAX_TIME_TICKS intervals is used
+TIME_TICK_STEPS = (1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200)
+MAX_TIME_TICKS = 8
+TICK_LENGTH = 4
+
+def text_width(text, scale=1):
+    return len(text) * (GLYPH_WIDTH + 1) * scale - scale
+
+def draw_text(canvas, text, x, y, scale=1, align='left'):
+    """Draws `text` with its top at row `y`; `x` is its left edge, centre or right edge per `align`."""
+    if align == 'center':
+        x -= text_width(text, scale) // 2
+    elif align == 'right':
+        x -= text_width(text, scale)
+    for char in text:
+        glyph = _GLYPHS.get(char, _GLYPHS[' '])
+        mask = np.array([[bit == '1' for bit in row] for row in glyph]).repeat(scale, axis=0).repeat(scale, axis=1)
+        region = canvas[y:y + mask.shape[0], x:x + mask.shape[1]]
+        region[mask[:region.shape[0], :region.shape[1]]] = FRAME
+        x += (GLYPH_WIDTH + 1) * scale
+
+def format_time(seconds):
+    """Tick label like librosa's time axis: m:ss, or h:mm:ss from an hour on."""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
+
+def _symlog(f, linthresh, base=2.0, linscale=0.5):
+    # matplotlib's SymmetricalLogTransform, as used by specshow(y_axis='log')
+    linscale_adj = linscale / (1.0 - base ** -1)
+    f = np.asarray(f, dtype=np.float64)
+    out = np.where(
+        f <= linthresh,
+        f * linscale_adj,
+        linthresh * (linscale_adj + np.log(np.maximum(f, linthresh) / linthresh) / np.log(base)),
+    )
+    return out
+
+# note_to_hz('C2'): where librosa's log frequency axis turns linear
+LOG_AXIS_LINTHRESH = 65.40639132514966
+
+@lru_cache(maxsize=32)
+def _log_frequency_rows(n_bins, sr, height):
+    """Spectrogram bin index for each output row (top row = Nyquist) on librosa's log axis."""
+    linthresh = LOG_AXIS_LINTHRESH
+    bin_freqs = np.linspace(0, sr / 2, n_bins)
+    scaled_bins = _symlog(bin_freqs, linthresh)
+    row_positions = np.linspace(scaled_bins[-1], 0, height)
+    # Nearest bin on the scaled axis
+    idx = np.searchsorted(scaled_bins, row_positions)
+    idx = np.clip(idx, 1, n_bins - 1)
+    left_closer = (row_positions - scaled_bins[idx - 1]) < (scaled_bins[idx] - row_positions)
+    return np.where(left_closer, idx - 1, idx)
+
+def _time_columns(n_frames, width):
+    return np.minimum(((np.arange(width) + 0.5) * n_frames / width).astype(np.int64), n_frames - 1)
+
+def spectrogram_to_rgb(spectrogram_db, sr, width, height):
+    """Maps a dB spectrogram to an RGB image through the colormap LUT (auto-scaled like pcolormesh)."""
+    rows = _log_frequency_rows(spectrogram_db.shape[0], sr, height)
+    cols = _time_columns(spectrogram_db.shape[1], width)
+    s_min, s_max = float(np.min(spectrogram_db)), float(np.max(spectrogram_db))
+    # Index the (small) LUT per pixel instead of normalising the full-resolution spectrogram
+    resampled = spectrogram_db[np.ix_(rows, cols)]
+    scale = (_LUT_SIZE - 1) / (s_max - s_min) if s_max > s_min else 0.0
+    levels = np.clip((resampled - s_min) * scale, 0, _LUT_SIZE - 1).astype(np.uint8)
+    return COLORMAP_LUT[levels]
+
+def votes_to_rgb(predictions, final_vote, width, height):
+    """One bar per segment (80% of its slot, as with ax.bar), blue for the final vote, red otherwise, grey if NOT_SCORED."""
+    image = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+    n = len(predictions)
+    if n == 0:
+        return image
+    x = (np.arange(width) + 0.5) * n / width
+    slot = np.minimum(x.astype(np.int64), n - 1)
+    inside = np.abs(x - (slot + 0.5)) <= 0.4
+    votes = np.asarray(predictions)[slot][:, None]
+    colors = np.where(votes == final_vote, FINAL_VOTE_COLOR, np.where(votes == NOT_SCORED, NOT_SCORED_COLOR, OTHER_VOTE_COLOR))
+    image[:, inside] = colors[inside]
+    return image
+
+def _draw_frame(canvas, top, left, height, width):
+    canvas[top, left:left + width] = FRAME
+    canvas[top + height - 1, left:left + width] = FRAME
+    canvas[top:top + height, left] = FRAME
+    canvas[top:top + height, left + width - 1] = FRAME
+
+def encode_png(rgb, compress_level=3):
+    """Minimal RGB8 PNG encoder (filter type 0 on every scanline)."""
+    height, width, _ = rgb.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", header),
+        chunk(b"IDAT", zlib.compress(raw.tobytes(), compress_level)),
+        chunk(b"IEND", b""),
+    ])
+
+def _frequency_ticks(canvas, sr, top, left, height):
+    """Hz labels at 0 and the powers of two from 64 Hz, placed on the same symlog scale as the rows."""
+    nyquist = sr / 2
+    frequencies = [0] + [2 ** k for k in range(6, 16) if 2 ** k <= nyquist]
+    scaled_top = float(_symlog(nyquist, LOG_AXIS_LINTHRESH))
+    last_row = None
+    for frequency in frequencies:
+        row = top + height - 1 - int(round(float(_symlog(frequency, LOG_AXIS_LINTHRESH)) / scaled_top * (height - 1)))
+        if last_row is not None and last_row - row < GLYPH_HEIGHT + 3:
+            continue
+        canvas[row, left - TICK_LENGTH:left] = FRAME
+        draw_text(canvas, str(frequency), left - TICK_LENGTH - 3, row - GLYPH_HEIGHT // 2, align='right')
+        last_row = row
+    draw_text(canvas, "Hz", 4, top + height // 2 - GLYPH_HEIGHT // 2)
+
+def _time_ticks(canvas, duration, top, left, width):
+    """m:ss labels under the spectrogram at a round spacing, plus the axis label."""
+    step = next((step for step in TIME_TICK_STEPS if duration / step <= MAX_TIME_TICKS), TIME_TICK_STEPS[-1])
+    for i in range(int(duration // step) + 1):
+        x = left + min(width - 1, int(round(i * step / duration * width)))
+        canvas[top:top + TICK_LENGTH, x] = FRAME
+        draw_text(canvas, format_time(i * step), x, top + TICK_LENGTH + 2, align='center')
+    draw_text(canvas, "Time", left + width // 2, top + TICK_LENGTH + GLYPH_HEIGHT + 6, align='center')
+
+def render_analysis_image(spectrogram_db, sr, predictions, final_vote, width=WIDTH, height=HEIGHT, hop_length=None):
+    """
+    Composes the spectrogram panel (top, 2/3) and segment-vote panel (bottom, 1/3)
+    into one RGB array, with the matplotlib figure's titles, Hz axis and (given
+    `hop_length`) time axis.
+    """
+    canvas = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+    panel_width = width - MARGIN_LEFT - MARGIN_RIGHT
+    panels_height = height - MARGIN_TOP - MARGIN_BOTTOM - PANEL_GAP
+    spec_height = panels_height * 2 // 3
+    votes_height = panels_height - spec_height
+    votes_top = MARGIN_TOP + spec_height + PANEL_GAP
+
+    canvas[MARGIN_TOP:MARGIN_TOP + spec_height, MARGIN_LEFT:MARGIN_LEFT + panel_width] = \
+        spectrogram_to_rgb(spectrogram_db, sr, panel_width, spec_height)
+    canvas[votes_top:votes_top + votes_height, MARGIN_LEFT:MARGIN_LEFT + panel_width] = \
+        votes_to_rgb(predictions, final_vote, panel_width, votes_height)
+    _draw_frame(canvas, MARGIN_TOP, MARGIN_LEFT, spec_height, panel_width)
+    _draw_frame(canvas, votes_top, MARGIN_LEFT, votes_height, panel_width)
+
+    title_height = GLYPH_HEIGHT * 2
+    center = MARGIN_LEFT + panel_width // 2
+    draw_text(canvas, "Spectrogram", center, MARGIN_TOP - title_height - 8, scale=2, align='center')
+    draw_text(canvas, "Segment Predictions (Blue = Final Vote, Grey = Not Scored)", center, votes_top - title_height - 8,
+              scale=2, align='center')
+    _frequency_ticks(canvas, sr, MARGIN_TOP, MARGIN_LEFT, spec_height)
+    if hop_length and spectrogram_db.shape[1]:
+        _time_ticks(canvas, spectrogram_db.shape[1] * hop_length / sr, MARGIN_TOP + spec_height, MARGIN_LEFT, panel_width)
+    return canvas
+
+def render_spectrogram_png(spectrogram_db, sr, hop_length, predictions, final_vote, img_path):
+    """Drop-in replacement for `render_visualization` that never touches matplotlib (thread-safe)."""
+    rgb = render_analysis_image(spectrogram_db, sr, predictions, final_vote, hop_length=hop_length)
+    with open(img_path, "wb") as f:
+        f.write(encode_png(rgb))
@@ -0,0 +1,103 @@
+import numpy as np
+import librosa
+
+# Same framing as librosa.effects.split / zero_crossing_rate defaults
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+
+# Hop blocks squared and summed per chunk in frame_energy_db, so the float64 temporary stays small
+ENERGY_CHUNK_HOPS = 4096
+
+def frame_energy_db(y, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """
+    Centred-frame RMS energy in dB relative to the loudest frame, as computed by
+    librosa.effects.split. Frames are whole hop blocks (frame_length is a
+    multiple of hop_length), so the energy comes from per-block sums of y^2,
+    taken a chunk at a time: memory beyond `y` is a few values per hop.
+    """
+    if frame_length % (2 * hop_length):
+        raise ValueError("frame_length must be an even multiple of hop_length")
+    n_blocks, remainder = divmod(len(y), hop_length)
+    block_energy = np.empty(n_blocks + (remainder > 0))
+    for start in range(0, n_blocks, ENERGY_CHUNK_HOPS):
+        stop = min(start + ENERGY_CHUNK_HOPS, n_blocks)
+        chunk = y[start * hop_length:stop * hop_length].reshape(-1, hop_length)
+        block_energy[start:stop] = np.square(chunk, dtype=np.float64).sum(axis=1)
+    if remainder:
+        block_energy[-1] = np.square(y[n_blocks * hop_length:], dtype=np.float64).sum()
+    # Frame i covers blocks i - width/2 .. i + width/2 - 1, zero-padded at both ends
+    width = frame_length // hop_length
+    padded = np.concatenate((np.zeros(width // 2 + 1), block_energy, np.zeros(width)))
+    energy = np.cumsum(padded)
+    mean_square = (energy[width:width + n_blocks + 1] - energy[:n_blocks + 1]) / frame_length
+    db = 10 * np.log10(np.maximum(mean_square, 1e-10))
+    return db - db.max()
+
+def non_silent_intervals(energy_db, top_db, n_samples, hop_length=HOP_LENGTH):
+    """(start, end) sample intervals of frames louder than -top_db; matches librosa.effects.split."""
+    loud = np.concatenate(([False], energy_db > -top_db, [False]))
+    edges = np.flatnonzero(loud[1:] != loud[:-1])
+    return np.minimum(edges * hop_length, n_samples).reshape(-1, 2)
+
+def zero_crossing_rate(y, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH, threshold=1e-10):
+    """librosa.feature.zero_crossing_rate (centred, edge-padded) from a cumulative count of sign changes."""
+    y = np.pad(y, frame_length // 2, mode='edge')
+    negative = y < -threshold
+    crossings = np.concatenate(([0, 0], np.cumsum(negative[1:] != negative[:-1])))
+    starts = np.arange(1 + (len(y) - frame_length) // hop_length) * hop_length
+    return (crossings[starts + frame_length] - crossings[starts + 1]) / frame_length
+
+def spectral_centroid(magnitude, sr, n_fft=FRAME_LENGTH):
+    total = magnitude.sum(axis=0)
+    weighted = librosa.fft_frequencies(sr=sr, n_fft=n_fft).astype(magnitude.dtype) @ magnitude
+    return np.divide(weighted, total, out=np.zeros_like(weighted), where=total > np.finfo(magnitude.dtype).tiny)
+
+def extract_speech_features(y, sr, n_fft=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """
+    Normalized pause frequency, speech rate, vocabulary complexity and semantic
+    fluency of a mono waveform. Both pause thresholds come from one RMS
+    envelope, and everything else from one magnitude STFT.
+    """
+    duration = len(y) / sr
+    energy_db = frame_energy_db(y, n_fft, hop_length)
+
+    # Pause Frequency: gaps longer than 150 ms between 20 dB intervals
+    intervals = non_silent_intervals(energy_db, 20, len(y), hop_length)
+    if len(intervals) > 1:
+        gaps = (intervals[1:, 0] - intervals[:-1, 1]) / sr
+        pause_freq = np.count_nonzero(gaps > 0.15) / (duration / 60) if duration > 0 else 0
+        pause_freq_norm = min(pause_freq / 40, 1.0)
+    else:
+        pause_freq_norm = 0.1
+
+    magnitude = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length, win_length=n_fft, window='hann'))
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=magnitude ** 2, sr=sr, n_fft=n_fft))
+
+    # Speech Rate: onsets per second of 25 dB speech
+    speech_intervals = non_silent_intervals(energy_db, 25, len(y), hop_length)
+    speech_duration = np.sum(speech_intervals[:, 1] - speech_intervals[:, 0]) / sr
+    if speech_duration > 0:
+        onset_envelope = librosa.onset.onset_strength(S=mel_db, sr=sr, hop_length=hop_length)
+        onsets = librosa.onset.onset_detect(onset_envelope=onset_envelope, sr=sr, hop_length=hop_length, units='frames')
+        wpm = (len(onsets) / 1.4 / speech_duration) * 60
+        speech_rate_norm = min((wpm - 50) / 200, 1.0) if wpm >= 100 else wpm / 200
+    else:
+        speech_rate_norm = 0.3
+
+    # Vocabulary & Fluency Proxies
+    centroid_var = np.var(spectral_centroid(magnitude, sr, n_fft))
+    mfcc_var = np.mean(np.var(librosa.feature.mfcc(S=mel_db, sr=sr, n_mfcc=13), axis=1))
+    vocab_complexity_norm = np.clip((centroid_var / 1000000 + mfcc_var / 50) / 3, 0, 1)
+
+    zcr_stability = 1 - np.std(zero_crossing_rate(y, n_fft, hop_length))
+    flux = np.sum(np.square(np.diff(magnitude, axis=1)), axis=0)
+    flux_smoothness = 1 - (np.std(flux) / (np.mean(flux) + 1e-8))
+    semantic_fluency_norm = np.clip((max(zcr_stability, 0) + max(flux_smoothness, 0)) / 2, 0, 1)
+
+    # Rounded as Python floats: float32 STFT statistics would otherwise leak 0.800000011920929 into the JSON
+    return {
+        'pauseFrequency': round(float(np.clip(pause_freq_norm, 0.1, 0.9)), 2),
+        'speechRate': round(float(np.clip(speech_rate_norm, 0.2, 0.9)), 2),
+        'vocabularyComplexity': round(float(np.clip(vocab_complexity_norm, 0.3, 0.8)), 2),
+        'semanticFluency': round(float(np.clip(semantic_fluency_norm, 0.3, 0.9)), 2)
+    }
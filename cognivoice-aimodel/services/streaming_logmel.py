@@ -0,0 +1,267 @@
+import os
+import math
+import logging
+import numpy as np
+import librosa
+import soundfile as sf
+import soxr
+from .spectral_features import SpectralFeatures, HOP_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# librosa.feature.delta's default Savitzky-Golay window: each delta needs this many frames either side
+DELTA_WIDTH = 9
+DELTA_CONTEXT = DELTA_WIDTH // 2
+# Extra resampler input read around a randomly accessed range, in output samples
+RESAMPLE_MARGIN = 800
+
+def audio_duration(audio):
+    """Length in seconds of a path or `(y, sr)` buffer, or None if it cannot be read cheaply."""
+    if isinstance(audio, (str, os.PathLike)):
+        try:
+            return sf.info(audio).duration
+        except RuntimeError:
+            return None
+    if isinstance(audio, tuple):
+        y, sr = audio
+        return y.shape[-1] / sr
+    return None
+
+def use_streaming(audio, features_config):
+    """True when `audio` is long enough for FEATURES["streaming_min_duration_s"] to apply."""
+    threshold = features_config.get("streaming_min_duration_s")
+    if not threshold or isinstance(audio, SpectralFeatures):
+        return False
+    duration = audio_duration(audio)
+    return duration is not None and duration >= threshold
+
+def iter_audio_blocks(audio, sample_rate, block_seconds):
+    """
+    Mono float32 blocks of a path or `(y, sr)` buffer at `sample_rate`. Files are
+    read block by block and resampled as a stream, which gives the same samples
+    as resampling the whole signal at once.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        with sf.SoundFile(audio) as f:
+            blocks = (block.mean(axis=1) for block in f.blocks(int(block_seconds * f.samplerate), dtype='float32', always_2d=True))
+            yield from _resampled(blocks, f.samplerate, sample_rate)
+    else:
+        y, sr = audio
+        step = int(block_seconds * sr)
+        blocks = (librosa.to_mono(y[..., start:start + step]).astype(np.float32, copy=False) for start in range(0, y.shape[-1], step))
+        yield from _resampled(blocks, sr, sample_rate)
+
+def _resampled(blocks, source_sr, sample_rate):
+    if source_sr == sample_rate:
+        yield from blocks
+        return
+    stream = soxr.ResampleStream(source_sr, sample_rate, 1, dtype='float32', quality='HQ')
+    for block in blocks:
+        out = stream.resample_chunk(np.ascontiguousarray(block))
+        if len(out):
+            yield out
+    tail = stream.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+    if len(tail):
+        yield tail
+
+class LogMelStream:
+    """
+    Bounded-memory counterpart of SpectralFeatures.logmel_stack + segmentation
+    for long recordings. Iterating yields the same (3, n_mels, segment_length)
+    segments as `process_audio_to_logmel_segments`, one at a time.
+
+    The audio is read twice in blocks: a first pass finds the frame count and
+    the maxima that the `ref=np.max` decibel scales need, the second computes
+    log-mel and deltas block by block (with DELTA_CONTEXT frames of overlap) and
+    a time-pooled spectrogram for the visualization. Memory depends on the
+    block size, not on the recording length, but only for this stage: from a
+    path the audio is read block by block, whereas the service hands it a clean
+    `(y, sr)` buffer that the preprocessing already holds whole (see
+    `Preprocessor.run_full_pipeline_in_memory`), and `to_array` materializes
+    every segment.
+
+    `stream[i]` extracts segment i on its own (reading just the audio it
+    covers), for callers that score segments out of order; the visualization
+    then takes one more STFT pass when it is first needed.
+    """
+    def __init__(self, audio, features_config, block_seconds=None, max_columns=2400, n_fft=2048, hop_length=HOP_LENGTH):
+        self.audio = audio
+        self.sr = features_config['sample_rate']
+        self.n_mels = features_config['n_mels']
+        self.segment_length = features_config['segment_length']
+        self.block_seconds = block_seconds or features_config.get('streaming_block_s', 30)
+        self.max_columns = max_columns
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.mel_basis = librosa.filters.mel(sr=self.sr, n_fft=n_fft, n_mels=self.n_mels)
+        self.n_frames = None
+        self.n_samples = None
+        self._visualization = None
+        self._max_magnitude = None
+        self._max_mel = None
+
+    def __len__(self):
+        """Number of segments (runs the first pass if it has not run yet)."""
+        self._scan()
+        return self.n_frames // self.segment_length
+
+    def _magnitude_blocks(self):
+        """|STFT| frames block by block, identical to librosa.stft(center=True) of the whole signal."""
+        pad = self.n_fft // 2
+        buffer = np.zeros(pad, dtype=np.float32)
+        self.n_samples = 0
+        blocks = iter_audio_blocks(self.audio, self.sr, self.block_seconds)
+        for block in _chain(self._counted(blocks), np.zeros(pad, dtype=np.float32)):
+            buffer = np.concatenate([buffer, block])
+            if len(buffer) < self.n_fft:
+                continue
+            n_frames = 1 + (len(buffer) - self.n_fft) // self.hop_length
+            used = (n_frames - 1) * self.hop_length + self.n_fft
+            yield np.abs(librosa.stft(buffer[:used], n_fft=self.n_fft, hop_length=self.hop_length, window='hann', center=False))
+            buffer = buffer[n_frames * self.hop_length:]
+
+    def _counted(self, blocks):
+        for block in blocks:
+            self.n_samples += len(block)
+            yield block
+
+    def _scan(self):
+        if self.n_frames is not None:
+            return
+        n_frames, max_magnitude, max_mel = 0, np.float32(0), np.float32(0)
+        for magnitude in self._magnitude_blocks():
+            n_frames += magnitude.shape[1]
+            max_magnitude = max(max_magnitude, magnitude.max())
+            max_mel = max(max_mel, self._mel(magnitude).max())
+        self.n_frames, self._max_magnitude, self._max_mel = n_frames, max_magnitude, max_mel
+
+    def _mel(self, magnitude):
+        return self.mel_basis @ magnitude ** 2
+
+    def _log_mel(self, magnitude):
+        return np.maximum(librosa.power_to_db(self._mel(magnitude), ref=self._max_mel, top_db=None), -80.0)
+
+    def _spectrogram_db(self, magnitude):
+        return np.maximum(librosa.amplitude_to_db(magnitude, ref=self._max_magnitude, top_db=None), -80.0)
+
+    @property
+    def visualization(self):
+        """Time-pooled spectrogram as a SpectralFeatures, from the sequential pass or a dedicated STFT pass."""
+        if self._visualization is None:
+            self._scan()
+            pooling = _ColumnPooler(-(-self.n_frames // self.max_columns))
+            for magnitude in self._magnitude_blocks():
+                pooling.add(self._spectrogram_db(magnitude))
+            self._visualization = pooling.visualization(self.sr, self.hop_length)
+        return self._visualization
+
+    def __iter__(self):
+        self._scan()
+        if self.n_frames < self.segment_length:
+            logger.warning("Audio is too short to create a full segment.")
+            return
+        pooling = _ColumnPooler(-(-self.n_frames // self.max_columns))
+        window = np.zeros((self.n_mels, 0), dtype=np.float32)  # log-mel frames still needed as delta context
+        window_start = 0
+        pending = np.zeros((3, self.n_mels, 0), dtype=np.float32)
+        for magnitude in self._magnitude_blocks():
+            pooling.add(self._spectrogram_db(magnitude))
+            log_mel = self._log_mel(magnitude)
+            window = np.concatenate([window, log_mel], axis=1)
+            final = window_start + window.shape[1] == self.n_frames
+            if window.shape[1] < DELTA_WIDTH and not final:
+                continue
+            # Deltas are exact away from the window edges, and at the recording's own first/last frames
+            first = 0 if window_start == 0 else DELTA_CONTEXT
+            last = window.shape[1] if final else window.shape[1] - DELTA_CONTEXT
+            stack = np.stack([window, librosa.feature.delta(window), librosa.feature.delta(window, order=2)])[:, :, first:last]
+            pending = np.concatenate([pending, stack], axis=2)
+            window_start += last - DELTA_CONTEXT
+            window = window[:, last - DELTA_CONTEXT:]
+            while pending.shape[2] >= self.segment_length:
+                yield np.ascontiguousarray(pending[:, :, :self.segment_length])
+                pending = pending[:, :, self.segment_length:]
+        # Only a full pass leaves a complete image; a consumer that stops early gets the dedicated pass instead
+        self._visualization = pooling.visualization(self.sr, self.hop_length)
+
+    def __getitem__(self, index):
+        """Segment `index` alone: its frames plus DELTA_CONTEXT on each side, from just the audio they cover."""
+        self._scan()
+        first, stop = index * self.segment_length, (index + 1) * self.segment_length
+        if index < 0 or stop > self.n_frames:
+            raise IndexError(index)
+        window_first, window_stop = max(0, first - DELTA_CONTEXT), min(self.n_frames, stop + DELTA_CONTEXT)
+        pad = self.n_fft // 2
+        y = self._samples(window_first * self.hop_length - pad, (window_stop - 1) * self.hop_length + pad)
+        magnitude = np.abs(librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length, window='hann', center=False))
+        window = self._log_mel(magnitude)
+        # At the recording's first/last frames the window shares its edges, so librosa's edge fit matches too
+        stack = np.stack([window, librosa.feature.delta(window), librosa.feature.delta(window, order=2)])
+        return np.ascontiguousarray(stack[:, :, first - window_first:stop - window_first])
+
+    def _samples(self, start, stop):
+        """Mono samples [start, stop) at self.sr, zero outside the recording."""
+        out = np.zeros(stop - start, dtype=np.float32)
+        lo, hi = max(start, 0), min(stop, self.n_samples)
+        if isinstance(self.audio, (str, os.PathLike)):
+            with sf.SoundFile(self.audio) as f:
+                source_sr, n_source = f.samplerate, f.frames
+                read = lambda a, b: (f.seek(a), f.read(b - a, dtype='float32', always_2d=True).mean(axis=1))[1]
+                samples = _resample_range(read, source_sr, n_source, self.sr, lo, hi)
+        else:
+            y, source_sr = self.audio
+            read = lambda a, b: librosa.to_mono(y[..., a:b]).astype(np.float32, copy=False)
+            samples = _resample_range(read, source_sr, y.shape[-1], self.sr, lo, hi)
+        out[lo - start:lo - start + len(samples)] = samples
+        return out
+
+    def to_array(self):
+        """All segments in one preallocated (N, 3, n_mels, segment_length) array, or None if there are none."""
+        n_segments = len(self)
+        if n_segments == 0:
+            list(self)
+            return None
+        segments = np.empty((n_segments, 3, self.n_mels, self.segment_length), dtype=np.float32)
+        for i, segment in enumerate(self):
+            segments[i] = segment
+        return segments
+
+def _chain(blocks, tail):
+    yield from blocks
+    yield tail
+
+class _ColumnPooler:
+    """Incremental `pool_columns`: averages consecutive groups of `factor` frames as they arrive."""
+    def __init__(self, factor):
+        self.factor = max(1, factor)
+        self._columns = []
+        self._leftover = None
+
+    def add(self, frames):
+        if self._leftover is not None:
+            frames = np.concatenate([self._leftover, frames], axis=1)
+        n_full = frames.shape[1] // self.factor
+        if n_full:
+            grouped = frames[:, :n_full * self.factor].reshape(frames.shape[0], n_full, self.factor)
+            self._columns.append(grouped.mean(axis=2) if self.factor > 1 else grouped[:, :, 0])
+        self._leftover = frames[:, n_full * self.factor:]
+
+    def visualization(self, sr, hop_length):
+        if self._leftover is not None and self._leftover.shape[1]:
+            self._columns.append(self._leftover.mean(axis=1, keepdims=True))
+        return SpectralFeatures.for_visualization(np.concatenate(self._columns, axis=1), sr, hop_length * self.factor)
+
+def _resample_range(read, source_sr, n_source, sample_rate, start, stop):
+    """
+    Output samples [start, stop) of resampling a whole signal, from only the
+    source samples around them. The read starts on a sample that maps exactly
+    onto the output grid, with RESAMPLE_MARGIN samples of filter context.
+    """
+    if source_sr == sample_rate:
+        return read(start, stop)
+    step = source_sr // math.gcd(source_sr, sample_rate)
+    source_start = max(0, (start - RESAMPLE_MARGIN) * source_sr // sample_rate // step * step)
+    source_stop = min(n_source, -(-(stop + RESAMPLE_MARGIN) * source_sr // sample_rate))
+    resampled = soxr.resample(read(source_start, source_stop), source_sr, sample_rate, quality='HQ')
+    offset = source_start * sample_rate // source_sr
+    return resampled[start - offset:stop - offset]
@@ -0,0 +1,144 @@
+import os
+import time
+import queue
+import logging
+import threading
+import numpy as np
+from .instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+def pool_columns(spectrogram_db, max_columns):
+    """Averages groups of time frames so at most `max_columns` remain. Returns (spectrogram, factor)."""
+    n_frames = spectrogram_db.shape[1]
+    factor = -(-n_frames // max_columns)
+    if factor <= 1:
+        return spectrogram_db, 1
+    n_full = n_frames // factor
+    pooled = spectrogram_db[:, :n_full * factor].reshape(spectrogram_db.shape[0], n_full, factor).mean(axis=2)
+    if n_full * factor < n_frames:
+        pooled = np.concatenate([pooled, spectrogram_db[:, n_full * factor:].mean(axis=1, keepdims=True)], axis=1)
+    return pooled, factor
+
+class VisualizationCache:
+    """
+    Defers spectrogram/vote images until they are needed. `register` stores a
+    compact render spec and returns the image URL straight away; the PNG is drawn
+    the first time it is requested (or earlier by a background worker), then kept
+    in `static_folder` subject to age- and size-based eviction.
+    """
+    def __init__(self, static_folder, render_fn, max_bytes, max_age_seconds, max_columns=2400, prerender=True):
+        self.static_folder = static_folder
+        self.pending_folder = os.path.join(static_folder, '.pending')
+        os.makedirs(self.pending_folder, exist_ok=True)
+        self.render_fn = render_fn
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.max_columns = max_columns
+        # Rendering backends (matplotlib in particular) are not safe to drive from several threads
+        self._render_lock = threading.Lock()
+        self._queue = None
+        if prerender:
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._prerender_loop, name="visualization-prerender", daemon=True)
+            self._worker.start()
+
+    @classmethod
+    def from_config(cls, viz_config, render_fn):
+        return cls(
+            viz_config["static_folder"],
+            render_fn,
+            max_bytes=viz_config["max_cache_mb"] * 1024 * 1024,
+            max_age_seconds=viz_config["max_age_hours"] * 3600,
+            max_columns=viz_config.get("max_columns", 2400),
+            prerender=viz_config.get("prerender", True),
+        )
+
+    def _pending_path(self, img_name):
+        return os.path.join(self.pending_folder, img_name + '.npz')
+
+    def register(self, img_name, spectral, predictions, final_vote):
+        spectrogram_db, factor = pool_columns(spectral.spectrogram_db, self.max_columns)
+        np.savez(
+            self._pending_path(img_name),
+            spectrogram_db=spectrogram_db.astype(np.float16),
+            sr=spectral.sr,
+            hop_length=spectral.hop_length * factor,
+            predictions=np.asarray(predictions, dtype=np.int8),
+            final_vote=final_vote,
+        )
+        if self._queue is not None:
+            self._queue.put(img_name)
+        return f'/static_predictions/{img_name}'
+
+    def exists(self, img_name):
+        """True if the image is rendered or still has a pending render spec."""
+        img_name = os.path.basename(img_name)
+        return os.path.exists(os.path.join(self.static_folder, img_name)) or os.path.exists(self._pending_path(img_name))
+
+    def get_path(self, img_name):
+        """Returns the PNG path for `img_name`, rendering it first if needed, or None if unknown."""
+        img_name = os.path.basename(img_name)
+        img_path = os.path.join(self.static_folder, img_name)
+        if not os.path.exists(img_path):
+            self._render(img_name)
+        if not os.path.exists(img_path):
+            return None
+        os.utime(img_path)  # Most recently used images are evicted last
+        return img_path
+
+    def _render(self, img_name):
+        img_path = os.path.join(self.static_folder, img_name)
+        pending_path = self._pending_path(img_name)
+        with self._render_lock:
+            if os.path.exists(img_path) or not os.path.exists(pending_path):
+                return
+            with np.load(pending_path) as spec, stage("visualization_render"):
+                tmp_path = img_path + '.tmp.png'
+                self.render_fn(
+                    spec['spectrogram_db'].astype(np.float32),
+                    int(spec['sr']),
+                    int(spec['hop_length']),
+                    spec['predictions'].tolist(),
+                    int(spec['final_vote']),
+                    tmp_path,
+                )
+            os.replace(tmp_path, img_path)
+            os.remove(pending_path)
+        logger.info(f"Rendered visualization {img_name}")
+        self.evict()
+
+    def _prerender_loop(self):
+        while True:
+            img_name = self._queue.get()
+            if img_name is None:
+                break
+            try:
+                self._render(img_name)
+            except Exception as e:
+                logger.error(f"Failed to render visualization {img_name}: {e}")
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        for folder in (self.static_folder, self.pending_folder):
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if not os.path.isfile(path) or name.endswith('.tmp.png'):
+                    continue
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.max_age_seconds:
+                    os.remove(path)
+                elif folder == self.static_folder:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def shutdown(self):
+        if self._queue is not None:
+            self._queue.put(None)
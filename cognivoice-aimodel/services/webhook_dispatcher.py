@@ -0,0 +1,249 @@
+import heapq
+import random
+import time
+import logging
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from .instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+class _Slot:
+    """Delivery state of one request_id: only its newest undelivered update is kept."""
+    def __init__(self):
+        self.update = None       # (payload, is_final, outbox_id)
+        self.attempts = 0
+        self.state = "idle"      # idle | ready | delayed | in_flight
+
+class WebhookDispatcher:
+    """
+    Delivers progress updates to the Flask backend from background threads over
+    one pooled keep-alive session, so analysis workers never wait on HTTP.
+
+    Updates are coalesced per request_id: an intermediate step still waiting to
+    be sent is replaced by a newer one, while a final update is never replaced
+    and is retried with exponential backoff. At most one update per request is
+    in flight, so a request's updates arrive in order.
+
+    With an `outbox`, final updates are persisted before their first attempt and
+    only forgotten once delivered (a 2xx, or 409 for a result Flask already has).
+    A final that exhausts its retries stays in the outbox, and a background loop
+    hands due outbox entries back to the workers in batches, which also covers
+    entries left over from a previous run. After `shutdown`, `enqueue` no longer
+    sends anything; a final is still persisted for the next run if it can be.
+    """
+    def __init__(self, url, num_workers=2, timeout_seconds=5, max_retries=5, backoff_base_seconds=0.5, backoff_max_seconds=30,
+                 outbox=None, secret_key=None, redelivery_interval_seconds=30, redelivery_batch_size=50):
+        self.url = url
+        self.outbox = outbox
+        self.secret_key = secret_key
+        self.redelivery_interval = redelivery_interval_seconds
+        self.redelivery_batch_size = redelivery_batch_size
+        self.timeout = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base_seconds
+        self.backoff_max = backoff_max_seconds
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=num_workers))
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=num_workers))
+        self._slots = {}
+        self._ready = deque()
+        self._delayed = []  # heap of (due, sequence, request_id)
+        self._sequence = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._sent = 0
+        self._coalesced = 0
+        self._retries = 0
+        self._dropped = 0
+        self._redelivered = 0
+        self._stopping = threading.Event()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"webhook-{i}", daemon=True) for i in range(num_workers)
+        ]
+        if outbox is not None:
+            self._workers.append(threading.Thread(target=self._redeliver, name="webhook-outbox", daemon=True))
+        for worker in self._workers:
+            worker.start()
+
+    @classmethod
+    def from_config(cls, url, webhook_config, outbox=None, outbox_config=None, secret_key=None):
+        outbox_config = outbox_config or {}
+        return cls(
+            url,
+            num_workers=webhook_config["workers"],
+            timeout_seconds=webhook_config["timeout_seconds"],
+            max_retries=webhook_config["max_retries"],
+            backoff_base_seconds=webhook_config["backoff_base_seconds"],
+            backoff_max_seconds=webhook_config["backoff_max_seconds"],
+            outbox=outbox,
+            secret_key=secret_key,
+            redelivery_interval_seconds=outbox_config.get("redelivery_interval_seconds", 30),
+            redelivery_batch_size=outbox_config.get("batch_size", 50),
+        )
+
+    def enqueue(self, request_id, payload, is_final=False, outbox_id=None):
+        """Queues `payload` for `request_id` and returns immediately (after persisting it, if final)."""
+        if is_final and outbox_id is None and self.outbox is not None:
+            try:
+                outbox_id = self.outbox.record(request_id, payload)
+            except Exception as e:
+                # Still worth a direct attempt; only the redelivery safety net is lost
+                logger.error(f"[{request_id}] Could not persist final update to the outbox: {e}", exc_info=self._running)
+        if not self._running:
+            logger.warning(f"[{request_id}] Webhook dispatcher is shut down; update not sent"
+                           f"{' (kept in the outbox)' if outbox_id is not None else ''}.")
+            return
+        superseded = None
+        with self._cond:
+            slot = self._slots.setdefault(request_id, _Slot())
+            if slot.update is not None:
+                if outbox_id is not None and slot.update[2] == outbox_id:
+                    # Re-claimed from the outbox (lease expired) while this process still holds it
+                    return
+                if slot.update[1] and not is_final:
+                    # Never let a late intermediate step replace a pending or in-flight final update
+                    return
+                if slot.state != "in_flight":
+                    self._coalesced += 1
+                    superseded = slot.update[2]
+            slot.update = (payload, is_final, outbox_id)
+            slot.attempts = 0
+            if slot.state == "idle":
+                slot.state = "ready"
+                self._ready.append(request_id)
+                self._cond.notify()
+        if superseded is not None and superseded != outbox_id:
+            # An undelivered final replaced by a newer final for the same request
+            self.outbox.delete(superseded)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending_requests": len(self._slots),
+                "sent": self._sent,
+                "coalesced": self._coalesced,
+                "retries": self._retries,
+                "dropped": self._dropped,
+                "redelivered": self._redelivered,
+                "outbox": self.outbox.stats() if self.outbox is not None else None,
+            }
+
+    def shutdown(self, timeout=10):
+        """Gives queued updates up to `timeout` seconds to go out, then stops the workers."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._slots and time.monotonic() < deadline:
+                self._cond.wait(timeout=0.1)
+            self._running = False
+            self._stopping.set()
+            self._cond.notify_all()
+        self._session.close()
+
+    def _next_request_id(self):
+        """Blocks until a request has an update due; returns None once shut down."""
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, request_id = heapq.heappop(self._delayed)
+                    self._ready.append(request_id)
+                if self._ready:
+                    request_id = self._ready.popleft()
+                    slot = self._slots[request_id]
+                    slot.state = "in_flight"
+                    return request_id, slot, slot.update
+                self._cond.wait(timeout=(self._delayed[0][0] - now) if self._delayed else None)
+            return None
+
+    def _post(self, payload):
+        with stage("webhook"):
+            response = self._session.post(self.url, json=payload, timeout=self.timeout)
+        if 200 <= response.status_code < 300 or response.status_code == 409:
+            # 409: Flask already has this result, so it counts as delivered
+            return
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            # Rejected (bad secret, unknown request): kept for retry, so a fixed backend can still take it
+            logger.error(f"[{payload.get('request_id')}] Webhook rejected with {response.status_code}: {response.text[:200]}")
+        raise requests.HTTPError(f"{response.status_code} from backend", response=response)
+
+    def _work(self):
+        while True:
+            item = self._next_request_id()
+            if item is None:
+                return
+            request_id, slot, update = item
+            payload, is_final, outbox_id = update
+            try:
+                self._post(payload)
+                delivered, error = True, None
+            except Exception as e:
+                # Anything, not just HTTP errors, goes through the retry path so the worker thread survives it
+                delivered, error = False, e
+                if not isinstance(e, requests.RequestException):
+                    logger.error(f"[{request_id}] Unexpected error sending webhook: {e}", exc_info=True)
+            if delivered and outbox_id is not None:
+                self._outbox_write(self.outbox.delete, outbox_id)
+
+            with self._cond:
+                if delivered:
+                    self._sent += 1
+                    if slot.update is update:
+                        slot.update = None
+                elif slot.update is update:
+                    slot.attempts += 1
+                    if slot.attempts > self.max_retries:
+                        slot.update = None
+                        if outbox_id is not None:
+                            logger.error(f"[{request_id}] Could not send final result to Flask after {slot.attempts} attempts; dead-lettered in the outbox for redelivery. Error: {error}")
+                            self._outbox_write(self.outbox.defer, outbox_id, error, self.redelivery_interval)
+                        else:
+                            self._dropped += 1
+                            level = logging.CRITICAL if is_final else logging.WARNING
+                            logger.log(level, f"[{request_id}] Could not send webhook to Flask after {slot.attempts} attempts! Error: {error}")
+                    else:
+                        self._retries += 1
+                        delay = min(self.backoff_max, self.backoff_base * 2 ** (slot.attempts - 1)) * random.uniform(0.5, 1.0)
+                        slot.state = "delayed"
+                        self._sequence += 1
+                        heapq.heappush(self._delayed, (time.monotonic() + delay, self._sequence, request_id))
+                        self._cond.notify()
+                        continue
+                # Delivered, dropped or superseded while in flight: move on to the newest update, if any
+                if slot.update is not None:
+                    slot.state = "ready"
+                    self._ready.append(request_id)
+                    self._cond.notify()
+                else:
+                    slot.state = "idle"
+                    del self._slots[request_id]
+                    self._cond.notify_all()
+
+    def _outbox_write(self, method, *args):
+        """An outbox update from a worker; a failure (e.g. sqlite3.Error) is logged instead of stopping the thread."""
+        try:
+            method(*args)
+        except Exception as e:
+            logger.error(f"Webhook outbox {method.__name__} failed: {e}", exc_info=True)
+
+    def _redeliver(self):
+        """Feeds due outbox entries back to the workers, a batch at a time, until shut down."""
+        while not self._stopping.is_set():
+            try:
+                entries = self.outbox.claim_due(self.redelivery_batch_size)
+            except Exception as e:
+                logger.error(f"Could not read the webhook outbox: {e}", exc_info=True)
+                entries = []
+            for entry_id, request_id, payload in entries:
+                if self.secret_key is not None:
+                    payload["secret_key"] = self.secret_key
+                self.enqueue(request_id, payload, is_final=True, outbox_id=entry_id)
+            if entries:
+                with self._cond:
+                    self._redelivered += len(entries)
+                logger.info(f"Redelivering {len(entries)} final result(s) from the outbox.")
+            # A full batch means more may be due: keep draining without waiting
+            if len(entries) < self.redelivery_batch_size:
+                self._stopping.wait(self.redelivery_interval)
@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+# The service modules import each other as top-level packages (config_ai, services.*), as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class FakeBackend:
+    """Stands in for Flask's progress webhook: records every JSON body and answers with `status`."""
+    def __init__(self):
+        self.status = 200
+        self.received = []
+        self.lock = threading.Lock()
+        self.delivered = threading.Event()
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with backend.lock:
+                    backend.received.append(body)
+                    status = backend.status
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                if 200 <= status < 300 or status == 409:
+                    backend.delivered.set()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/progress"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def flask_backend():
+    backend = FakeBackend()
+    yield backend
+    backend.close()
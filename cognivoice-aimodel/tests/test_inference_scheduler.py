@@ -0,0 +1,49 @@
+import threading
+import numpy as np
+import pytest
+from services.inference_scheduler import InferenceScheduler
+
+SEGMENT_SHAPE = (3, 4, 4)
+
+class BlockingBackend:
+    """Returns each segment's mean as its probability, optionally holding the first batch until released."""
+    def __init__(self, block=False):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def predict_proba(self, batch):
+        self.started.set()
+        self.release.wait(5)
+        return batch.reshape(len(batch), -1).mean(axis=1).astype(np.float32)
+
+def segments(n, value):
+    return np.full((n, *SEGMENT_SHAPE), value, dtype=np.float32)
+
+def test_concurrent_jobs_get_their_own_probabilities():
+    scheduler = InferenceScheduler(BlockingBackend(), "cpu", max_batch_size=4, max_wait_ms=50)
+    try:
+        futures = [scheduler.submit(segments(3, 0.25)), scheduler.submit(segments(6, 0.75))]
+        first, second = (future.result(timeout=5) for future in futures)
+    finally:
+        scheduler.shutdown()
+    np.testing.assert_allclose(first, [0.25] * 3)
+    np.testing.assert_allclose(second, [0.75] * 6)
+
+def test_shutdown_fails_queued_work_and_rejects_new_work():
+    backend = BlockingBackend(block=True)
+    scheduler = InferenceScheduler(backend, "cpu", max_batch_size=2, max_wait_ms=0)
+    running = scheduler.submit(segments(2, 0.5))
+    assert backend.started.wait(5)
+    queued = scheduler.submit(segments(2, 0.5))
+
+    threading.Timer(0.2, backend.release.set).start()
+    scheduler.shutdown()
+
+    np.testing.assert_allclose(running.result(timeout=5), [0.5, 0.5])
+    with pytest.raises(RuntimeError):
+        queued.result(timeout=5)
+    assert scheduler.stats()["queue_depth"] == 0
+    with pytest.raises(RuntimeError):
+        scheduler.infer(segments(1, 0.5))
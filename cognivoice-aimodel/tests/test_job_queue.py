@@ -0,0 +1,77 @@
+import threading
+import pytest
+from services.job_queue import JobQueue, QueueFullError
+
+def blocking_job(started, release, done):
+    started.set()
+    release.wait(5)
+    done.append(True)
+
+def test_submit_rejects_beyond_max_depth():
+    started, release, done = threading.Event(), threading.Event(), []
+    queue = JobQueue(num_workers=1, max_depth=1, retry_after_seconds=7)
+    try:
+        queue.submit("running", blocking_job, started, release, done)
+        assert started.wait(5)
+        assert queue.submit("waiting", done.append, "waiting") == 1
+        assert queue.is_full()
+        with pytest.raises(QueueFullError) as error:
+            queue.submit("rejected", done.append, "rejected")
+        assert error.value.retry_after == 7
+        assert queue.stats()["rejected"] == 1
+    finally:
+        release.set()
+        queue.shutdown()
+
+def test_waiting_jobs_are_told_their_position():
+    started, release, done = threading.Event(), threading.Event(), []
+    positions = []
+    queue = JobQueue(num_workers=1, max_depth=5)
+    try:
+        queue.submit("running", blocking_job, started, release, done)
+        assert started.wait(5)
+        queue.submit("second", done.append, "second", on_position=lambda p: positions.append(("second", p)))
+        queue.submit("third", done.append, "third", on_position=lambda p: positions.append(("third", p)))
+        assert positions == [("second", 1), ("third", 2)]
+        release.set()
+        # "third" moves up once "running" finishes and "second" starts
+        for _ in range(50):
+            if ("third", 1) in positions:
+                break
+            threading.Event().wait(0.1)
+        assert ("third", 1) in positions
+    finally:
+        release.set()
+        queue.shutdown()
+
+def test_shutdown_cancels_waiting_jobs_and_waits_for_running_ones():
+    started, release, done = threading.Event(), threading.Event(), []
+    cancelled = []
+    queue = JobQueue(num_workers=1, max_depth=5, shutdown_timeout_seconds=5)
+    queue.submit("running", blocking_job, started, release, done)
+    assert started.wait(5)
+    for job_id in ("a", "b"):
+        queue.submit(job_id, done.append, job_id, on_cancel=lambda job_id=job_id: cancelled.append(job_id))
+
+    threading.Timer(0.2, release.set).start()
+    queue.shutdown()
+
+    assert cancelled == ["a", "b"]
+    # The running job finished before shutdown returned; the cancelled ones never ran
+    assert done == [True]
+    stats = queue.stats()
+    assert stats["cancelled"] == 2
+    assert stats["completed"] == 1
+    with pytest.raises(RuntimeError):
+        queue.submit("late", done.append, "late")
+
+def test_shutdown_gives_up_on_jobs_past_the_timeout():
+    started, release, done = threading.Event(), threading.Event(), []
+    queue = JobQueue(num_workers=1, max_depth=5, shutdown_timeout_seconds=0.1)
+    try:
+        queue.submit("stuck", blocking_job, started, release, done)
+        assert started.wait(5)
+        queue.shutdown()
+        assert done == []
+    finally:
+        release.set()
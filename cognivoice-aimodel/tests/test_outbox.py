@@ -0,0 +1,65 @@
+import os
+import time
+from services.outbox import ResultOutbox
+from services.webhook_dispatcher import WebhookDispatcher
+
+FINAL = {"request_id": "r1", "user_id": 1, "step": 99, "message": "Complete", "secret_key": "s3cret",
+         "result": {"prediction": "Control"}}
+
+def make_dispatcher(url, outbox, **kwargs):
+    return WebhookDispatcher(url, num_workers=1, timeout_seconds=2, max_retries=0, backoff_base_seconds=0.01,
+                             outbox=outbox, secret_key="s3cret", redelivery_interval_seconds=0.1, **kwargs)
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_final_left_by_a_previous_run_is_redelivered(tmp_path, flask_backend):
+    db_path = os.path.join(tmp_path, "cache", "outbox.sqlite3")
+    # The process that finished the analysis died before delivering it: the entry is still leased
+    crashed = ResultOutbox(db_path, lease_seconds=3600)
+    crashed.record("r1", FINAL)
+    crashed.close()
+
+    outbox = ResultOutbox(db_path)
+    dispatcher = make_dispatcher(flask_backend.url, outbox)
+    try:
+        assert flask_backend.delivered.wait(5)
+        assert wait_for(lambda: outbox.stats()["pending"] == 0)
+    finally:
+        dispatcher.shutdown(timeout=1)
+        outbox.close()
+    # The secret is never stored, but is added back for delivery
+    assert flask_backend.received == [FINAL]
+
+def test_rejected_final_stays_in_the_outbox(tmp_path, flask_backend):
+    flask_backend.status = 403
+    outbox = ResultOutbox(os.path.join(tmp_path, "cache", "outbox.sqlite3"))
+    dispatcher = make_dispatcher(flask_backend.url, outbox)
+    try:
+        dispatcher.enqueue("r1", dict(FINAL), is_final=True)
+        assert wait_for(lambda: len(flask_backend.received) >= 1)
+        assert wait_for(lambda: dispatcher.stats()["pending_requests"] == 0)
+        assert outbox.stats()["pending"] == 1
+
+        # Once the backend accepts it again, the next redelivery pass clears it
+        flask_backend.status = 409
+        assert flask_backend.delivered.wait(5)
+        assert wait_for(lambda: outbox.stats()["pending"] == 0)
+    finally:
+        dispatcher.shutdown(timeout=1)
+        outbox.close()
+
+def test_enqueue_after_shutdown_keeps_the_final(tmp_path, flask_backend):
+    outbox = ResultOutbox(os.path.join(tmp_path, "cache", "outbox.sqlite3"))
+    dispatcher = make_dispatcher(flask_backend.url, outbox)
+    dispatcher.shutdown(timeout=1)
+
+    dispatcher.enqueue("r1", dict(FINAL), is_final=True)
+    assert outbox.stats()["pending"] == 1
+    assert flask_backend.received == []
+    outbox.close()
@@ -0,0 +1,90 @@
+import io
+import os
+import hashlib
+import threading
+import pytest
+from fastapi.testclient import TestClient
+import main
+from services.job_queue import JobQueue
+from services.result_cache import ResultCache
+
+AUDIO = b"RIFF fake upload bytes"
+CONTENT_HASH = hashlib.sha256(AUDIO).hexdigest()
+RESULT = {"prediction": "Control", "confidence": 0.8}
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """The /predict endpoint with its queue and cache swapped in; nothing is loaded and no webhook is sent."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("uploads_ai")
+    notified, cached_sends = [], []
+    monkeypatch.setattr(main, "notify_waiters", lambda waiters, *args: notified.append((waiters, args)))
+    monkeypatch.setattr(main, "send_cached_result", lambda *args: cached_sends.append(args))
+    monkeypatch.setattr(main, "send_progress_update", lambda *args, **kwargs: None)
+    release = threading.Event()
+    models = {
+        "job_queue": JobQueue(num_workers=1, max_depth=1, retry_after_seconds=30),
+        "result_cache": ResultCache(os.path.join(tmp_path, "cache", "results.sqlite3"), "test"),
+    }
+    monkeypatch.setattr(main, "ml_models", models)
+    monkeypatch.setattr(main, "run_analysis_pipeline_ai", lambda *args: release.wait(5))
+    # Not entered as a context manager, so the lifespan (model loading) never runs
+    yield TestClient(main.app), models, notified, cached_sends
+    release.set()
+    models["job_queue"].shutdown()
+    models["result_cache"].close()
+
+def post(client, request_id, audio=AUDIO):
+    return client.post("/predict", data={"request_id": request_id, "user_id": "1"},
+                       files={"audio": ("clip.wav", io.BytesIO(audio), "audio/wav")})
+
+def test_full_queue_returns_503_before_the_upload_is_written(service):
+    client, models, _, _ = service
+    models["job_queue"].max_depth = 0
+
+    response = post(client, "r1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert os.listdir("uploads_ai") == []
+
+def test_queue_filling_after_admission_returns_503_and_tells_waiters(service, monkeypatch):
+    client, models, notified, _ = service
+    job_queue = models["job_queue"]
+    job_queue.max_depth = 0
+    # Full by the time the upload has been written
+    monkeypatch.setattr(job_queue, "is_full", lambda: False)
+
+    response = post(client, "r1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert os.listdir("uploads_ai") == []
+    # The hash was released, so the next identical upload leads again
+    assert notified == [([], (99, "Error", {"error": "AI service is at capacity"}))]
+    assert models["result_cache"].stats()["in_flight"] == 0
+
+def test_identical_upload_joins_the_running_job(service):
+    client, models, _, _ = service
+
+    first = post(client, "r1")
+    assert first.status_code == 200
+    assert "queue_position" in first.json()
+
+    second = post(client, "r2")
+    assert second.json()["cached"] is False
+    assert "joined" in second.json()["message"]
+    assert os.listdir("uploads_ai") == ["r1_clip.wav"]
+
+    waiters = models["result_cache"].release(CONTENT_HASH)
+    assert [(request_id, user_id) for request_id, user_id, _ in waiters] == [("r2", 1)]
+
+def test_cached_result_is_served_without_queueing(service):
+    client, models, _, cached_sends = service
+    cache = models["result_cache"]
+    cache.get_or_join(CONTENT_HASH, None)
+    cache.put(CONTENT_HASH, RESULT)
+
+    response = post(client, "r1")
+    assert response.json()["cached"] is True
+    assert [args[:3] for args in cached_sends] == [("r1", 1, RESULT)]
+    assert models["job_queue"].stats()["accepted"] == 0
+    assert os.listdir("uploads_ai") == []
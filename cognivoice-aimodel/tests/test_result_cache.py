@@ -0,0 +1,61 @@
+import os
+from services.result_cache import ResultCache
+
+RESULT = {"prediction": "Control", "confidence": 0.8, "visualizationUrl": "/static_predictions/abc_analysis.png"}
+
+def make_cache(tmp_path, version="v1", **kwargs):
+    return ResultCache(os.path.join(tmp_path, "cache", "results.sqlite3"), version, **kwargs)
+
+def test_first_request_leads_and_identical_ones_join(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get_or_join("abc", ("r1", 1, "a.wav")) == (None, False)
+    assert cache.get_or_join("abc", ("r2", 2, "b.wav")) == (None, True)
+    assert cache.get_or_join("abc", ("r3", 3, "c.wav")) == (None, True)
+
+    assert cache.put("abc", RESULT) == [("r2", 2, "b.wav"), ("r3", 3, "c.wav")]
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["deduplicated"] == 2
+    assert stats["in_flight"] == 0
+
+def test_stored_result_is_a_hit(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.get_or_join("abc", ("r1", 1, "a.wav"))
+    cache.put("abc", RESULT)
+    assert cache.get_or_join("abc", ("r2", 2, "b.wav")) == (RESULT, False)
+    assert cache.stats()["hits"] == 1
+    cache.close()
+
+    # Persistent across restarts, but scoped to the model/config version
+    assert make_cache(tmp_path).get_or_join("abc", ("r3", 3, "c.wav")) == (RESULT, False)
+    assert make_cache(tmp_path, version="v2").get_or_join("abc", ("r4", 4, "d.wav")) == (None, False)
+
+def test_release_hands_back_waiters_without_caching(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.get_or_join("abc", ("r1", 1, "a.wav"))
+    cache.get_or_join("abc", ("r2", 2, "b.wav"))
+
+    assert cache.release("abc") == [("r2", 2, "b.wav")]
+    assert cache.stats()["in_flight"] == 0
+    # Nothing was stored: the next request leads a fresh computation
+    assert cache.get_or_join("abc", ("r3", 3, "c.wav")) == (None, False)
+
+def test_rejected_result_is_evicted(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.get_or_join("abc", ("r1", 1, "a.wav"))
+    cache.put("abc", RESULT)
+
+    assert cache.get_or_join("abc", ("r2", 2, "b.wav"), is_valid=lambda result: False) == (None, False)
+    stats = cache.stats()
+    assert stats["entries"] == 0
+    assert stats["evicted"] == 1
+
+def test_least_recently_used_entries_are_dropped(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    for content_hash in ("a", "b", "c"):
+        cache.get_or_join(content_hash, None)
+        cache.put(content_hash, {"hash": content_hash})
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get_or_join("a", None) == (None, False)
+    assert cache.get_or_join("c", None) == ({"hash": "c"}, False)
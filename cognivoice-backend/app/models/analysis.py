@@ -5,6 +5,8 @@ class Analysis(db.Model):
     __tablename__ = "analysis"
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # The AI service may deliver a final result more than once; one analysis per request
+    request_id = db.Column(db.String(64), unique=True)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     risk_level = db.Column(db.String(20), nullable=False)
     final_prediction = db.Column(db.String(50))
@@ -32,6 +32,10 @@ class AnalysisRepository:
     def list_recent(limit: int = 5):
         return Analysis.query.order_by(db.desc(Analysis.timestamp)).limit(limit).all()
 
+    @staticmethod
+    def exists_for_request(request_id: str) -> bool:
+        return db.session.query(Analysis.query.filter_by(request_id=request_id).exists()).scalar()
+
     @staticmethod
     def create(entity: Analysis) -> Analysis:
         db.session.add(entity)
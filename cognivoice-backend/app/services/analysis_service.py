@@ -1,5 +1,7 @@
 import requests
 from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from ..extensions import db
 from ..services.sse_service import sse_service
 from ..repositories.analysis_repository import AnalysisRepository
 from ..models import Analysis
@@ -25,9 +27,13 @@ class AnalysisService:
         sse_service.publish(request_id, update)
 
         if update.get('is_final') and update.get('result') and not update['result'].get('error'):
+            # Final results are redelivered until acknowledged, so the same one can arrive twice
+            if AnalysisRepository.exists_for_request(request_id):
+                return ('Update already received', 200)
             try:
                 r = update['result']
                 entity = Analysis(
+                    request_id=request_id,
                     user_id=user_id,
                     risk_level=r.get('riskLevel'),
                     final_prediction=r.get('finalPrediction'),
@@ -39,6 +45,10 @@ class AnalysisService:
                     semantic_fluency=r.get('speechfeatures', {}).get('semanticFluency'),
                 )
                 AnalysisRepository.create(entity)
+            except IntegrityError:
+                # A concurrent delivery of the same result saved it first
+                db.session.rollback()
+                return ('Update already received', 200)
             except Exception:
                 # repo handles rollback if needed; keep log in controller
                 raise
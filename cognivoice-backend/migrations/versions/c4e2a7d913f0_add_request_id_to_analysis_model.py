@@ -0,0 +1,28 @@
+"""Add request_id to Analysis model
+
+Revision ID: c4e2a7d913f0
+Revises: b1b9e9bd832b
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e2a7d913f0'
+down_revision = 'b1b9e9bd832b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('analysis', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('request_id', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_analysis_request_id', ['request_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('analysis', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_analysis_request_id', type_='unique')
+        batch_op.drop_column('request_id')